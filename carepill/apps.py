@@ -1,6 +1,28 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# 이 실행 파일로 뜬 프로세스만 요청을 받는 서버로 본다 (manage.py는 runserver만)
+_SERVER_EXECUTABLES = ("gunicorn", "uwsgi", "daphne", "uvicorn")
+
+
+def _is_server_process():
+    exe = os.path.basename(sys.argv[0]) if sys.argv else ""
+    if exe == "manage.py":
+        # runserver 자동 재시작 감시 프로세스(RUN_MAIN 없음)는 제외
+        return sys.argv[1:2] == ["runserver"] and (os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv)
+    return any(name in exe for name in _SERVER_EXECUTABLES)
+
 
 class CarepillConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "carepill"
+
+    def ready(self):
+        # 의약품 이름 인덱스(자모/초성 앞부분 일치, 퍼지 매칭)와 자동완성 인덱스를 서버 시작 시 메모리에 올린다
+        from .services import autocomplete
+        from .services.medicine_index import CATALOG_INDEX_PRELOAD, preload
+        if CATALOG_INDEX_PRELOAD and _is_server_process():
+            preload()
+            autocomplete.preload()
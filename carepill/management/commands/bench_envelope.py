@@ -0,0 +1,151 @@
+# carepill/management/commands/bench_envelope.py
+
+import os
+import glob
+import json
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand, CommandError
+
+from carepill import views
+from carepill.services import vision_cache
+from carepill.views import SCAN_MODES, _digits_only, _run_envelope_pipeline
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+# 정답 비교 필드 (truth.json 키)
+FIELDS = ["patient_name", "age", "dispense_date", "pharmacy_name", "prescription_number",
+          "medicine_name", "dosage_instructions", "frequency"]
+# 모델별 1M 토큰당 USD (입력, 출력). 목록에 없는 모델은 gpt-4o 가격으로 계산
+PRICES = {
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+
+
+def _norm(field, value):
+    v = "".join(str(value or "").split())
+    if field in ("age", "prescription_number", "dispense_date"):
+        return _digits_only(v)
+    return v
+
+
+class Command(BaseCommand):
+    help = '약봉투 스캔 모드 비교 벤치마크 (per_shot vs batch vs fused: 지연시간/토큰/병합 정확도)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('envelopes', nargs='+',
+                            help='봉투 1개 = 샷 이미지 디렉터리 1개 (정답이 있으면 같은 디렉터리에 truth.json)')
+        parser.add_argument('--modes', default=','.join(SCAN_MODES), help='비교할 모드 (쉼표 구분)')
+        parser.add_argument('--repeat', type=int, default=1, help='봉투당 반복 횟수')
+        parser.add_argument('--use-cache', action='store_true', help='Vision 캐시 사용 (기본: 끔)')
+        parser.add_argument('--no-cascade', action='store_true', help='모델 캐스케이드 끄기 (전부 상위 모델)')
+        parser.add_argument('--json', dest='json_out', help='봉투별 결과를 JSON으로 저장할 경로')
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        for m in modes:
+            if m not in SCAN_MODES:
+                raise CommandError(f'알 수 없는 모드: {m}')
+        if not options['use_cache']:
+            # 캐시 적중이 지연시간/토큰을 왜곡하지 않도록
+            vision_cache.VISION_CACHE_ENABLED = False
+        if options['no_cascade']:
+            views.SCAN_CASCADE = False
+
+        envelopes = [self.load_envelope(d) for d in options['envelopes']]
+        rows = []
+        for env in envelopes:
+            for mode in modes:
+                for r in range(options['repeat']):
+                    t0 = time.monotonic()
+                    out = _run_envelope_pipeline(env['images'], [], mode=mode, save=False)
+                    latency_ms = int((time.monotonic() - t0) * 1000)
+                    first_requests = (sum(1 for s in out['shots'] if s.get('status') not in ('duplicate', 'skipped', 'rejected'))
+                                      if mode == 'per_shot' else 1)
+                    # 캐스케이드 재분석은 샷마다 상위 모델 요청 1번씩 추가
+                    escalated = len(out['cascade'].get('escalated_shots', []))
+                    row = {
+                        'envelope': env['name'], 'mode': mode, 'run': r + 1,
+                        'latency_ms': latency_ms,
+                        'first_requests': first_requests,
+                        'requests': first_requests + escalated,
+                        'prompt_tokens': out['usage'].get('prompt_tokens', 0),
+                        'completion_tokens': out['usage'].get('completion_tokens', 0),
+                        'usd': self.cost(out['usage_by_model']),
+                        'escalated': escalated,
+                        'merged': out['merged'],
+                    }
+                    row.update(self.score(out['merged'], env['truth']))
+                    rows.append(row)
+                    self.stdout.write(
+                        f"  {env['name']} [{mode} #{r + 1}] {latency_ms}ms, "
+                        f"요청 {row['requests']}번 (재분석 {row['escalated']}샷 포함), "
+                        f"토큰 {row['prompt_tokens']}+{row['completion_tokens']}, "
+                        f"정확도 {self.fmt_acc(row)}"
+                    )
+
+        self.stdout.write('')
+        self.stdout.write(f"{'mode':<10}{'runs':>6}{'p50 ms':>10}{'max ms':>10}{'req':>6}{'esc':>6}"
+                          f"{'in tok':>10}{'out tok':>10}{'USD':>10}{'accuracy':>10}")
+        for mode in modes:
+            rs = [r for r in rows if r['mode'] == mode]
+            if not rs:
+                continue
+            tok_in = sum(r['prompt_tokens'] for r in rs) / len(rs)
+            tok_out = sum(r['completion_tokens'] for r in rs) / len(rs)
+            usd = sum(r['usd'] for r in rs) / len(rs)
+            matched = sum(r['matched'] for r in rs)
+            compared = sum(r['compared'] for r in rs)
+            acc = f"{matched / compared:.1%}" if compared else '-'
+            self.stdout.write(
+                f"{mode:<10}{len(rs):>6}{median(r['latency_ms'] for r in rs):>10.0f}"
+                f"{max(r['latency_ms'] for r in rs):>10}"
+                f"{sum(r['requests'] for r in rs) / len(rs):>6.1f}"
+                f"{sum(r['escalated'] for r in rs) / len(rs):>6.1f}"
+                f"{tok_in:>10.0f}{tok_out:>10.0f}{usd:>10.4f}{acc:>10}"
+            )
+        self.stdout.write('(토큰/USD/req/esc는 봉투 1개당 평균, req는 캐스케이드 재분석(esc) 요청 포함)')
+
+        if options['json_out']:
+            with open(options['json_out'], 'w', encoding='utf-8') as f:
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ 결과 저장: {options['json_out']}"))
+
+    def cost(self, usage_by_model):
+        usd = 0.0
+        for model, u in usage_by_model.items():
+            p_in, p_out = PRICES.get(model, PRICES['gpt-4o'])
+            usd += (u.get('prompt_tokens', 0) * p_in + u.get('completion_tokens', 0) * p_out) / 1e6
+        return usd
+
+    def load_envelope(self, path):
+        if not os.path.isdir(path):
+            raise CommandError(f'디렉터리가 아닙니다: {path}')
+        files = sorted(f for f in glob.glob(os.path.join(path, '*')) if f.lower().endswith(IMAGE_EXTS))
+        if not files:
+            raise CommandError(f'이미지가 없습니다: {path}')
+        images = []
+        for f in files[:9]:  # API와 같은 최대 9장
+            with open(f, 'rb') as fp:
+                images.append(fp.read())
+        truth = None
+        truth_path = os.path.join(path, 'truth.json')
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding='utf-8') as fp:
+                truth = json.load(fp)
+        return {'name': os.path.basename(os.path.normpath(path)), 'images': images, 'truth': truth}
+
+    def score(self, merged, truth):
+        """정답에 있는 필드 중 병합 결과가 일치한 개수 (공백 무시, 숫자 필드는 숫자만 비교)"""
+        if not truth:
+            return {'matched': 0, 'compared': 0, 'mismatches': []}
+        keys = [k for k in FIELDS if k in truth]
+        mismatches = [k for k in keys if _norm(k, merged.get(k)) != _norm(k, truth[k])]
+        return {'matched': len(keys) - len(mismatches), 'compared': len(keys), 'mismatches': mismatches}
+
+    def fmt_acc(self, row):
+        if not row['compared']:
+            return '-'
+        miss = f" (불일치: {', '.join(row['mismatches'])})" if row['mismatches'] else ''
+        return f"{row['matched']}/{row['compared']}{miss}"
@@ -0,0 +1,154 @@
+# carepill/management/commands/bench_medicine_search.py
+
+import json
+import time
+import random
+from statistics import median
+
+from django.core.management.base import BaseCommand, CommandError
+
+from carepill.services.medicine_index import (
+    CATALOG_MATCH_MIN_SCORE, MedicineIndex, _load_rows, base_name, normalize,
+)
+
+# 음성 인식에서 자주 헷갈리는 자모 (초성/중성 인덱스 묶음)
+_SIMILAR_CHO = [(0, 1, 15), (3, 4, 16), (7, 8, 17), (9, 10), (12, 13, 14), (2, 5), (11, 18)]
+_SIMILAR_JUNG = [(0, 4), (1, 5, 3, 7), (8, 13), (12, 17), (2, 6), (18, 20), (11, 15, 10)]
+_SYL_BASE, _SYL_LAST = 0xAC00, 0xD7A3
+_FORM_SUFFIXES = ('정', '캡슐', '시럽', '액', '연질캡슐')
+_SYNTH_SYLLABLES = '가나다라마바사아자차카타파하레놀린신텐민졸록산펜틴보겐콜트아세펜'
+
+
+def _similar(value, groups, size):
+    for g in groups:
+        if value in g:
+            others = [v for v in g if v != value]
+            if others:
+                return random.choice(others)
+    return random.randrange(size)
+
+
+def _garble(syl, op):
+    """한글 음절 1개를 자모 단위로 바꾼다 (op: initial|vowel|final)"""
+    code = ord(syl) - _SYL_BASE
+    cho, rest = divmod(code, 21 * 28)
+    jung, jong = divmod(rest, 28)
+    if op == 'initial':
+        cho = _similar(cho, _SIMILAR_CHO, 19)
+    elif op == 'vowel':
+        jung = _similar(jung, _SIMILAR_JUNG, 21)
+    else:
+        jong = 0 if jong else random.choice((4, 8, 16, 21))  # 받침 빠짐/생김 (ㄴ ㄹ ㅁ ㅇ)
+    return chr(_SYL_BASE + (cho * 21 + jung) * 28 + jong)
+
+
+def _noisy(name, ops):
+    """약품명 → (잡음 섞인 질의, 적용한 연산 목록)"""
+    q = base_name(normalize(name))
+    applied = []
+    for _ in range(ops):
+        op = random.choice(('initial', 'vowel', 'final', 'drop_suffix'))
+        if op == 'drop_suffix':
+            suffix = next((s for s in _FORM_SUFFIXES if q.endswith(s) and len(q) > len(s) + 1), None)
+            if suffix:
+                q = q[:-len(suffix)]
+                applied.append(op)
+                continue
+            op = 'vowel'
+        positions = [i for i, c in enumerate(q) if _SYL_BASE <= ord(c) <= _SYL_LAST]
+        if not positions:
+            break
+        i = random.choice(positions)
+        q = q[:i] + _garble(q[i], op) + q[i + 1:]
+        applied.append(op)
+    return q, applied
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Command(BaseCommand):
+    help = '약품명 오탈자 매칭 벤치마크 (잡음 섞인 합성 질의 - 지연시간/재현율)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=1000, help='합성 질의 수')
+        parser.add_argument('--noise', type=int, default=1, help='질의당 잡음 연산 수 (자모 치환/받침/제형 생략)')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='DB 대신 N개짜리 합성 카탈로그 사용 (medicines 테이블이 없을 때)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_out', help='결과를 JSON으로 저장할 경로')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        if options['synthetic']:
+            rows = [(i, ''.join(random.choice(_SYNTH_SYLLABLES) for _ in range(random.randint(2, 6)))
+                     + random.choice(_FORM_SUFFIXES) + f"{random.choice((5, 10, 25, 100, 500))}밀리그램", None)
+                    for i in range(options['synthetic'])]
+        else:
+            try:
+                rows = _load_rows()
+            except Exception as e:
+                raise CommandError(f'medicines 테이블을 읽을 수 없습니다 (--synthetic N 사용): {e}')
+        if not rows:
+            raise CommandError('카탈로그가 비어 있습니다.')
+
+        t0 = time.perf_counter()
+        index = MedicineIndex(rows)
+        build_s = time.perf_counter() - t0
+        info = index.info()
+        self.stdout.write(f"인덱스: 약품 {info['items']}개, 오탈자 키 {info['typo_keys']}개, "
+                          f"삭제 해시 {info['typo_hashes']}개, 생성 {build_s:.2f}s")
+
+        korean = [r for r in rows if r[1] and any('가' <= c <= '힣' for c in r[1])]
+        target_base = {}
+        for item_seq, name, _ in rows:
+            target_base.setdefault(base_name(normalize(name)), set()).add(item_seq)
+
+        stats = {'typo': [], 'match': []}
+        hits = {'typo': [0, 0], 'match': [0, 0]}  # [top1, top3]
+        samples = []
+        n = 0
+        for item_seq, name, _ in random.sample(korean, min(options['queries'], len(korean))):
+            query, ops = _noisy(name, options['noise'])
+            if not query or len(query) < 2:
+                continue
+            n += 1
+            # 같은 기본 이름의 약품(함량만 다른 제품)은 모두 정답
+            answers = target_base.get(base_name(normalize(name)), {item_seq})
+            for kind, fn in (('typo', lambda: index.typo(query, 3)),
+                             ('match', lambda: index.match(query, 3, CATALOG_MATCH_MIN_SCORE))):
+                t = time.perf_counter()
+                found = fn()
+                stats[kind].append((time.perf_counter() - t) * 1000)
+                ids = [s for s, _ in found]
+                hits[kind][0] += bool(ids[:1] and ids[0] in answers)
+                hits[kind][1] += any(s in answers for s in ids)
+            if len(samples) < 10:
+                samples.append({'name': name, 'query': query, 'ops': ops,
+                                'match': [index.names[s] for s, _ in index.match(query, 3, CATALOG_MATCH_MIN_SCORE)]})
+        if not n:
+            raise CommandError('만든 질의가 없습니다.')
+
+        self.stdout.write('')
+        for s in samples:
+            self.stdout.write(f"  {s['query']:<16} ← {s['name']} ({', '.join(s['ops'])}) → {s['match'][:1]}")
+        self.stdout.write('')
+        self.stdout.write(f"{'method':<8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'top1':>9}{'top3':>9}")
+        result = {'catalog': len(index), 'queries': n, 'noise': options['noise'], 'build_s': round(build_s, 2)}
+        for kind in ('typo', 'match'):
+            v = stats[kind]
+            row = {'p50_ms': round(median(v), 3), 'p95_ms': round(_pct(v, 0.95), 3), 'max_ms': round(max(v), 3),
+                   'top1': round(hits[kind][0] / n, 3), 'top3': round(hits[kind][1] / n, 3)}
+            result[kind] = row
+            self.stdout.write(f"{kind:<8}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['max_ms']:>10.3f}"
+                              f"{row['top1']:>9.1%}{row['top3']:>9.1%}")
+        self.stdout.write(f"(질의 {n}개, 잡음 {options['noise']}회/질의 - typo: 자모 편집 거리만, "
+                          f"match: 2-gram + 자모 편집 거리 (스캔/OCR/검색에서 쓰는 것))")
+
+        if options['json_out']:
+            result['samples'] = samples
+            with open(options['json_out'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ 결과 저장: {options['json_out']}"))
@@ -0,0 +1,112 @@
+# carepill/management/commands/bench_preprocess.py
+
+import os
+import glob
+import json
+import time
+from statistics import median
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from carepill.vision.preprocess import find_envelope, rectify_envelope, preprocess_envelope
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Command(BaseCommand):
+    help = '약봉투 검출/원근 보정 CPU 지연시간 벤치마크 (디코딩, 검출, 보정, 전처리 전체)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='이미지 파일 또는 디렉터리')
+        parser.add_argument('--repeat', type=int, default=20, help='이미지당 반복 횟수')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='OpenCV 스레드 수 (기본 1: 요청 하나가 코어 하나를 쓰는 서버 기준)')
+        parser.add_argument('--save-dir', help='보정 결과 이미지를 저장할 디렉터리 (눈으로 확인용)')
+        parser.add_argument('--json', dest='json_out', help='이미지별 결과를 JSON으로 저장할 경로')
+
+    def handle(self, *args, **options):
+        files = []
+        for p in options['paths']:
+            if os.path.isdir(p):
+                files += sorted(f for f in glob.glob(os.path.join(p, '*')) if f.lower().endswith(IMAGE_EXTS))
+            elif os.path.isfile(p):
+                files.append(p)
+            else:
+                raise CommandError(f'경로가 없습니다: {p}')
+        if not files:
+            raise CommandError('이미지가 없습니다.')
+        cv2.setNumThreads(options['threads'])
+        repeat = max(1, options['repeat'])
+
+        rows = []
+        for path in files:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+            img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                self.stdout.write(self.style.WARNING(f'  {path}: 디코딩 실패, 건너뜀'))
+                continue
+            timings = {'decode': [], 'detect': [], 'rectify': [], 'total': []}
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                t1 = time.perf_counter()
+                find_envelope(img)
+                t2 = time.perf_counter()
+                flat, info = rectify_envelope(img)
+                t3 = time.perf_counter()
+                out, prep = preprocess_envelope(data)
+                t4 = time.perf_counter()
+                timings['decode'].append((t1 - t0) * 1000)
+                timings['detect'].append((t2 - t1) * 1000)
+                timings['rectify'].append((t3 - t2) * 1000)
+                timings['total'].append((t4 - t3) * 1000)
+
+            row = {
+                'image': os.path.basename(path),
+                'detect': info['detect'],
+                'size_in': [img.shape[1], img.shape[0]],
+                'size_out': prep['size_out'],
+                'pixels_ratio': round(flat.shape[0] * flat.shape[1] / float(img.shape[0] * img.shape[1]), 3),
+                'bytes_in': prep['bytes_in'],
+                'bytes_out': prep['bytes_out'],
+            }
+            row.update({f'{k}_p50_ms': round(median(v), 2) for k, v in timings.items()})
+            row['total_p95_ms'] = round(_pct(timings['total'], 0.95), 2)
+            rows.append(row)
+            self.stdout.write(
+                f"  {row['image']}: {row['detect'] or '검출 실패'}, "
+                f"{row['size_in'][0]}x{row['size_in'][1]} → {row['size_out'][0]}x{row['size_out'][1]}, "
+                f"검출 {row['detect_p50_ms']}ms, 보정 {row['rectify_p50_ms']}ms, 전체 {row['total_p50_ms']}ms"
+            )
+            if options['save_dir']:
+                os.makedirs(options['save_dir'], exist_ok=True)
+                cv2.imwrite(os.path.join(options['save_dir'], row['image']), flat)
+
+        if not rows:
+            raise CommandError('측정한 이미지가 없습니다.')
+        self.stdout.write('')
+        self.stdout.write(f"{'stage':<10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for stage in ('decode', 'detect', 'rectify', 'total'):
+            vals = [r[f'{stage}_p50_ms'] for r in rows]
+            self.stdout.write(f"{stage:<10}{median(vals):>10.2f}{_pct(vals, 0.95):>10.2f}{max(vals):>10.2f}")
+        detected = sum(1 for r in rows if r['detect'])
+        quads = sum(1 for r in rows if r['detect'] == 'quad')
+        bytes_in = sum(r['bytes_in'] for r in rows)
+        bytes_out = sum(r['bytes_out'] for r in rows)
+        self.stdout.write(f"(이미지 {len(rows)}장, 반복 {repeat}회, 스레드 {options['threads']}개 / "
+                          f"검출 {detected}장 중 원근 보정 {quads}장 / "
+                          f"업로드 바이트 {bytes_in} → {bytes_out}, {1 - bytes_out / max(1, bytes_in):.1%} 감소)")
+        self.stdout.write('(rectify는 검출 포함, total은 preprocess_envelope 전체: 디코딩+보정+축소+인코딩)')
+
+        if options['json_out']:
+            with open(options['json_out'], 'w', encoding='utf-8') as f:
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ 결과 저장: {options['json_out']}"))
@@ -0,0 +1,37 @@
+# carepill/management/commands/cascade_stats.py
+
+from django.core.management.base import BaseCommand
+
+from carepill.models import EnvelopeCascadeStat
+from carepill.views import SCAN_CASCADE_THRESHOLD
+
+
+class Command(BaseCommand):
+    help = '약봉투 모델 캐스케이드 필드별 통계 (SCAN_CASCADE_THRESHOLD 튜닝용)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='통계 초기화')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            EnvelopeCascadeStat.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS('✅ 캐스케이드 통계 초기화'))
+            return
+
+        stats = list(EnvelopeCascadeStat.objects.order_by('field'))
+        if not stats:
+            self.stdout.write('통계 없음 (SCAN_CASCADE=1 로 스캔한 기록이 없습니다)')
+            return
+
+        self.stdout.write(f'현재 임계값: {SCAN_CASCADE_THRESHOLD}\n')
+        self.stdout.write(f"{'field':<22}{'scans':>7}{'avg conf':>10}{'low':>7}{'low %':>8}"
+                          f"{'esc shots':>11}{'changed':>9}{'chg %':>8}")
+        for s in stats:
+            avg = s.confidence_sum / s.scans if s.scans else 0.0
+            low_pct = s.low_confidence / s.scans if s.scans else 0.0
+            # 재분석했는데 값이 그대로면 그 필드의 임계값을 낮춰도 된다는 신호
+            chg_pct = s.changed / s.low_confidence if s.low_confidence else 0.0
+            self.stdout.write(
+                f"{s.field:<22}{s.scans:>7}{avg:>10.3f}{s.low_confidence:>7}{low_pct:>8.1%}"
+                f"{s.escalated_shots:>11}{s.changed:>9}{chg_pct:>8.1%}"
+            )
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-18 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carepill', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvelopeCascadeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=50, unique=True, verbose_name='필드')),
+                ('scans', models.IntegerField(default=0, verbose_name='스캔 수')),
+                ('confidence_sum', models.FloatField(default=0.0, verbose_name='1차 신뢰도 합')),
+                ('low_confidence', models.IntegerField(default=0, verbose_name='임계값 미달 횟수')),
+                ('escalated_shots', models.IntegerField(default=0, verbose_name='상위 모델 재분석 샷 수')),
+                ('changed', models.IntegerField(default=0, verbose_name='재분석으로 값이 바뀐 횟수')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': '캐스케이드 통계',
+                'verbose_name_plural': '캐스케이드 통계',
+                'db_table': 'envelope_cascade_stat',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-18 05:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carepill', '0002_envelopecascadestat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvelopeScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_name', models.CharField(blank=True, default='', max_length=100, verbose_name='환자명')),
+                ('age', models.CharField(blank=True, default='', max_length=10, verbose_name='나이')),
+                ('dispense_date', models.DateField(blank=True, null=True, verbose_name='조제일자')),
+                ('pharmacy_name', models.CharField(blank=True, default='', max_length=200, verbose_name='약국명')),
+                ('prescription_number', models.CharField(blank=True, default='', max_length=100, verbose_name='처방번호')),
+                ('medicine_name', models.CharField(blank=True, default='', max_length=500, verbose_name='약품명')),
+                ('dosage_instructions', models.CharField(blank=True, default='', max_length=500, verbose_name='복용법')),
+                ('frequency', models.CharField(blank=True, default='', max_length=200, verbose_name='복용횟수')),
+                ('confidence_score', models.FloatField(default=0.0, verbose_name='약품명 신뢰도')),
+                ('raw_response', models.TextField(blank=True, default='', verbose_name='샷별 원본/진단 JSON')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='사용자')),
+            ],
+            options={
+                'verbose_name': '약봉투 스캔',
+                'verbose_name_plural': '약봉투 스캔',
+                'db_table': 'envelope_scan',
+                'managed': True,
+                'indexes': [models.Index(fields=['user', 'prescription_number', 'dispense_date'], name='envelope_scan_rx_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.14 on 2026-10-18 05:50
+
+import json
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_raw_response(apps, schema_editor):
+    """기존 raw_response 텍스트 → envelope_scan_raw (zlib 압축)"""
+    EnvelopeScan = apps.get_model('carepill', 'EnvelopeScan')
+    EnvelopeScanRaw = apps.get_model('carepill', 'EnvelopeScanRaw')
+    rows = []
+    for scan_id, text in EnvelopeScan.objects.exclude(raw_response='').values_list('id', 'raw_response').iterator():
+        try:
+            body = json.dumps(json.loads(text), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        except ValueError:
+            continue
+        rows.append(EnvelopeScanRaw(scan_id=scan_id, codec='zlib', size=len(body), data=zlib.compress(body, 6)))
+        if len(rows) >= 500:
+            EnvelopeScanRaw.objects.bulk_create(rows)
+            rows = []
+    EnvelopeScanRaw.objects.bulk_create(rows)
+
+
+def restore_raw_response(apps, schema_editor):
+    EnvelopeScan = apps.get_model('carepill', 'EnvelopeScan')
+    EnvelopeScanRaw = apps.get_model('carepill', 'EnvelopeScanRaw')
+    for raw in EnvelopeScanRaw.objects.iterator():
+        text = zlib.decompress(bytes(raw.data)).decode('utf-8')
+        EnvelopeScan.objects.filter(id=raw.scan_id).update(raw_response=text)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carepill', '0003_envelopescan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvelopeScanRaw',
+            fields=[
+                ('scan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='raw', serialize=False, to='carepill.envelopescan', verbose_name='스캔')),
+                ('codec', models.CharField(default='zlib', max_length=10, verbose_name='압축 방식')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='원본 크기(바이트)')),
+                ('data', models.BinaryField(verbose_name='압축 JSON')),
+            ],
+            options={
+                'verbose_name': '약봉투 스캔 원본',
+                'verbose_name_plural': '약봉투 스캔 원본',
+                'db_table': 'envelope_scan_raw',
+                'managed': True,
+            },
+        ),
+        migrations.RunPython(move_raw_response, restore_raw_response),
+        migrations.RemoveField(
+            model_name='envelopescan',
+            name='raw_response',
+        ),
+    ]
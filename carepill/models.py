@@ -1,4 +1,7 @@
-from django.db import models
+import json
+import zlib
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 
@@ -124,6 +127,144 @@ class VoiceUserVoice(models.Model):
         return f"{self.user.username}의 음성"
 
 
+class EnvelopeCascadeStat(models.Model):
+    """약봉투 모델 캐스케이드 필드별 누적 통계 (임계값 튜닝용)"""
+    field = models.CharField(max_length=50, unique=True, verbose_name="필드")
+    scans = models.IntegerField(default=0, verbose_name="스캔 수")
+    confidence_sum = models.FloatField(default=0.0, verbose_name="1차 신뢰도 합")
+    low_confidence = models.IntegerField(default=0, verbose_name="임계값 미달 횟수")
+    escalated_shots = models.IntegerField(default=0, verbose_name="상위 모델 재분석 샷 수")
+    changed = models.IntegerField(default=0, verbose_name="재분석으로 값이 바뀐 횟수")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = True
+        db_table = 'envelope_cascade_stat'
+        verbose_name = "캐스케이드 통계"
+        verbose_name_plural = "캐스케이드 통계"
+
+    def __str__(self):
+        return f"{self.field}: {self.low_confidence}/{self.scans}"
+
+    @classmethod
+    def record(cls, fields):
+        """fields: {field: {'confidence', 'low', 'shots', 'changed'}} (스캔 1건의 캐스케이드 결과)"""
+        from django.db.models import F
+        for name, f in fields.items():
+            cls.objects.get_or_create(field=name)
+            cls.objects.filter(field=name).update(
+                scans=F('scans') + 1,
+                confidence_sum=F('confidence_sum') + f['confidence'],
+                low_confidence=F('low_confidence') + int(f['low']),
+                escalated_shots=F('escalated_shots') + len(f['shots']),
+                changed=F('changed') + int(bool(f.get('changed'))),
+            )
+
+
+class EnvelopeScan(models.Model):
+    """약봉투 스캔 결과 (샷 병합본). 같은 사용자의 같은 처방(처방번호 + 조제일자)은 다시 분석하지 않는다
+    샷별 원본/진단 JSON은 크기가 제각각이라 행에 두지 않고 EnvelopeScanRaw(압축)에 따로 저장,
+    필요할 때만 raw_payload()로 읽는다 (목록 조회는 길이 제한 있는 컬럼만 읽음)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="사용자")
+    patient_name = models.CharField(max_length=100, blank=True, default="", verbose_name="환자명")
+    age = models.CharField(max_length=10, blank=True, default="", verbose_name="나이")
+    dispense_date = models.DateField(blank=True, null=True, verbose_name="조제일자")
+    pharmacy_name = models.CharField(max_length=200, blank=True, default="", verbose_name="약국명")
+    prescription_number = models.CharField(max_length=100, blank=True, default="", verbose_name="처방번호")
+    medicine_name = models.CharField(max_length=500, blank=True, default="", verbose_name="약품명")
+    dosage_instructions = models.CharField(max_length=500, blank=True, default="", verbose_name="복용법")
+    frequency = models.CharField(max_length=200, blank=True, default="", verbose_name="복용횟수")
+    confidence_score = models.FloatField(default=0.0, verbose_name="약품명 신뢰도")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # 병합 결과(merged)와 같은 이름의 문자열 컬럼
+    TEXT_FIELDS = ["patient_name", "age", "pharmacy_name", "prescription_number",
+                   "medicine_name", "dosage_instructions", "frequency"]
+
+    class Meta:
+        managed = True
+        db_table = 'envelope_scan'
+        indexes = [
+            models.Index(fields=['user', 'prescription_number', 'dispense_date'], name='envelope_scan_rx_idx'),
+        ]
+        verbose_name = "약봉투 스캔"
+        verbose_name_plural = "약봉투 스캔"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.prescription_number} ({self.dispense_date})"
+
+    @classmethod
+    def find_existing(cls, user, prescription_number, dispense_date):
+        """같은 사용자/처방번호/조제일자의 가장 최근 기록 (인덱스 조회) 또는 None"""
+        if not prescription_number or dispense_date is None:
+            return None
+        return (cls.objects.filter(user=user, prescription_number=prescription_number, dispense_date=dispense_date)
+                .order_by('-id').first())
+
+    @classmethod
+    def create_from_merged(cls, user, merged, dispense_date, confidence, raw):
+        """병합 결과 dict로 저장 (컬럼 길이를 넘는 값은 자른다). raw: 샷별 원본/진단 dict (압축해 별도 테이블에)"""
+        values = {k: str(merged.get(k, "") or "")[:cls._meta.get_field(k).max_length] for k in cls.TEXT_FIELDS}
+        with transaction.atomic():
+            record = cls.objects.create(user=user, dispense_date=dispense_date, confidence_score=confidence, **values)
+            if raw:
+                EnvelopeScanRaw.store(record, raw)
+        return record
+
+    def raw_payload(self):
+        """샷별 원본/진단 dict (처음 부를 때 1번만 조회/압축 해제, 없으면 {})"""
+        if not hasattr(self, "_raw_payload"):
+            row = EnvelopeScanRaw.objects.filter(scan_id=self.pk).first()
+            self._raw_payload = row.load() if row is not None else {}
+        return self._raw_payload
+
+    def to_merged(self):
+        """저장된 기록 → 스캔 응답의 merged 형식 (med_features는 원본 JSON에서)"""
+        merged = {k: getattr(self, k) for k in self.TEXT_FIELDS}
+        merged["dispense_date"] = self.dispense_date.isoformat() if self.dispense_date else ""
+        merged["med_features"] = (self.raw_payload().get("merged") or {}).get("med_features") or {}
+        return merged
+
+
+class EnvelopeScanRaw(models.Model):
+    """약봉투 스캔 1건의 샷별 원본/진단 JSON (zlib 압축, 스캔 id로 1:1)"""
+    CODEC_ZLIB = "zlib"
+    COMPRESS_LEVEL = 6
+
+    scan = models.OneToOneField(EnvelopeScan, on_delete=models.CASCADE, primary_key=True,
+                                related_name="raw", verbose_name="스캔")
+    codec = models.CharField(max_length=10, default=CODEC_ZLIB, verbose_name="압축 방식")
+    size = models.PositiveIntegerField(default=0, verbose_name="원본 크기(바이트)")
+    data = models.BinaryField(verbose_name="압축 JSON")
+
+    class Meta:
+        managed = True
+        db_table = 'envelope_scan_raw'
+        verbose_name = "약봉투 스캔 원본"
+        verbose_name_plural = "약봉투 스캔 원본"
+
+    def __str__(self):
+        return f"scan {self.scan_id}: {self.size} → {len(self.data or b'')} bytes"
+
+    @staticmethod
+    def compress(raw):
+        """dict → (압축 바이트, 원본 크기)"""
+        body = json.dumps(raw, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return zlib.compress(body, EnvelopeScanRaw.COMPRESS_LEVEL), len(body)
+
+    @classmethod
+    def store(cls, scan, raw):
+        data, size = cls.compress(raw)
+        return cls.objects.create(scan=scan, codec=cls.CODEC_ZLIB, size=size, data=data)
+
+    def load(self):
+        """압축 해제 → dict (깨진 데이터면 {})"""
+        try:
+            return json.loads(zlib.decompress(bytes(self.data)).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return {}
+
+
 class AccessibilityInfo(models.Model):
     """접근성 정보"""
     medicine = models.OneToOneField(Medicine, on_delete=models.CASCADE, primary_key=True)
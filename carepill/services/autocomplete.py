@@ -0,0 +1,256 @@
+"""
+약품명 자동완성 인덱스 (메모리, 조회 시 DB 접근 없음)
+
+음성/텍스트 입력 UI는 글자가 바뀔 때마다 제안을 요청한다.
+search_medicine(전문 검색 + 결과 행 조회)을 매번 부르는 대신
+item_name / item_name_eng을 정규화해 자모(+초성) 문자열로 풀고 정렬해 둔 배열에서
+이분 탐색으로 앞부분 일치 범위를 찾는다 ('타이렌' → 타이레놀, 'ㅌㅇㄹ' → 타이레놀, 'tyl' → Tylenol).
+- 순위: 인기(그 약을 복용약으로 등록한 건수, user_medications) → 짧은 이름 → 이름
+- 제안에 필요한 값(제품명/영문명/제조사)은 인덱스에 들고 있어 응답까지 DB를 거치지 않는다
+- 동기화: AUTOCOMPLETE_SYNC_S(기본 60초)마다 백그라운드 스레드에서 updated_at이 바뀐 약품만
+  읽어 반영 (import_medicines / direct_import.py의 update_or_create가 updated_at을 갱신).
+  바뀐 약품이 많거나 삭제가 있으면 전체 재생성. 새 배열을 만든 뒤 바꿔 끼우므로 조회와 충돌 없음
+- 넓은 범위(짧은 검색어) 결과는 인덱스마다 LRU로 기억
+- 테이블 접근은 raw SQL (medicine_index와 같이 medicines 앱 설치 여부와 무관)
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from heapq import nsmallest
+
+from django.db import connection, DatabaseError
+
+from .hangul import to_jamo, choseong, is_choseong
+from .medicine_index import normalize
+
+logger = logging.getLogger(__name__)
+
+# 변경분 동기화 주기 (초)
+AUTOCOMPLETE_SYNC_S = int(os.getenv("AUTOCOMPLETE_SYNC_S", "60"))
+# 요청당 최대 제안 수
+AUTOCOMPLETE_MAX_LIMIT = int(os.getenv("AUTOCOMPLETE_MAX_LIMIT", "20"))
+
+# 바뀐 약품이 전체의 이 비율을 넘으면 부분 반영 대신 전체 재생성
+_FULL_REBUILD_RATIO = 0.2
+# 일치 범위가 이 이상인 검색어만 결과를 기억 (좁은 범위는 바로 계산하는 편이 싸다)
+_CACHE_MIN_RANGE = 200
+_CACHE_SIZE = 1024
+# 정렬 키 상한 (자모/한글/영문/숫자보다 큰 글자)
+_KEY_END = "\uffff"
+
+
+def _name_keys(name, name_eng):
+    """제품명/영문명 → (자모 키 set, 초성 키 set)"""
+    jamo, cho = set(), set()
+    for n in (name, name_eng):
+        key = normalize(n or "")
+        if not key:
+            continue
+        jamo.add(to_jamo(key))
+        c = choseong(key)
+        if c != key:
+            cho.add(c)
+    return jamo, cho
+
+
+def _remove(keys, entry):
+    i = bisect_left(keys, entry)
+    if i < len(keys) and keys[i] == entry:
+        del keys[i]
+
+
+class AutocompleteIndex:
+    """정렬된 (자모 키, item_seq) / (초성 키, item_seq) 배열 + 약품별 표시 정보와 인기"""
+
+    def __init__(self, rows=(), popularity=None, synced_at=None):
+        """rows: [(item_seq, item_name, item_name_eng, entp_name), ...]"""
+        self.items = {}  # item_seq → (item_name, item_name_eng, entp_name)
+        jamo, cho = [], []
+        for item_seq, name, name_eng, entp_name in rows:
+            self.items[item_seq] = (name, name_eng, entp_name)
+            jamo_keys, cho_keys = _name_keys(name, name_eng)
+            jamo.extend((k, item_seq) for k in jamo_keys)
+            cho.extend((k, item_seq) for k in cho_keys)
+        jamo.sort()
+        cho.sort()
+        self._jamo = jamo
+        self._cho = cho
+        self.popularity = popularity or {}
+        self.synced_at = synced_at
+        self.checked_at = time.time()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def updated(self, rows, popularity, synced_at):
+        """바뀐 약품(rows)만 반영한 새 인덱스. 이 인덱스는 그대로 둔다 (조회 중인 요청용)"""
+        new = AutocompleteIndex(popularity=popularity, synced_at=synced_at)
+        new.items = dict(self.items)
+        new._jamo = list(self._jamo)
+        new._cho = list(self._cho)
+        for item_seq, name, name_eng, entp_name in rows:
+            old = new.items.get(item_seq)
+            if old is not None:
+                old_jamo, old_cho = _name_keys(old[0], old[1])
+                for k in old_jamo:
+                    _remove(new._jamo, (k, item_seq))
+                for k in old_cho:
+                    _remove(new._cho, (k, item_seq))
+            new.items[item_seq] = (name, name_eng, entp_name)
+            jamo_keys, cho_keys = _name_keys(name, name_eng)
+            for k in jamo_keys:
+                insort(new._jamo, (k, item_seq))
+            for k in cho_keys:
+                insort(new._cho, (k, item_seq))
+        return new
+
+    def _rank_key(self, item_seq):
+        name = self.items[item_seq][0] or ""
+        return -self.popularity.get(item_seq, 0), len(name), name
+
+    def complete(self, query, limit=10):
+        """
+        검색어로 시작하는 약품 제안 (자모 단위, 초성만으로 된 검색어는 초성 앞부분 일치).
+
+        Returns:
+            list: [{'item_seq', 'item_name', 'item_name_eng', 'entp_name', 'popularity'}, ...] 인기순
+        """
+        q = normalize(query)
+        if not q:
+            return []
+        keys, probe = (self._cho, q) if is_choseong(q) else (self._jamo, to_jamo(q))
+        lo = bisect_left(keys, (probe,))
+        hi = bisect_left(keys, (probe + _KEY_END,), lo)
+        if lo == hi:
+            return []
+
+        cache_key = (keys is self._cho, probe, limit)
+        ranked = self._cache.get(cache_key)
+        if ranked is None:
+            ranked = nsmallest(limit, {item_seq for _, item_seq in keys[lo:hi]}, key=self._rank_key)
+            if hi - lo >= _CACHE_MIN_RANGE:
+                with self._cache_lock:
+                    self._cache[cache_key] = ranked
+                    if len(self._cache) > _CACHE_SIZE:
+                        self._cache.popitem(last=False)
+
+        results = []
+        for item_seq in ranked:
+            name, name_eng, entp_name = self.items[item_seq]
+            results.append({
+                "item_seq": item_seq,
+                "item_name": name,
+                "item_name_eng": name_eng,
+                "entp_name": entp_name,
+                "popularity": self.popularity.get(item_seq, 0),
+            })
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+_sync_lock = threading.Lock()
+# 첫 인덱스가 만들어지는 동안 돌려줄 빈 인덱스 (제안 없음)
+_EMPTY = AutocompleteIndex()
+
+
+def _load_rows(since=None):
+    """(rows, 가장 최근 updated_at) - since가 있으면 그 뒤에 바뀐 약품만"""
+    sql = "SELECT item_seq, item_name, item_name_eng, entp_name, updated_at FROM medicines"
+    params = []
+    if since is not None:
+        sql += " WHERE updated_at > %s"
+        params.append(since)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        fetched = cursor.fetchall()
+    stamps = [r[4] for r in fetched if r[4] is not None]
+    return [r[:4] for r in fetched], max(stamps) if stamps else since
+
+
+def _load_popularity():
+    """item_seq → 복용약 등록 수 (user_medications가 없으면 빈 dict)"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT medicine_id, COUNT(*) FROM user_medications GROUP BY medicine_id")
+            return dict(cursor.fetchall())
+    except DatabaseError:
+        return {}
+
+
+def _count_rows():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM medicines")
+        return cursor.fetchone()[0]
+
+
+def _build():
+    t0 = time.monotonic()
+    rows, synced_at = _load_rows()
+    idx = AutocompleteIndex(rows, _load_popularity(), synced_at)
+    logger.info(f"autocomplete index built: {len(idx)} items, {int((time.monotonic() - t0) * 1000)}ms")
+    return idx
+
+
+def sync():
+    """
+    마지막 동기화 이후 바뀐 약품만 반영 (없으면 전체 생성).
+    바뀐 약품이 전체의 _FULL_REBUILD_RATIO를 넘거나 약품 수가 맞지 않으면(삭제) 전체 재생성.
+    """
+    global _index
+    with _index_lock:
+        idx = _index
+        if idx is None:
+            _index = _build()
+            return _index
+        rows, synced_at = _load_rows(idx.synced_at)
+        popularity = _load_popularity()
+        total = _count_rows()
+        if len(rows) > len(idx) * _FULL_REBUILD_RATIO:
+            _index = _build()
+        elif rows or popularity != idx.popularity or total != len(idx):
+            new = idx.updated(rows, popularity, synced_at)
+            _index = new if len(new) == total else _build()
+            logger.info(f"autocomplete index synced: {len(rows)} changed")
+        else:
+            idx.checked_at = time.time()
+        return _index
+
+
+def _sync_in_background():
+    def run():
+        try:
+            sync()
+        except Exception as e:
+            logger.warning(f"autocomplete sync failed: {e}")
+        finally:
+            _sync_lock.release()
+            connection.close()
+    if _sync_lock.acquire(blocking=False):
+        threading.Thread(target=run, name="autocomplete-sync", daemon=True).start()
+
+
+def get_index():
+    """
+    프로세스 공용 인덱스. 요청 스레드에서는 만들지 않는다:
+    아직 없으면 백그라운드에서 만들기 시작하고 빈 인덱스(제안 없음)를 돌려주며 (서버는 preload로 미리 만든다),
+    AUTOCOMPLETE_SYNC_S가 지나면 지금 인덱스로 답하면서 백그라운드에서 변경분을 반영한다.
+    바로 다 만든 인덱스가 필요하면 sync()
+    """
+    idx = _index
+    if idx is None:
+        _sync_in_background()
+        return _EMPTY
+    if time.time() - idx.checked_at > AUTOCOMPLETE_SYNC_S:
+        _sync_in_background()
+    return idx
+
+
+def preload():
+    """백그라운드 스레드에서 인덱스를 미리 만든다 (서버 시작 시)"""
+    _sync_in_background()
@@ -1,8 +1,9 @@
-import requests
 import os
 from pathlib import Path
 from django.conf import settings
 
+from . import http_client
+
 
 class ElevenLabsService:
     """ElevenLabs API 통합 서비스"""
@@ -42,7 +43,7 @@ class ElevenLabsService:
                     'description': 'CarePill user voice clone'
                 }
 
-                response = requests.post(
+                response = http_client.post(
                     url,
                     headers=self.headers,
                     files=files,
@@ -100,7 +101,7 @@ class ElevenLabsService:
                 }
             }
 
-            response = requests.post(url, headers=headers, json=data)
+            response = http_client.post(url, headers=headers, json=data)
 
             if response.status_code == 200:
                 if output_path:
@@ -126,7 +127,7 @@ class ElevenLabsService:
         """
         try:
             url = f"{self.base_url}/voices"
-            response = requests.get(url, headers=self.headers)
+            response = http_client.get(url, headers=self.headers)
 
             if response.status_code == 200:
                 return response.json().get('voices', [])
@@ -149,7 +150,7 @@ class ElevenLabsService:
         """
         try:
             url = f"{self.base_url}/voices/{voice_id}"
-            response = requests.delete(url, headers=self.headers)
+            response = http_client.delete(url, headers=self.headers)
             return response.status_code == 200
 
         except Exception as e:
@@ -0,0 +1,47 @@
+"""
+한글 자모 분해 (검색 색인용)
+
+음절을 호환 자모로 풀어 쓴다. 겹모음/겹받침도 낱자로 나눠
+입력 중인 글자('타이렌')가 완성된 이름('타이레놀')의 자모 앞부분과 맞고
+오탈자 비교도 자모 단위로 할 수 있게 한다.
+- to_jamo('타이레놀') → 'ㅌㅏㅇㅣㄹㅔㄴㅗㄹ'
+- choseong('타이레놀') → 'ㅌㅇㄹㄴ' (한글 음절이 아닌 글자는 그대로)
+변환은 미리 만든 str.translate 표로 한다 (음절 11,172개 + 겹자모).
+"""
+_CHO = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+_JUNG = ["ㅏ", "ㅐ", "ㅑ", "ㅒ", "ㅓ", "ㅔ", "ㅕ", "ㅖ", "ㅗ", "ㅗㅏ", "ㅗㅐ", "ㅗㅣ", "ㅛ", "ㅜ",
+         "ㅜㅓ", "ㅜㅔ", "ㅜㅣ", "ㅠ", "ㅡ", "ㅡㅣ", "ㅣ"]
+_JONG = ["", "ㄱ", "ㄲ", "ㄱㅅ", "ㄴ", "ㄴㅈ", "ㄴㅎ", "ㄷ", "ㄹ", "ㄹㄱ", "ㄹㅁ", "ㄹㅂ", "ㄹㅅ", "ㄹㅌ",
+         "ㄹㅍ", "ㄹㅎ", "ㅁ", "ㅂ", "ㅂㅅ", "ㅅ", "ㅆ", "ㅇ", "ㅈ", "ㅊ", "ㅋ", "ㅌ", "ㅍ", "ㅎ"]
+_BASE = 0xAC00
+_COUNT = len(_CHO) * len(_JUNG) * len(_JONG)
+
+# 따로 입력된 겹자모 (ㅘ, ㄳ 등)도 낱자로
+_COMPOUND = {"ㅘ": "ㅗㅏ", "ㅙ": "ㅗㅐ", "ㅚ": "ㅗㅣ", "ㅝ": "ㅜㅓ", "ㅞ": "ㅜㅔ", "ㅟ": "ㅜㅣ", "ㅢ": "ㅡㅣ",
+             "ㄳ": "ㄱㅅ", "ㄵ": "ㄴㅈ", "ㄶ": "ㄴㅎ", "ㄺ": "ㄹㄱ", "ㄻ": "ㄹㅁ", "ㄼ": "ㄹㅂ", "ㄽ": "ㄹㅅ",
+             "ㄾ": "ㄹㅌ", "ㄿ": "ㄹㅍ", "ㅀ": "ㄹㅎ", "ㅄ": "ㅂㅅ"}
+
+_JAMO_TABLE = {ord(k): v for k, v in _COMPOUND.items()}
+_CHO_TABLE = {}
+for _i in range(_COUNT):
+    _cho, _rest = divmod(_i, len(_JUNG) * len(_JONG))
+    _jung, _jong = divmod(_rest, len(_JONG))
+    _JAMO_TABLE[_BASE + _i] = _CHO[_cho] + _JUNG[_jung] + _JONG[_jong]
+    _CHO_TABLE[_BASE + _i] = _CHO[_cho]
+
+_CHO_SET = frozenset(_CHO)
+
+
+def to_jamo(s):
+    """한글 음절/겹자모 → 낱자 호환 자모 (그 밖의 글자는 그대로)"""
+    return s.translate(_JAMO_TABLE)
+
+
+def choseong(s):
+    """한글 음절 → 초성 (그 밖의 글자는 그대로)"""
+    return s.translate(_CHO_TABLE)
+
+
+def is_choseong(s):
+    """초성 자음만으로 된 문자열인지 ('ㅌㅇㄹㄴ')"""
+    return bool(s) and all(c in _CHO_SET for c in s)
@@ -0,0 +1,211 @@
+"""
+업스트림(OpenAI, ElevenLabs) 공용 HTTP 클라이언트
+
+requests.post를 매번 직접 부르면 호출마다 TCP+TLS 연결을 새로 맺는다.
+호스트별 requests.Session(커넥션 풀, keep-alive)을 프로세스 전체가 공유하고
+타임아웃/재시도/지연시간 측정을 한곳에서 처리한다.
+- 연결 타임아웃: UPSTREAM_CONNECT_TIMEOUT_S (기본 5초)
+- 응답 타임아웃: 호출부 timeout 인자, 없으면 UPSTREAM_READ_TIMEOUT_S (기본 60초)
+- 429/5xx, 연결 실패 시 지수 백오프 + 지터로 UPSTREAM_MAX_RETRIES회 (기본 2) 재시도
+  (Retry-After 헤더가 있으면 우선, 최대 UPSTREAM_BACKOFF_MAX_S)
+- 호스트당 풀 크기: UPSTREAM_POOL_MAXSIZE (기본 10)
+- OpenAI/ElevenLabs 호출은 매 시도 전 upstream_guard(속도 제한, 서킷 브레이커)를 거친다.
+  거절되면 업스트림을 부르지 않고 UpstreamUnavailable (requests.RequestException 하위)
+  서킷 브레이커에는 호출 1건당 최종 결과만 1번 기록 (재시도 중 실패는 세지 않음)
+"""
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .upstream_guard import get_guard, provider_for
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_CONNECT_TIMEOUT_S = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_S", "5"))
+UPSTREAM_READ_TIMEOUT_S = float(os.getenv("UPSTREAM_READ_TIMEOUT_S", "60"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE_S = float(os.getenv("UPSTREAM_BACKOFF_BASE_S", "0.5"))
+UPSTREAM_BACKOFF_MAX_S = float(os.getenv("UPSTREAM_BACKOFF_MAX_S", "8"))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "10"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _session(host):
+    """호스트별 공유 세션 (keep-alive 커넥션 풀)"""
+    s = _sessions.get(host)
+    if s is None:
+        with _sessions_lock:
+            s = _sessions.get(host)
+            if s is None:
+                s = requests.Session()
+                # 재시도는 request()에서 직접 (본문 되감기/지표 기록 때문에 어댑터 재시도는 끔)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_MAXSIZE, max_retries=0)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _sessions[host] = s
+    return s
+
+
+class _Metrics:
+    """호출 대상(호스트+경로)별 지연시간/상태 집계 (프로세스 내)"""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._window = window
+        self._data = {}
+
+    def _get(self, name):
+        m = self._data.get(name)
+        if m is None:
+            m = self._data[name] = {"calls": 0, "errors": 0, "retries": 0, "rejected": 0, "status": {},
+                                    "total_ms": 0, "max_ms": 0, "recent": deque(maxlen=self._window)}
+        return m
+
+    def record(self, name, elapsed_ms, status=None, retried=False):
+        with self._lock:
+            m = self._get(name)
+            m["calls"] += 1
+            m["retries"] += int(retried)
+            m["total_ms"] += elapsed_ms
+            m["max_ms"] = max(m["max_ms"], elapsed_ms)
+            m["recent"].append(elapsed_ms)
+            if status is None:
+                m["errors"] += 1
+            else:
+                m["status"][str(status)] = m["status"].get(str(status), 0) + 1
+
+    def reject(self, name):
+        """가드가 호출 전에 거절한 요청 (지연시간 통계에는 넣지 않음)"""
+        with self._lock:
+            self._get(name)["rejected"] += 1
+
+    def snapshot(self):
+        out = {}
+        with self._lock:
+            for name, m in self._data.items():
+                recent = sorted(m["recent"])
+                pct = lambda q: recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0
+                out[name] = {
+                    "calls": m["calls"], "errors": m["errors"], "retries": m["retries"], "rejected": m["rejected"],
+                    "status": dict(m["status"]),
+                    "avg_ms": int(m["total_ms"] / m["calls"]) if m["calls"] else 0,
+                    "p50_ms": pct(0.5), "p95_ms": pct(0.95), "max_ms": m["max_ms"],
+                }
+        return out
+
+
+metrics = _Metrics()
+
+
+def _backoff(attempt, resp=None):
+    """attempt번째 재시도 전 대기 시간 (Retry-After 우선, 아니면 full jitter)"""
+    if resp is not None:
+        try:
+            return min(UPSTREAM_BACKOFF_MAX_S, float(resp.headers.get("Retry-After")))
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX_S, UPSTREAM_BACKOFF_BASE_S * (2 ** attempt)))
+
+
+def _rewind(kwargs):
+    """재전송 전 파일형 본문을 처음으로 되감는다"""
+    bodies = [kwargs.get("data")]
+    files = kwargs.get("files") or {}
+    for f in (files.values() if isinstance(files, dict) else [v for _, v in files]):
+        bodies.append(f[1] if isinstance(f, tuple) else f)
+    for b in bodies:
+        if hasattr(b, "seek"):
+            b.seek(0)
+
+
+def request(method, url, timeout=None, retries=None, **kwargs):
+    """
+    공유 세션으로 요청하고 requests.Response를 반환한다.
+    재시도를 다 써도 429/5xx면 그 응답을 그대로 반환 (상태 코드 처리는 호출부 몫).
+    연결 실패가 계속되면 마지막 requests 예외를 그대로 올린다. 응답 타임아웃은 재시도하지 않음.
+    """
+    parts = urlsplit(url)
+    name = f"{parts.netloc}{parts.path}"
+    session = _session(parts.netloc)
+    retries = UPSTREAM_MAX_RETRIES if retries is None else retries
+    timeout = (UPSTREAM_CONNECT_TIMEOUT_S, timeout or UPSTREAM_READ_TIMEOUT_S)
+    provider = provider_for(parts.netloc)
+    guard = get_guard() if provider else None
+
+    for attempt in range(retries + 1):
+        if attempt:
+            _rewind(kwargs)
+        if guard:
+            try:
+                guard.acquire(provider)
+            except requests.RequestException:
+                metrics.reject(name)
+                if attempt:
+                    # 재시도 전에 거절됨: 앞 시도의 실패가 이 호출의 최종 결과
+                    guard.record(provider, ok=False)
+                raise
+        t0 = time.monotonic()
+        try:
+            resp = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.ConnectionError as e:
+            elapsed_ms = int((time.monotonic() - t0) * 1000)
+            metrics.record(name, elapsed_ms, retried=attempt > 0)
+            if attempt >= retries:
+                if guard:
+                    guard.record(provider, ok=False)
+                raise
+            delay = _backoff(attempt)
+            logger.warning(f"upstream {method} {name} 연결 실패 ({e}), {delay:.2f}s 후 재시도")
+            time.sleep(delay)
+            continue
+        except requests.RequestException:
+            metrics.record(name, int((time.monotonic() - t0) * 1000), retried=attempt > 0)
+            if guard:
+                guard.record(provider, ok=False)
+            raise
+
+        elapsed_ms = int((time.monotonic() - t0) * 1000)
+        metrics.record(name, elapsed_ms, resp.status_code, retried=attempt > 0)
+        logger.debug(f"upstream {method} {name} {resp.status_code} {elapsed_ms}ms")
+        if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+            if guard:
+                guard.record(provider, ok=resp.status_code not in RETRY_STATUSES)
+            return resp
+        delay = _backoff(attempt, resp)
+        logger.warning(f"upstream {method} {name} {resp.status_code}, {delay:.2f}s 후 재시도")
+        resp.close()
+        time.sleep(delay)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
+
+
+def guard_status():
+    """제공자별 서킷 상태/남은 토큰 (가드 비활성화 시 {})"""
+    guard = get_guard()
+    return guard.status() if guard else {}
+
+
+def stats():
+    """호출 대상별 {'calls', 'errors', 'retries', 'rejected', 'status', 'avg_ms', 'p50_ms', 'p95_ms', 'max_ms'}"""
+    return metrics.snapshot()
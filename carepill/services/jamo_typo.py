@@ -0,0 +1,157 @@
+"""
+자모 단위 오탈자 매칭 (SymSpell 방식 삭제 사전)
+
+음성 인식이 한 음절을 잘못 알아듣거나('타이레눌') OCR이 획 하나를 놓쳐도
+자모로 풀면 1~2글자 차이다. 이름마다 자모 앞부분(_PREFIX 글자)에서
+최대 max_distance개를 지운 문자열을 모두 미리 만들어 두고,
+질의도 같은 방식으로 지운 문자열과 겹치는 이름만 후보로 삼는다 (전체 비교 없음).
+- 삭제 문자열은 64비트 해시로만 저장 (정렬된 numpy 배열 + 이분 탐색): 이름 4.4만 개에 수십 MB 이내
+- 후보는 질의와 '이름 앞부분' 사이 편집 거리(비트 병렬)로 검증 → 함량/제형이 빠진 질의도 맞는다
+- 허용 거리는 질의 길이에 비례 (자모 4글자당 1, 최대 max_distance): 짧은 질의가 아무 이름에나 맞지 않도록
+- 앞부분 _PREFIX 글자만 색인하므로 아주 짧은 질의는 짧은 이름에만 맞는다
+  (입력 중인 짧은 질의는 자모 앞부분 일치 prefix()가 담당)
+"""
+import numpy as np
+
+# 색인하는 자모 앞부분 길이 (한글 약 3음절)
+_PREFIX = 8
+# 검증할 후보 이름 수 상한 (지운 글자 수가 적은 후보부터)
+_MAX_CANDIDATES = 150
+
+
+def _deletes(s, max_d):
+    """s에서 0~max_d 글자를 지운 문자열 → 지운 수 (같은 문자열은 가장 적게 지운 경우)"""
+    out = {s: 0}
+    frontier = [s]
+    for level in range(1, max_d + 1):
+        nxt = []
+        for w in frontier:
+            for i in range(len(w)):
+                d = w[:i] + w[i + 1:]
+                if d not in out:
+                    out[d] = level
+                    nxt.append(d)
+        frontier = nxt
+    return out
+
+
+def _peq(q):
+    """질의 글자별 위치 비트마스크 (prefix_distance용, 질의마다 1번)"""
+    peq = {}
+    for i, c in enumerate(q):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    return peq
+
+
+def _myers(q, text, peq, prefix):
+    """
+    q 대 text 편집 거리 (Myers/Hyyrö 비트 병렬, text 글자당 정수 연산 몇 번).
+    prefix=True면 text의 앞부분(어느 길이든) 중 최솟값
+    """
+    m = len(q)
+    mask = (1 << m) - 1
+    top = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    best = m
+    for c in text:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & top:
+            score += 1
+        elif mh & top:
+            score -= 1
+        if score < best:
+            best = score
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return best if prefix else score
+
+
+def edit_distance(a, b):
+    """레벤슈타인 거리"""
+    if not a or not b:
+        return len(a) + len(b)
+    return _myers(a, b, _peq(a), False)
+
+
+def prefix_distance(q, key, max_d, peq=None):
+    """q와 key의 앞부분(어느 길이든) 사이 최소 편집 거리. max_d를 넘으면 max_d + 1"""
+    if not q:
+        return 0
+    best = _myers(q, key[:len(q) + max_d], peq if peq is not None else _peq(q), True)
+    return best if best <= max_d else max_d + 1
+
+
+class JamoTypoIndex:
+    """자모 문자열 키 → 값 목록. lookup()으로 편집 거리 max_distance 이내 키를 찾는다"""
+
+    def __init__(self, entries, max_distance=2):
+        """entries: [(자모 문자열, 값), ...] (같은 키의 값은 묶인다)"""
+        self.max_distance = max_distance
+        keys = {}
+        for key, value in entries:
+            if key:
+                keys.setdefault(key, []).append(value)
+        self.keys = list(keys)
+        self.values = list(keys.values())
+
+        hashes, idx, level = [], [], []
+        for k, key in enumerate(self.keys):
+            for d, n in _deletes(key[:_PREFIX], max_distance).items():
+                hashes.append(hash(d))
+                idx.append(k)
+                level.append(n)
+        order = np.argsort(np.array(hashes, dtype=np.int64), kind="stable")
+        self._hash = np.array(hashes, dtype=np.int64)[order]
+        self._idx = np.array(idx, dtype=np.int32)[order]
+        self._level = np.array(level, dtype=np.int8)[order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def entries(self):
+        """저장된 삭제 문자열 해시 수"""
+        return len(self._hash)
+
+    def lookup(self, q, limit=None):
+        """
+        자모 질의 q와 앞부분 편집 거리가 허용 거리(질의 길이 비례, 최대 max_distance) 이내인 키.
+
+        Returns:
+            list: [(거리, 키, 값 목록), ...] 거리, 키 길이 순
+        """
+        max_d = min(self.max_distance, len(q) // 4)
+        if max_d < 1:
+            return []
+        qdel = _deletes(q[:_PREFIX], max_d)
+        qh = np.array([hash(d) for d in qdel], dtype=np.int64)
+        qlevel = np.fromiter(qdel.values(), dtype=np.int8, count=len(qdel))
+        lo = np.searchsorted(self._hash, qh, "left")
+        hi = np.searchsorted(self._hash, qh, "right")
+
+        # 지운 글자 수 합이 적은 후보부터 (같은 키는 한 번만)
+        cand = {}
+        for a, b, ql in zip(lo.tolist(), hi.tolist(), qlevel.tolist()):
+            if a == b:
+                continue
+            for k, kl in zip(self._idx[a:b].tolist(), self._level[a:b].tolist()):
+                cost = ql + kl
+                if cost < cand.get(k, 99):
+                    cand[k] = cost
+        ranked = sorted(cand, key=cand.get)[:_MAX_CANDIDATES]
+
+        out = []
+        peq = _peq(q)
+        for k in ranked:
+            key = self.keys[k]
+            d = prefix_distance(q, key, max_d, peq)
+            if d <= max_d:
+                out.append((d, key, self.values[k]))
+        out.sort(key=lambda r: (r[0], len(r[1])))
+        return out[:limit] if limit else out
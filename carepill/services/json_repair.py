@@ -0,0 +1,188 @@
+"""
+모델 응답 JSON 관대한 파서 (structured output 실패 시 대비)
+
+json.loads가 실패하면 그 샷 결과를 통째로 버리게 되므로
+한 글자씩 읽으며 흔한 깨짐을 고쳐 최대한 살린다.
+- 코드펜스/앞뒤 설명 문구: 첫 '{' 또는 '[' 이전, 최상위 닫힘 이후는 무시
+- 끝의 쉼표 (,} ,]) 제거
+- 문자열 안의 날것 줄바꿈/탭 이스케이프
+- 중간에 끊긴 응답(max_tokens 등): 미완성 키/값 한 쌍은 버리고 열린 괄호를 닫는다
+  (잘린 문자열 값을 그대로 두면 잘못된 값이 병합 투표에 들어가므로 버림)
+feed()로 나눠 넣을 수 있어 스트리밍 응답에도 그대로 쓸 수 있다.
+"""
+import os
+import re
+import json
+import threading
+from collections import Counter
+
+# Vision 추출(약봉투/OCR)에서 스키마 고정 출력(response_format json_schema, strict) 사용 여부
+VISION_STRUCTURED_OUTPUT = os.getenv("VISION_STRUCTURED_OUTPUT", "1") == "1"
+
+_LITERAL_RE = re.compile(r"^-?\d+(\.\d+)?([eE][+-]?\d+)?$|^(true|false|null)$")
+_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+class JSONRepairParser:
+    """문자 단위 상태 기계. feed(chunk)로 입력, close()로 고친 JSON 문자열"""
+
+    def __init__(self):
+        self._out = []
+        self._stack = []  # {'type': '{'|'[', 'expect': key|colon|value|literal|comma, 'start': 잘라낼 위치}
+        self._in_str = False
+        self._esc = False
+        self._started = False
+        self._done = False
+
+    def feed(self, chunk):
+        for ch in chunk:
+            if self._done:
+                return
+            if not self._started:
+                if ch not in "{[":
+                    continue  # 코드펜스/설명 문구
+                self._started = True
+            if self._in_str:
+                self._string_char(ch)
+            else:
+                self._char(ch)
+
+    def _string_char(self, ch):
+        if self._esc:
+            self._esc = False
+            self._out.append(ch)
+        elif ch == "\\":
+            self._esc = True
+            self._out.append(ch)
+        elif ch == '"':
+            self._in_str = False
+            self._out.append(ch)
+            top = self._stack[-1]
+            top["expect"] = "colon" if top["expect"] == "key" else "comma"
+        else:
+            self._out.append(_ESCAPES.get(ch, ch))
+
+    def _char(self, ch):
+        top = self._stack[-1] if self._stack else None
+        if ch == '"':
+            if top["type"] == "{" and top["expect"] in ("key", "comma", "literal"):
+                # 키 시작: 이 쌍이 미완성이면 여기까지 잘라낸다.
+                # 앞 값 뒤 쉼표가 빠졌으면 넣는다 (문자열 값 뒤 comma, 숫자/true/false/null 뒤 literal)
+                if top["expect"] != "key":
+                    self._out.append(",")
+                top["expect"] = "key"
+                top["start"] = len(self._out)
+            elif top["type"] == "[" and top["expect"] in ("comma", "literal"):
+                # 배열 원소 사이 쉼표 빠짐 (["a" "b"], [1 "b"])
+                self._out.append(",")
+                top["expect"] = "value"
+                top["start"] = len(self._out)
+            self._in_str = True
+            self._out.append(ch)
+        elif ch in "{[":
+            self._stack.append({"type": ch, "expect": "key" if ch == "{" else "value",
+                                "start": len(self._out) + 1})
+            self._out.append(ch)
+        elif ch in "}]":
+            self._strip_comma(self._out)
+            frame = self._stack.pop()
+            self._out.append("}" if frame["type"] == "{" else "]")
+            if self._stack:
+                self._stack[-1]["expect"] = "comma"
+            else:
+                self._done = True
+        elif ch == ":":
+            top["expect"] = "value"
+            self._out.append(ch)
+        elif ch == ",":
+            if top["type"] == "{":
+                top["expect"] = "key"
+            else:
+                top["expect"] = "value"
+                top["start"] = len(self._out) + 1
+            self._out.append(ch)
+        elif ch.isspace():
+            self._out.append(ch)
+        else:
+            # 숫자/true/false/null
+            if top["expect"] == "value":
+                top["expect"] = "literal"
+                top["value_start"] = len(self._out)
+            self._out.append(ch)
+
+    @staticmethod
+    def _strip_comma(out):
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+
+    def close(self):
+        """열린 문자열/괄호를 정리해 JSON 문자열 반환 (시작 괄호가 없었으면 ValueError)"""
+        if not self._started:
+            raise ValueError("JSON 시작 괄호가 없습니다.")
+        out = list(self._out)
+        if self._stack:
+            top = self._stack[-1]
+            incomplete = (
+                self._in_str
+                or (top["type"] == "{" and top["expect"] in ("colon", "value"))
+                or (top["expect"] == "literal"
+                    and not _LITERAL_RE.match("".join(out[top["value_start"]:]).strip()))
+            )
+            if incomplete:
+                del out[top["start"]:]
+            for frame in reversed(self._stack):
+                self._strip_comma(out)
+                out.append("}" if frame["type"] == "{" else "]")
+        return "".join(out)
+
+
+def repair_json(text):
+    """깨진 JSON 문자열 → 파싱 가능한 JSON 문자열 (살릴 수 없으면 ValueError)"""
+    p = JSONRepairParser()
+    p.feed(text or "")
+    return p.close()
+
+
+def loads_tolerant(text):
+    """(obj, repaired) 반환. 그대로 파싱되면 repaired=False, 고쳐서 파싱되면 True, 실패 시 ValueError"""
+    t = (text or "").strip()
+    if t.startswith("```"):
+        t = re.sub(r"^```[A-Za-z]*\s*|\s*```$", "", t)
+    try:
+        return json.loads(t), False
+    except ValueError:
+        pass
+    return json.loads(repair_json(t)), True
+
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def parse_model_json(text, kind):
+    """
+    모델 응답 파싱 + 결과 집계.
+    Returns:
+        (dict 또는 list 또는 None, 'ok' | 'repaired' | 'failed')
+        'repaired'는 그대로였으면 버려졌을 응답을 살린 경우
+    """
+    try:
+        obj, repaired = loads_tolerant(text)
+        # 고쳤는데 빈 객체만 남았으면 살린 게 아니다
+        status = ("repaired" if obj else "failed") if repaired else "ok"
+    except (TypeError, ValueError):
+        obj, status = None, "failed"
+    with _counts_lock:
+        _counts[(kind, status)] += 1
+    return obj, status
+
+
+def stats():
+    """{kind: {'ok', 'repaired', 'failed'}} (프로세스 내 누적)"""
+    out = {}
+    with _counts_lock:
+        for (kind, status), n in _counts.items():
+            out.setdefault(kind, {"ok": 0, "repaired": 0, "failed": 0})[status] = n
+    return out
@@ -0,0 +1,342 @@
+"""
+의약품 카탈로그 이름 인덱스 (메모리, 퍼지 매칭)
+
+Vision/OCR이 읽은 약품명은 띄어쓰기/괄호/오탈자가 제각각이라
+item_name__icontains 로는 못 찾거나 수천 건을 훑게 된다.
+medicines 테이블의 item_name(+영문명)을 정규화해 글자 2-gram 역색인을 만들고
+1) 질의 2-gram을 공유하는 후보만 모아 (대부분의 이름에 들어 있는 흔한 2-gram('밀리', '그램' 등)은
+   후보 수집에서 빼고 드문 2-gram으로만)
+2) 공유 개수 상위 후보만 Dice 계수 + 편집 거리 유사도로 점수를 매긴다.
+   함량('500밀리그램')까지 붙은 이름과 오탈자 섞인 짧은 질의도 맞도록 첫 숫자 앞까지의
+   기본 이름끼리도 비교해 높은 쪽을 쓴다 (기본 이름 일치는 약간 감점).
+3) 음성 인식/OCR 오탈자('타이레눌')는 자모 단위 삭제 사전(jamo_typo.JamoTypoIndex)으로
+   편집 거리 CATALOG_TYPO_MAX_DISTANCE(기본 2) 이내 이름을 찾아 함께 순위를 매긴다.
+prefix()는 이름을 자모/초성으로 풀어 정렬해 둔 배열에서 이분 탐색으로 앞부분 일치를 찾는다
+('타이렌' → 타이레놀, 'ㅌㅇㄹㄴ' → 타이레놀, 수 µs).
+- 인덱스는 백그라운드 스레드에서만 만든다 (서버 시작 시 CATALOG_INDEX_PRELOAD, 아니면 첫 조회 시, 동시에 1개만).
+  CATALOG_INDEX_CHECK_S(기본 60초)마다 카탈로그 버전(약품 수 + 최근 updated_at)을 확인해 바뀌었거나
+  CATALOG_INDEX_TTL_S(기본 3600초)가 지났으면 다시 만들고, 그동안 요청은 기존 인덱스로 답한다
+  (다른 프로세스의 import_medicines / direct_import.py 변경도 확인 주기 안에 반영)
+- 같은 프로세스에서 약 데이터를 바꿨으면 invalidate() 호출
+- 테이블 접근은 raw SQL (medicines 앱 설치 여부와 무관하게 carepill에서도 사용)
+"""
+import os
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from django.db import connection
+
+from .hangul import to_jamo, choseong, is_choseong
+from .jamo_typo import JamoTypoIndex, edit_distance
+
+logger = logging.getLogger(__name__)
+
+CATALOG_INDEX_TTL_S = int(os.getenv("CATALOG_INDEX_TTL_S", "3600"))
+# 카탈로그 버전(약품 수 + 최근 updated_at) 확인 주기: 다른 프로세스가 바꾼 데이터를 이 안에 반영
+CATALOG_INDEX_CHECK_S = int(os.getenv("CATALOG_INDEX_CHECK_S", "60"))
+# 인덱스가 아직 없을 때 요청이 진행 중인 생성을 기다리는 최대 시간 (초)
+CATALOG_INDEX_WAIT_S = float(os.getenv("CATALOG_INDEX_WAIT_S", "10"))
+# 서버 시작 시 인덱스를 미리 만들지 (carepill.apps)
+CATALOG_INDEX_PRELOAD = os.getenv("CATALOG_INDEX_PRELOAD", "1") == "1"
+# 질의 1개당 후보 수, 이 점수 미만은 매칭 안 된 것으로 본다
+CATALOG_TOP_K = int(os.getenv("CATALOG_TOP_K", "3"))
+CATALOG_MATCH_MIN_SCORE = float(os.getenv("CATALOG_MATCH_MIN_SCORE", "0.5"))
+# 자모 단위 오탈자 허용 거리 (0이면 오탈자 색인을 만들지 않음)
+CATALOG_TYPO_MAX_DISTANCE = int(os.getenv("CATALOG_TYPO_MAX_DISTANCE", "2"))
+
+# 괄호 안 부가 설명(성분명/포장 단위 등)은 비교에서 뺀다
+_PAREN_RE = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+# 초성 검색어('ㅌㅇㄹㄴ')가 지워지지 않도록 호환 자모(ㄱ-ㅣ)도 남긴다
+_NON_WORD_RE = re.compile(r"[^0-9a-z가-힣ㄱ-ㅣ]")
+_STRENGTH_RE = re.compile(r"\d.*$")
+_HANGUL_RE = re.compile(r"[가-힣]")
+# 기본 이름(함량 제외)끼리만 맞을 때의 감점 배율
+_BASE_FACTOR = 0.95
+# 후보 수집에 쓰지 않는 흔한 2-gram: 전체 이름의 이 비율 이상에 등장
+_COMMON_DF = 0.05
+# 공유 2-gram 수 상위 몇 개만 정밀 비교할지
+_RERANK = 30
+# 앞부분 일치 후보를 최대 몇 개까지 모아 짧은 이름 순으로 정렬할지
+_PREFIX_SCAN = 200
+
+
+def normalize(name):
+    """비교용 정규화: 소문자, 괄호 내용/공백/기호 제거"""
+    s = _PAREN_RE.sub("", str(name or "").lower())
+    return _NON_WORD_RE.sub("", s)
+
+
+def base_name(key):
+    """정규화 이름에서 함량 이하를 뗀 기본 이름 (남는 게 2글자 미만이면 그대로)"""
+    base = _STRENGTH_RE.sub("", key)
+    return base if len(base) >= 2 else key
+
+
+def _similarity(q, qgrams, key, grams):
+    """Dice 계수와 편집 거리 유사도(1 - 거리 / 긴 쪽 길이) 평균 (+ 앞부분 일치 보정)"""
+    dice = 2.0 * sum(min(n, grams[g]) for g, n in qgrams.items()) / (sum(qgrams.values()) + sum(grams.values()))
+    score = 0.5 * dice + 0.5 * (1.0 - edit_distance(q, key) / max(len(q), len(key)))
+    if key.startswith(q) or q.startswith(key):
+        # 함량/제형이 빠진 질의 ('타이레놀' → '타이레놀정500밀리그램')
+        score = max(score, 0.8 + 0.2 * min(len(q), len(key)) / max(len(q), len(key)))
+    return score
+
+
+def bigrams(s):
+    """글자 2-gram 다중집합 (1글자면 그 글자)"""
+    if len(s) < 2:
+        return Counter([s]) if s else Counter()
+    return Counter(s[i:i + 2] for i in range(len(s) - 1))
+
+
+class MedicineIndex:
+    """item_seq별 정규화 이름 + 2-gram 역색인"""
+
+    def __init__(self, rows, typo_max_distance=CATALOG_TYPO_MAX_DISTANCE):
+        """rows: [(item_seq, item_name, item_name_eng), ...]"""
+        self.names = {}    # item_seq → 원래 이름
+        self._keys = []    # [(item_seq, 정규화 이름, 2-gram Counter, 기본 이름, 기본 이름 2-gram)]
+        self._postings = {}  # 2-gram → [키 번호, ...]
+        jamo_keys, cho_keys = [], []  # [(자모 또는 초성 문자열, item_seq)]
+        typo_entries = []  # [(기본 이름 자모, item_seq)] - 한글 이름만 (오탈자는 음성 인식/OCR 한글에서)
+        for item_seq, name, name_eng in rows:
+            self.names[item_seq] = name
+            for n in (name, name_eng):
+                key = normalize(n)
+                if not key:
+                    continue
+                k = len(self._keys)
+                grams = bigrams(key)
+                base = base_name(key)
+                self._keys.append((item_seq, key, grams, base, bigrams(base)))
+                for g in grams:
+                    self._postings.setdefault(g, []).append(k)
+                jamo_keys.append((to_jamo(key), item_seq))
+                cho = choseong(key)
+                if cho != key:
+                    cho_keys.append((cho, item_seq))
+                    typo_entries.append((to_jamo(base), item_seq))
+        jamo_keys.sort()
+        cho_keys.sort()
+        self._jamo_keys = jamo_keys
+        self._cho_keys = cho_keys
+        self._typo = JamoTypoIndex(typo_entries, typo_max_distance) if typo_max_distance > 0 else None
+        self.built_at = self.checked_at = time.time()
+        self.version = None  # _catalog_version() (만들 때 기준)
+
+    def __len__(self):
+        return len(self.names)
+
+    def info(self):
+        """크기 정보 (벤치마크/진단용)"""
+        return {"items": len(self.names), "keys": len(self._keys),
+                "typo_keys": len(self._typo) if self._typo is not None else 0,
+                "typo_hashes": self._typo.entries if self._typo is not None else 0}
+
+    def prefix(self, query, limit=10):
+        """
+        이름 앞부분 일치 (자모 단위). 초성만으로 된 질의는 초성 앞부분 일치.
+        입력 중인 마지막 글자도 맞는다 ('타이렌' → 타이레놀정).
+
+        Returns:
+            list: [item_seq, ...] 짧은 이름(정규화 기준) 순 (한 약품은 한 번만)
+        """
+        q = normalize(query)
+        if not q:
+            return []
+        if is_choseong(q):
+            keys, probe = self._cho_keys, q
+        else:
+            keys, probe = self._jamo_keys, to_jamo(q)
+        found = {}
+        i = bisect_left(keys, (probe,))
+        while i < len(keys) and len(found) < _PREFIX_SCAN and keys[i][0].startswith(probe):
+            key, item_seq = keys[i]
+            found[item_seq] = min(len(key), found.get(item_seq, len(key)))
+            i += 1
+        ranked = sorted(found, key=lambda item_seq: (found[item_seq], self.names[item_seq]))
+        return ranked[:limit]
+
+    def typo(self, query, limit=CATALOG_TOP_K):
+        """
+        자모 편집 거리로 찾은 약품 (질의의 함량 이하는 떼고 비교, 이름 앞부분과 비교).
+        점수: 1 - 거리 / 질의 자모 수, 이름 중 질의가 덮는 비율이 낮을수록 조금 감점.
+
+        Returns:
+            list: [(item_seq, score 0~1), ...] 점수 내림차순
+        """
+        q = normalize(query)
+        if self._typo is None or not _HANGUL_RE.search(q):
+            return []
+        qj = to_jamo(base_name(q))
+        best = {}
+        for d, key, seqs in self._typo.lookup(qj):
+            score = (1.0 - d / len(qj)) * (0.85 + 0.15 * min(1.0, len(qj) / len(key)))
+            for item_seq in seqs:
+                if score > best.get(item_seq, -1):
+                    best[item_seq] = score
+        ranked = sorted(best.items(), key=lambda kv: (-kv[1], len(self.names[kv[0]])))
+        return [(item_seq, round(score, 3)) for item_seq, score in ranked[:limit]]
+
+    def match_many(self, queries, limit=CATALOG_TOP_K, min_score=CATALOG_MATCH_MIN_SCORE):
+        """여러 질의를 한 번에: {질의: [(item_seq, score), ...]} (같은 질의는 한 번만 계산)"""
+        return {q: self.match(q, limit, min_score) for q in dict.fromkeys(q for q in queries if q)}
+
+    def match(self, query, limit=3, min_score=0.0):
+        """
+        query와 가장 비슷한 약품.
+
+        Returns:
+            list: [(item_seq, score 0~1), ...] 점수 내림차순 (한 약품은 한 번만)
+        """
+        q = normalize(query)
+        if not q:
+            return []
+        qgrams = bigrams(q)
+        qbase = base_name(q)
+        qbase_grams = bigrams(qbase)
+        lists = sorted((self._postings[g] for g in qgrams if g in self._postings), key=len)
+        common = max(1, int(len(self._keys) * _COMMON_DF))
+        # 드문 2-gram만 쓰되, 전부 흔하면 가장 드문 2개는 쓴다
+        lists = [p for n, p in enumerate(lists) if len(p) <= common or n < 2]
+        shared = Counter()
+        for p in lists:
+            shared.update(p)
+
+        best = {}
+        for k, _ in shared.most_common(_RERANK):
+            item_seq, key, grams, base, base_grams = self._keys[k]
+            score = _similarity(q, qgrams, key, grams)
+            if base != key or qbase != q:
+                score = max(score, _BASE_FACTOR * _similarity(qbase, qbase_grams, base, base_grams))
+            if score >= min_score and score > best.get(item_seq, -1):
+                best[item_seq] = score
+        for item_seq, score in self.typo(q, _RERANK):
+            if score >= min_score and score > best.get(item_seq, -1):
+                best[item_seq] = score
+        ranked = sorted(best.items(), key=lambda kv: (-kv[1], len(self.names[kv[0]])))
+        return [(item_seq, round(score, 3)) for item_seq, score in ranked[:limit]]
+
+
+_index = None
+_index_lock = threading.Lock()
+# 진행 중인 갱신이 끝나면 set되는 Event (갱신 스레드는 동시에 1개만), 끝난 뒤 한 번 더 다시 만들지 (invalidate)
+_refresh_done = None
+_refresh_force = False
+
+
+def _load_rows():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT item_seq, item_name, item_name_eng FROM medicines")
+        return cursor.fetchall()
+
+
+def _catalog_version():
+    """(약품 수, 가장 최근 updated_at) - 다른 프로세스(import_medicines 등)가 데이터를 바꿨는지 확인용"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*), MAX(updated_at) FROM medicines")
+        return tuple(cursor.fetchone())
+
+
+def _build(version):
+    t0 = time.monotonic()
+    idx = MedicineIndex(_load_rows())
+    idx.version = version
+    logger.info(f"medicine index built: {len(idx)} items, {int((time.monotonic() - t0) * 1000)}ms")
+    return idx
+
+
+def _refresh(force):
+    """카탈로그 버전이 바뀌었거나 TTL이 지났으면(force면 무조건) 새로 만들어 바꿔 끼운다"""
+    global _index
+    version = _catalog_version()
+    idx = _index
+    if (not force and idx is not None and idx.version == version
+            and time.time() - idx.built_at <= CATALOG_INDEX_TTL_S):
+        idx.checked_at = time.time()
+        return
+    new = _build(version)
+    with _index_lock:
+        _index = new
+
+
+def _refresh_in_background(force=False):
+    """
+    백그라운드 스레드에서 _refresh. 이미 돌고 있으면 새로 띄우지 않는다 (force면 그 갱신이 끝난 뒤 한 번 더 만든다).
+
+    Returns:
+        threading.Event: 진행 중인 갱신이 끝나면 set
+    """
+    global _refresh_done, _refresh_force
+    with _index_lock:
+        if _refresh_done is not None and not _refresh_done.is_set():
+            _refresh_force = _refresh_force or force
+            return _refresh_done
+        done = _refresh_done = threading.Event()
+
+    def run():
+        global _refresh_force
+        again = force
+        try:
+            while True:
+                try:
+                    _refresh(again)
+                except Exception as e:
+                    logger.warning(f"medicine index refresh failed: {e}")
+                with _index_lock:
+                    again, _refresh_force = _refresh_force, False
+                    if not again:
+                        done.set()
+                        return
+        finally:
+            done.set()
+            connection.close()
+    threading.Thread(target=run, name="medicine-index-refresh", daemon=True).start()
+    return done
+
+
+# 첫 인덱스를 CATALOG_INDEX_WAIT_S 안에 못 만들었을 때 돌려줄 빈 인덱스 (매칭 없음)
+_EMPTY = MedicineIndex((), typo_max_distance=0)
+
+
+def get_index():
+    """
+    프로세스 공용 인덱스. 요청 스레드에서는 만들지 않는다:
+    아직 없으면 백그라운드 생성(진행 중이면 그것)을 CATALOG_INDEX_WAIT_S까지 기다리고, 그래도 없으면 빈 인덱스.
+    CATALOG_INDEX_CHECK_S가 지나면 지금 인덱스로 답하면서 백그라운드에서 카탈로그 버전을 확인해 바뀌었으면 새로 만든다.
+    바로 다 만든 인덱스가 필요하면 rebuild()
+    """
+    idx = _index
+    if idx is None:
+        _refresh_in_background().wait(CATALOG_INDEX_WAIT_S)
+        idx = _index
+        return idx if idx is not None else _EMPTY
+    if time.time() - idx.checked_at > CATALOG_INDEX_CHECK_S:
+        _refresh_in_background()
+    return idx
+
+
+def rebuild():
+    """지금 스레드에서 바로 다시 만든다 (관리 명령/테스트용, 요청 처리 중에는 get_index())"""
+    global _index
+    idx = _build(_catalog_version())
+    with _index_lock:
+        _index = idx
+    return idx
+
+
+def preload():
+    """백그라운드 스레드에서 인덱스를 미리 만든다 (서버 시작 시, 실패해도 첫 조회 때 다시 시도)"""
+    _refresh_in_background(force=True)
+
+
+def invalidate():
+    """
+    약 데이터 변경 후 호출: 기존 인덱스로 계속 답하면서 백그라운드에서 다시 만든다 (이 프로세스).
+    다른 프로세스의 인덱스는 CATALOG_INDEX_CHECK_S 안에 카탈로그 버전 확인으로 새로 만들어진다.
+    """
+    _refresh_in_background(force=True)
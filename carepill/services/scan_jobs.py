@@ -0,0 +1,136 @@
+"""
+약봉투 스캔 비동기 작업 (프로세스 내 워커 풀)
+
+스캔 요청이 Vision 분석 내내 Django 워커를 붙잡지 않도록
+POST는 job id만 바로 돌려주고, 분석/병합은 이 모듈의 워커 풀에서 실행한다.
+진행 상황은 작업별 이벤트 목록에 쌓이고 SSE 엔드포인트가 이를 흘려보낸다.
+- 워커 수: SCAN_JOB_WORKERS (기본 2)
+- 끝난 작업 보관 시간: SCAN_JOB_TTL_S (기본 600초)
+- 아직 안 끝난(대기 + 실행 중) 작업이 SCAN_JOB_MAX_PENDING(기본 8)개면 새 작업은 받지 않는다
+  (작업마다 업로드 이미지 최대 9장을 들고 대기하므로 메모리가 무한정 늘지 않도록) → submit()이 None
+
+주의: 작업은 프로세스 메모리에만 있으므로 같은 프로세스로 조회해야 한다
+(runserver / 단일 프로세스 배포 기준).
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SCAN_JOB_WORKERS = int(os.getenv("SCAN_JOB_WORKERS", "2"))
+SCAN_JOB_TTL_S = int(os.getenv("SCAN_JOB_TTL_S", "600"))
+SCAN_JOB_MAX_PENDING = int(os.getenv("SCAN_JOB_MAX_PENDING", "8"))
+# 대기열이 가득 찼을 때 클라이언트에 권하는 재시도 대기 (초)
+SCAN_JOB_RETRY_AFTER_S = 5
+
+
+class ScanJob:
+    """작업 1건의 상태와 이벤트 목록"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.status = "queued"  # queued | running | done | error
+        self.result = None
+        self.error = None
+        self.events = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def emit(self, event, data):
+        """이벤트 추가 후 대기 중인 스트림을 깨운다"""
+        with self._cond:
+            self.events.append({"id": len(self.events) + 1, "event": event, "data": data})
+            self._cond.notify_all()
+
+    def finish(self, status, event, data):
+        """상태(done | error)와 마지막 이벤트를 한 번에 기록 (끝난 작업에는 마지막 이벤트가 항상 있다)"""
+        with self._cond:
+            self.status = status
+            self.finished_at = time.time()
+            self.events.append({"id": len(self.events) + 1, "event": event, "data": data})
+            self._cond.notify_all()
+
+    def wait_events(self, after, timeout):
+        """after 번 이후 이벤트를 돌려준다. 없으면 timeout 동안 대기 (끝난 작업이면 대기 없이 빈 목록)"""
+        with self._cond:
+            if len(self.events) <= after and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[after:]
+
+    def snapshot(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "events": len(self.events),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_pool = None
+_slots = threading.BoundedSemaphore(SCAN_JOB_MAX_PENDING)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _jobs_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=SCAN_JOB_WORKERS, thread_name_prefix="scan-job")
+    return _pool
+
+
+def _purge_expired():
+    now = time.time()
+    with _jobs_lock:
+        for job_id in [j.id for j in _jobs.values() if j.finished and now - j.finished_at > SCAN_JOB_TTL_S]:
+            del _jobs[job_id]
+
+
+def _run(job, fn, args, kwargs):
+    job.status = "running"
+    job.emit("status", {"status": "running"})
+    try:
+        job.result = fn(*args, progress=job.emit, **kwargs)
+        status, data = "done", job.result
+    except Exception as e:
+        logger.exception(f"scan job {job.id} failed")
+        job.error = str(e)
+        status, data = "error", {"error": job.error}
+    finally:
+        # 끝났다고 알리기 전에 자리를 비운다 (끝난 작업을 본 클라이언트가 바로 다음 작업을 넣을 수 있도록)
+        _slots.release()
+        # 워커 스레드가 잡은 DB 커넥션 정리
+        from django.db import connection
+        connection.close()
+    job.finish(status, status, data)
+
+
+def submit(fn, *args, **kwargs):
+    """fn(*args, progress=emit, **kwargs)를 워커 풀에서 실행하고 ScanJob 반환. 대기열이 가득 찼으면 None"""
+    _purge_expired()
+    if not _slots.acquire(blocking=False):
+        logger.warning("scan job queue full, rejected")
+        return None
+    job = ScanJob()
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job.emit("status", {"status": "queued"})
+    _get_pool().submit(_run, job, fn, args, kwargs)
+    return job
+
+
+def get(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,109 @@
+"""
+약봉투 스캔 샷 병렬 실행기
+
+여러 장의 샷을 업스트림(OpenAI Vision)에 동시에 보내고,
+결과는 입력 순서(shot 순서)대로 돌려준다.
+- 동시 실행 수 상한: SCAN_MAX_WORKERS (기본 4)
+- 요청 전체 마감 시간: SCAN_DEADLINE_S (기본 75초)
+- on_result 콜백이 True를 반환하면 남은 샷을 건너뛴다 (조기 합의)
+- first_wave를 주면 그 수만큼만 먼저 보내고, 모두 끝날 때까지 중단되지 않았을 때만 나머지를 보낸다
+  (합의로 끝날 스캔에서 결과를 버릴 호출을 미리 보내 비용을 치르지 않도록)
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+SCAN_MAX_WORKERS = int(os.getenv("SCAN_MAX_WORKERS", "4"))
+SCAN_DEADLINE_S = float(os.getenv("SCAN_DEADLINE_S", "75"))
+
+
+def _outcome(status, value=None, error=None, elapsed_ms=None):
+    return {"status": status, "value": value, "error": error, "elapsed_ms": elapsed_ms}
+
+
+def _collect(fut):
+    """완료된 future → outcome dict"""
+    try:
+        value, elapsed_ms = fut.result()
+        return _outcome("ok", value, elapsed_ms=elapsed_ms)
+    except Exception as e:
+        return _outcome("error", error=str(e))
+
+
+def run_shots(fn, items, max_workers=None, deadline_s=None, on_result=None, first_wave=None):
+    """
+    items 각각에 fn(item)을 병렬로 실행한다.
+
+    Args:
+        fn: 샷 하나를 처리하는 함수
+        items: 샷 입력 리스트
+        max_workers: 동시 실행 상한 (None이면 SCAN_MAX_WORKERS)
+        deadline_s: 전체 마감 시간(초) (None이면 SCAN_DEADLINE_S)
+        on_result: on_result(idx, outcome) -> bool, 도착 순서대로 호출.
+                   True를 반환하면 남은 샷을 중단한다.
+        first_wave: 먼저 보낼 샷 수 (None이면 전부 바로). 나머지는 이 샷들이 다 끝나고 중단되지 않았을 때 보낸다
+
+    Returns:
+        list: 입력 순서대로 [{
+            'status': 'ok' | 'error' | 'timeout' | 'skipped' | 'abandoned',
+            'value': fn 반환값 또는 None,
+            'error': 에러 메시지 또는 None,
+            'elapsed_ms': int 또는 None
+        }, ...]
+    """
+    n = len(items)
+    if n == 0:
+        return []
+
+    workers = max(1, min(max_workers or SCAN_MAX_WORKERS, n))
+    deadline = time.monotonic() + (deadline_s if deadline_s is not None else SCAN_DEADLINE_S)
+    outcomes = [None] * n
+    stopped = False
+
+    def _timed(item):
+        t0 = time.monotonic()
+        value = fn(item)
+        return value, int((time.monotonic() - t0) * 1000)
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan-shot")
+    try:
+        first = min(n, first_wave) if first_wave else n
+        futures = {pool.submit(_timed, items[idx]): idx for idx in range(first)}
+        pending = set(futures)
+        while pending and not stopped:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            # 같은 시점에 끝난 샷은 입력 순서대로 처리
+            for fut in sorted(done, key=lambda f: futures[f]):
+                idx = futures[fut]
+                outcomes[idx] = _collect(fut)
+                if on_result and not stopped and on_result(idx, outcomes[idx]):
+                    stopped = True
+            if not pending and not stopped and len(futures) < n:
+                # 먼저 보낸 샷으로 끝나지 않았으면 나머지 샷 시작
+                rest = {pool.submit(_timed, items[idx]): idx for idx in range(len(futures), n)}
+                futures.update(rest)
+                pending = set(rest)
+
+        for fut in pending:
+            idx = futures[fut]
+            if fut.done() and not fut.cancelled():
+                # 중단 직전에 끝난 샷은 버리지 않는다
+                outcomes[idx] = _collect(fut)
+            elif stopped:
+                # 조기 합의: 시작 전이면 호출 자체를 생략, 실행 중이면 결과를 버린다
+                outcomes[idx] = _outcome("skipped" if fut.cancel() else "abandoned")
+            else:
+                # 마감 시간 초과: 아직 시작 안 한 샷은 취소, 실행 중인 샷은 결과를 버린다
+                fut.cancel()
+                outcomes[idx] = _outcome("timeout", error="deadline exceeded")
+        for idx in range(len(futures), n):
+            # 보내지 않은 샷
+            outcomes[idx] = _outcome("skipped") if stopped else _outcome("timeout", error="deadline exceeded")
+    finally:
+        # 실행 중인 스레드를 기다리지 않음 (업스트림 timeout으로 자연 종료)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return outcomes
@@ -0,0 +1,76 @@
+"""
+이미지가 들어간 JSON 요청 본문 스트리밍
+
+Vision 요청 JSON에 이미지를 base64 문자열로 통째로 넣으면
+원본 바이트 + base64 문자열 + JSON 문자열이 동시에 메모리에 올라간다.
+ImageJSONBody는 payload 안의 자리표시자 위치에 base64를 read() 시점에
+조금씩 인코딩해 흘려보낸다 (Content-Length는 미리 계산).
+"""
+import json
+import base64
+
+# 3의 배수: 청크 경계에서 base64 패딩이 생기지 않는다
+_CHUNK = 3 * 16 * 1024
+
+
+def image_placeholder(i: int = 0) -> str:
+    """payload 안에서 i번째 이미지 base64가 들어갈 자리"""
+    return f"__CAREPILL_IMAGE_B64_{i}__"
+
+
+class ImageJSONBody:
+    """requests의 data= 로 넘기는 file-like 본문 (len/read/seek/tell 지원)"""
+
+    def __init__(self, payload, images):
+        text = json.dumps(payload, ensure_ascii=False)
+        self._parts = []  # bytes 또는 memoryview(이미지)
+        for i, image in enumerate(images):
+            head, sep, text = text.partition(image_placeholder(i))
+            if not sep:
+                raise ValueError(f"payload에 이미지 자리표시자 {i}가 없습니다.")
+            self._parts.append(head.encode("utf-8"))
+            self._parts.append(memoryview(image))
+        self._parts.append(text.encode("utf-8"))
+
+        self._len = sum(
+            4 * ((len(p) + 2) // 3) if isinstance(p, memoryview) else len(p)
+            for p in self._parts
+        )
+        self.seek(0)
+
+    def __len__(self):
+        return self._len
+
+    def _chunks(self):
+        for p in self._parts:
+            if isinstance(p, memoryview):
+                for off in range(0, len(p), _CHUNK):
+                    yield base64.b64encode(p[off:off + _CHUNK])
+            elif p:
+                yield p
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            out = self._buf + b"".join(self._iter)
+            self._buf = b""
+        else:
+            while len(self._buf) < size:
+                nxt = next(self._iter, None)
+                if nxt is None:
+                    break
+                self._buf += nxt
+            out, self._buf = self._buf[:size], self._buf[size:]
+        self._pos += len(out)
+        return out
+
+    def seek(self, offset, whence=0):
+        # 재전송(재시도/리다이렉트)용 되감기만 지원
+        if offset != 0 or whence != 0:
+            raise OSError("ImageJSONBody는 처음으로만 되감을 수 있습니다.")
+        self._iter = self._chunks()
+        self._buf = b""
+        self._pos = 0
+        return 0
+
+    def tell(self):
+        return self._pos
@@ -0,0 +1,250 @@
+"""
+업스트림 AI 제공자(OpenAI, ElevenLabs)별 요청 속도 제한 + 서킷 브레이커
+
+OpenAI가 429로 조이기 시작하면 동시에 들어온 스캔/요약/세션 요청이 모두
+같은 업스트림을 계속 두드리며 20~60초씩 워커를 붙잡는다.
+SQLite 파일 하나를 모든 워커 프로세스가 공유해
+1) 토큰 버킷: 제공자별 초당 요청 수(UPSTREAM_RATE_<P>)와 순간 허용량(UPSTREAM_BURST_<P>)
+   - 토큰이 없으면 UPSTREAM_QUEUE_WAIT_S(기본 2초) 안에 생길 때만 기다리고, 아니면 바로 거절
+2) 서킷 브레이커: 연속 실패(429/5xx/연결 실패) UPSTREAM_BREAKER_FAILURES회(기본 5)면
+   UPSTREAM_BREAKER_COOLDOWN_S(기본 30초) 동안 호출 없이 바로 거절,
+   이후 한 요청만 시험 호출(half-open)해 성공하면 닫는다.
+- 저장 위치: UPSTREAM_GUARD_PATH (기본 BASE_DIR/upstream_guard.sqlite3)
+- 저장소 오류 시에는 막지 않고 통과 (가드 때문에 서비스가 멈추지 않도록)
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_GUARD_ENABLED = os.getenv("UPSTREAM_GUARD_ENABLED", "1") == "1"
+UPSTREAM_QUEUE_WAIT_S = float(os.getenv("UPSTREAM_QUEUE_WAIT_S", "2"))
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_COOLDOWN_S = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN_S", "30"))
+
+# 호스트 → 제공자 (목록에 없는 호스트는 가드하지 않음)
+PROVIDERS = {
+    "api.openai.com": "openai",
+    "api.elevenlabs.io": "elevenlabs",
+}
+# 제공자별 (초당 요청 수, 순간 허용량) 기본값
+_DEFAULT_LIMITS = {
+    "openai": (5.0, 10.0),
+    "elevenlabs": (2.0, 4.0),
+}
+
+
+def _limits(provider):
+    rate, burst = _DEFAULT_LIMITS.get(provider, (5.0, 10.0))
+    key = provider.upper()
+    return (float(os.getenv(f"UPSTREAM_RATE_{key}", str(rate))),
+            float(os.getenv(f"UPSTREAM_BURST_{key}", str(burst))))
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """속도 제한/서킷 차단으로 업스트림을 호출하지 않고 거절함 (retry_after: 권장 대기 초)"""
+
+    def __init__(self, provider, reason, retry_after):
+        self.provider = provider
+        self.reason = reason  # rate_limited | circuit_open
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(f"{provider} {reason} (retry after {self.retry_after}s)")
+
+
+def _default_path():
+    path = os.getenv("UPSTREAM_GUARD_PATH")
+    if path:
+        return path
+    try:
+        from django.conf import settings
+        return os.path.join(str(settings.BASE_DIR), "upstream_guard.sqlite3")
+    except Exception:
+        return os.path.join(os.getcwd(), "upstream_guard.sqlite3")
+
+
+class UpstreamGuard:
+    """SQLite 기반 제공자별 토큰 버킷 + 서킷 브레이커 (스레드별 커넥션)"""
+
+    def __init__(self, path=None):
+        self.path = path or _default_path()
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS upstream_bucket ("
+                        " provider TEXT PRIMARY KEY, tokens REAL, updated_at REAL)"
+                    )
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS upstream_breaker ("
+                        " provider TEXT PRIMARY KEY, state TEXT, failures INTEGER, open_until REAL)"
+                    )
+                    self._initialized = True
+        return conn
+
+    def _take_token(self, conn, provider):
+        """토큰 1개를 가져오면 0, 모자라면 생길 때까지 남은 초"""
+        rate, burst = _limits(provider)
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM upstream_bucket WHERE provider = ?",
+                               (provider,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO upstream_bucket(provider, tokens, updated_at) VALUES(?, ?, ?)",
+                         (provider, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def _check_breaker(self, conn, provider):
+        """
+        (차단 중이면 남은 초 아니면 None, 이 요청이 시험 호출인지).
+        쿨다운이 끝났으면 이 요청을 시험 호출로 통과시킨다
+        """
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state, open_until FROM upstream_breaker WHERE provider = ?",
+                               (provider,)).fetchone()
+            blocked, probe = None, False
+            if row and row[0] in ("open", "half_open"):
+                if now < row[1]:
+                    blocked = row[1] - now
+                else:
+                    # 시험 호출 1건만 통과 (결과가 올 때까지 다른 요청은 계속 차단)
+                    conn.execute("UPDATE upstream_breaker SET state = 'half_open', open_until = ? WHERE provider = ?",
+                                 (now + UPSTREAM_BREAKER_COOLDOWN_S, provider))
+                    probe = True
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return blocked, probe
+
+    def _release_probe(self, conn, provider):
+        """시험 호출을 맡은 요청이 호출하지 못하고 끝남: 다음 요청이 바로 시험 호출을 맡도록 되돌린다"""
+        conn.execute("UPDATE upstream_breaker SET open_until = ? WHERE provider = ? AND state = 'half_open'",
+                     (time.time(), provider))
+
+    def acquire(self, provider):
+        """호출 전 확인. 차단/속도 초과면 UpstreamUnavailable"""
+        try:
+            conn = self._conn()
+            blocked, probe = self._check_breaker(conn, provider)
+            if blocked is not None:
+                raise UpstreamUnavailable(provider, "circuit_open", blocked)
+            deadline = time.monotonic() + UPSTREAM_QUEUE_WAIT_S
+            while True:
+                wait = self._take_token(conn, provider)
+                if wait <= 0:
+                    return
+                if time.monotonic() + wait > deadline:
+                    if probe:
+                        self._release_probe(conn, provider)
+                    raise UpstreamUnavailable(provider, "rate_limited", wait)
+                time.sleep(wait)
+        except sqlite3.Error as e:
+            logger.warning(f"upstream guard acquire failed: {e}")
+
+    def record(self, provider, ok):
+        """호출 결과 반영: 성공이면 서킷을 닫고, 실패가 누적되면 연다"""
+        try:
+            conn = self._conn()
+            if ok:
+                # 평소(닫힘, 실패 0회)에는 쓰기 없이 끝낸다
+                if conn.execute("SELECT 1 FROM upstream_breaker WHERE provider = ?", (provider,)).fetchone():
+                    conn.execute("DELETE FROM upstream_breaker WHERE provider = ?", (provider,))
+                return
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT state, failures FROM upstream_breaker WHERE provider = ?",
+                                   (provider,)).fetchone()
+                state, failures = row if row else ("closed", 0)
+                failures += 1
+                if state == "half_open" or failures >= UPSTREAM_BREAKER_FAILURES:
+                    if state != "open":
+                        logger.warning(f"upstream circuit open: {provider} ({failures} failures)")
+                    state, open_until = "open", now + UPSTREAM_BREAKER_COOLDOWN_S
+                else:
+                    open_until = 0
+                conn.execute("INSERT OR REPLACE INTO upstream_breaker(provider, state, failures, open_until) "
+                             "VALUES(?, ?, ?, ?)", (provider, state, failures, open_until))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"upstream guard record failed: {e}")
+
+    def retry_after(self, provider):
+        """서킷이 열려 있으면 남은 초, 아니면 None (호출 전 빠른 확인용, 상태는 바꾸지 않음)"""
+        try:
+            row = self._conn().execute("SELECT state, open_until FROM upstream_breaker WHERE provider = ?",
+                                       (provider,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"upstream guard check failed: {e}")
+            return None
+        if row and row[0] == "open" and time.time() < row[1]:
+            return row[1] - time.time()
+        return None
+
+    def status(self):
+        """{제공자: {'state', 'failures', 'open_for_s', 'tokens'}}"""
+        try:
+            conn = self._conn()
+            now = time.time()
+            out = {p: {"state": "closed", "failures": 0, "open_for_s": 0, "tokens": None}
+                   for p in PROVIDERS.values()}
+            for p, state, failures, open_until in conn.execute("SELECT * FROM upstream_breaker"):
+                out.setdefault(p, {})
+                out[p].update(state=state, failures=failures, open_for_s=max(0, round(open_until - now, 1)))
+            for p, tokens, updated_at in conn.execute("SELECT * FROM upstream_bucket"):
+                rate, burst = _limits(p)
+                out.setdefault(p, {})["tokens"] = round(min(burst, tokens + (now - updated_at) * rate), 2)
+            return out
+        except sqlite3.Error as e:
+            logger.warning(f"upstream guard status failed: {e}")
+            return {}
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_guard():
+    """프로세스 공용 가드 인스턴스 (비활성화 시 None)"""
+    global _guard
+    if not UPSTREAM_GUARD_ENABLED:
+        return None
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                _guard = UpstreamGuard()
+    return _guard
+
+
+def provider_for(host):
+    return PROVIDERS.get(host)
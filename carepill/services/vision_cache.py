@@ -0,0 +1,158 @@
+"""
+Vision 결과 캐시 (content-addressed, SQLite)
+
+같은 약봉투를 다시 스캔하면 gpt-4o를 다시 호출하지 않도록
+(이미지 바이트 해시, 모델, 프롬프트 버전) 키로 응답 원문을 저장한다.
+  (약봉투 스캔은 전처리 전 원본 업로드 바이트 + 전처리 설정으로 키를 만들어 전처리 전에 조회)
+- 저장 위치: VISION_CACHE_PATH (기본 BASE_DIR/vision_cache.sqlite3)
+- 용량 제한: VISION_CACHE_MAX_BYTES (기본 50MB), 초과 시 LRU 순으로 삭제
+- hit/miss 카운터는 DB에 누적 (워커 프로세스 간 공유)
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "1") == "1"
+VISION_CACHE_MAX_BYTES = int(os.getenv("VISION_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+def _default_path():
+    path = os.getenv("VISION_CACHE_PATH")
+    if path:
+        return path
+    try:
+        from django.conf import settings
+        return os.path.join(str(settings.BASE_DIR), "vision_cache.sqlite3")
+    except Exception:
+        return os.path.join(os.getcwd(), "vision_cache.sqlite3")
+
+
+def make_key(image_bytes: bytes, model: str, prompt_version: str) -> str:
+    """이미지 바이트 + 모델 + 프롬프트 버전 → 캐시 키"""
+    h = hashlib.sha256(image_bytes)
+    h.update(b"\0" + model.encode("utf-8") + b"\0" + prompt_version.encode("utf-8"))
+    return h.hexdigest()
+
+
+class VisionCache:
+    """SQLite 기반 LRU 캐시 (스레드별 커넥션)"""
+
+    def __init__(self, path=None, max_bytes=VISION_CACHE_MAX_BYTES):
+        self.path = path or _default_path()
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._initialized:
+                    self._create_tables(conn)
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def _create_tables(conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS vision_cache ("
+            " key TEXT PRIMARY KEY, kind TEXT, model TEXT, value TEXT,"
+            " size INTEGER, created_at REAL, accessed_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS vision_cache_accessed ON vision_cache(accessed_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS vision_cache_stats (name TEXT PRIMARY KEY, value INTEGER)")
+
+    def _bump(self, conn, name, n=1):
+        conn.execute(
+            "INSERT INTO vision_cache_stats(name, value) VALUES(?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, n),
+        )
+
+    def get(self, key):
+        """캐시 조회. 없으면 None"""
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT value FROM vision_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._bump(conn, "miss")
+                return None
+            conn.execute("UPDATE vision_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._bump(conn, "hit")
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"vision cache get failed: {e}")
+            return None
+
+    def put(self, key, value, kind="", model=""):
+        """캐시 저장 후 용량 초과분을 LRU 순으로 삭제"""
+        try:
+            conn = self._conn()
+            now = time.time()
+            size = len(value.encode("utf-8"))
+            conn.execute(
+                "INSERT OR REPLACE INTO vision_cache(key, kind, model, value, size, created_at, accessed_at) "
+                "VALUES(?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, model, value, size, now, now),
+            )
+            self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"vision cache put failed: {e}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM vision_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 오래 안 쓴 항목부터 누적 크기가 초과분을 넘을 때까지 삭제
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM vision_cache ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size or 0
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM vision_cache WHERE key = ?", victims)
+        self._bump(conn, "evict", len(victims))
+
+    def stats(self):
+        """{'hit', 'miss', 'evict', 'hit_rate', 'entries', 'bytes'}"""
+        try:
+            conn = self._conn()
+            out = {"hit": 0, "miss": 0, "evict": 0}
+            out.update(dict(conn.execute("SELECT name, value FROM vision_cache_stats").fetchall()))
+            lookups = out["hit"] + out["miss"]
+            out["hit_rate"] = round(out["hit"] / lookups, 3) if lookups else None
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM vision_cache").fetchone()
+            out["entries"] = entries
+            out["bytes"] = size
+            return out
+        except sqlite3.Error as e:
+            logger.warning(f"vision cache stats failed: {e}")
+            return {}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """프로세스 공용 캐시 인스턴스 (비활성화 시 None)"""
+    global _cache
+    if not VISION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = VisionCache()
+    return _cache
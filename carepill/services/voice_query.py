@@ -0,0 +1,137 @@
+"""
+음성 질의 정규화 (규칙 기반, 카탈로그 검색 앞단)
+
+음성 인식 결과는 "타이레놀 효능 알려줘", "음 타이레놀 오백 밀리그램은 어떻게 먹어요?"처럼
+조사/요청 동사/군말이 붙은 문장으로 들어와 그대로는 검색에 걸리지 않는다.
+미리 컴파일한 정규식과 어휘 목록으로
+1) 용량 표현을 뽑아 카탈로그 표기로 바꾸고 ('오백 밀리' / '500mg' → '500밀리그램')
+2) 알고 싶은 항목(효능/복용법/부작용/주의사항/보관/상호작용)을 intent로 떼어 내고
+3) 요청 동사('알려줘', '찾아 주세요'), 의문 어미('뭐야'), 군말('음', '혹시', '좀')을 지우고
+4) 남은 단어 끝의 조사('타이레놀은' → '타이레놀')를 뗀다.
+   조사처럼 끝나는 약 이름('...에이')이 잘려도 남은 부분이 이름 앞부분이라
+   부분 문자열 검색(FTS trigram)과 퍼지 매칭에는 그대로 걸린다 (덜 떼는 쪽이 더 못 찾는다).
+결과(VoiceQuery.search)를 검색 색인에 넘긴다. 같은 발화가 반복되므로 정규화 결과는 LRU로 기억한다.
+"""
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# 정규화 결과 LRU 크기
+VOICE_QUERY_CACHE_SIZE = int(os.getenv("VOICE_QUERY_CACHE_SIZE", "2048"))
+
+VoiceQuery = namedtuple("VoiceQuery", "search terms strengths intent")
+VoiceQuery.__doc__ = """search: 검색에 넘길 문자열, terms: 약 이름 등 단어, strengths: 용량 ('500밀리그램'), intent: 알고 싶은 항목 또는 None"""
+
+# 말한 단위 → 카탈로그 표기 (긴 것부터 맞춘다)
+_UNITS = {
+    "마이크로그램": "마이크로그램", "mcg": "마이크로그램", "µg": "마이크로그램", "㎍": "마이크로그램",
+    "밀리그램": "밀리그램", "밀리그람": "밀리그램", "미리그램": "밀리그램", "mg": "밀리그램", "엠지": "밀리그램",
+    "밀리리터": "밀리리터", "미리리터": "밀리리터", "ml": "밀리리터", "cc": "밀리리터", "씨씨": "밀리리터",
+    "밀리": "밀리그램", "미리": "밀리그램",
+    "그램": "그램", "그람": "그램", "g": "그램",
+}
+_UNIT_PATTERN = "|".join(re.escape(u) for u in sorted(_UNITS, key=len, reverse=True))
+# 용량: 숫자 + 단위 (+ 뒤에 붙은 조사/'짜리'는 함께 지운다)
+_STRENGTH_RE = re.compile(rf"(\d+(?:\.\d+)?)\s*({_UNIT_PATTERN})(?![a-z])[가-힣]*", re.IGNORECASE)
+# 단위 앞의 한자어 수사 ('오백 밀리그램')
+_SINO_RE = re.compile(rf"\b([일이삼사오육칠팔구십백천만]+)\s*(?=(?:{_UNIT_PATTERN}))", re.IGNORECASE)
+_SINO_DIGITS = {c: i for i, c in enumerate("영일이삼사오육칠팔구")}
+_SINO_SCALES = {"십": 10, "백": 100, "천": 1000}
+
+# 알고 싶은 항목 (단어 뒤 어미까지 함께 지운다)
+_INTENTS = {
+    "side_effect": r"부작용",
+    "interaction": r"상호\s?작용|병용|(?:같이|함께)\s?(?:먹|복용)[가-힣]*",
+    "usage": r"복용\s?(?:법|방법)|먹는\s?(?:법|방법)|용법|용량|(?:어떻게|언제|하루에\s?몇\s?번)\s?(?:먹|복용)[가-힣]*|몇\s?알",
+    "warning": r"주의\s?사항|주의할\s?점|주의점|조심[가-힣]*|경고|금기",
+    "storage": r"보관\s?(?:법|방법)?",
+    "effect": r"효능|효과|약효|(?:어디|뭐)에\s?(?:좋|쓰)[가-힣]*|무슨\s?약[가-힣]*",
+}
+_INTENT_RE = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in _INTENTS.items()))
+# 요청 동사 ('알려줘', '찾아 주세요', '검색해 줄래요', '설명해봐')
+_REQUEST_RE = re.compile(r"(?:알려|말해|찾아|검색해|보여|설명해|읽어|가르쳐)\s?(?:주|줘|줄|봐)?[가-힣]*")
+# 천 단위 쉼표 ('1,000mg' → '1000mg'). 단위가 바로 붙어도 되도록 \b 대신 '뒤에 숫자 없음'
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+_PUNCT_RE = re.compile(r"[?!,~…\"'“”‘’()\[\]]|\.(?!\d)")
+_SPACE_RE = re.compile(r"\s+")
+
+# 통째로 버리는 단어 (군말, 의문/요청 어미, 지시어)
+_FILLER = frozenset("""
+    음 음음 어 으 아 저 저기 저기요 그 그게 그러니까 있잖아 혹시 좀 제발 그냥 약간 막 뭐 이거 그거 저거 이 약
+    대해 대해서 대한 관해 관해서 관한 관련 관련된 정보 내용
+    뭐야 뭐예요 뭐에요 뭔가요 뭐지 뭐니 뭐죠 어때 어때요 어떤가요 있어 있어요 있나요 있니 알아 알아요
+    궁금해 궁금해요 궁금한데 궁금합니다 해줘 해줘요 해주세요 주세요 줘 요 하고 싶어 싶어요 싶은데
+    돼 돼요 되나요 될까 될까요 되는 괜찮아 괜찮아요 괜찮나요 먹어 먹어요 먹으면 먹는 먹을 먹고 먹었어
+    들어간 들어있는 성분
+""".split())
+# 단어 끝 조사 (긴 것부터, 떼고 남는 부분이 2글자 이상일 때만)
+_PARTICLES = ("에서는", "에게서", "으로는", "이라는", "이랑은", "이에요", "에서", "에게", "한테", "으로", "이랑",
+              "하고", "까지", "부터", "처럼", "보다", "라는", "이나", "은요", "는요", "이요", "예요", "에요",
+              "의", "은", "는", "이", "가", "을", "를", "에", "로", "와", "과", "도", "만", "랑", "요")
+_PARTICLE_RE = re.compile(rf"^(.{{2,}}?)(?:{'|'.join(_PARTICLES)})$")
+# 조사처럼 끝나지만 그 자체로 검색어인 단어
+_NO_STRIP = frozenset(("어린이",))
+
+
+def _sino_to_int(s):
+    """한자어 수사 → 정수 ('오백' → 500, '천이백오십' → 1250). 읽을 수 없으면 None"""
+    total, section, digit = 0, 0, None
+    for c in s:
+        if c in _SINO_DIGITS:
+            if digit is not None:
+                return None
+            digit = _SINO_DIGITS[c]
+        elif c in _SINO_SCALES:
+            section += (1 if digit is None else digit) * _SINO_SCALES[c]
+            digit = None
+        elif c == "만":
+            total += (section + (digit or 0) or 1) * 10000
+            section, digit = 0, None
+    return total + section + (digit or 0) or None
+
+
+def _spoken_number(m):
+    n = _sino_to_int(m.group(1))
+    return f"{n} " if n is not None else m.group(0)
+
+
+def _strip_particle(word):
+    if word in _NO_STRIP or not ("가" <= word[-1] <= "힣"):
+        return word
+    m = _PARTICLE_RE.match(word)
+    return m.group(1) if m else word
+
+
+@lru_cache(maxsize=VOICE_QUERY_CACHE_SIZE)
+def normalize_query(text):
+    """
+    음성 인식 문장 → VoiceQuery.
+    "타이레놀 효능 알려줘" → search='타이레놀', intent='effect'
+    "타이레놀 오백 밀리그램은 어떻게 먹어요?" → search='타이레놀 500밀리그램', strengths=('500밀리그램',), intent='usage'
+    정리하고 남는 단어가 없으면 search는 빈 문자열 (호출 쪽에서 원문으로 검색)
+    """
+    s = _PUNCT_RE.sub(" ", _THOUSANDS_RE.sub("", text or ""))
+    s = _SINO_RE.sub(_spoken_number, s)
+
+    strengths = []
+    for m in _STRENGTH_RE.finditer(s):
+        strength = m.group(1) + _UNITS[m.group(2).lower()]
+        if strength not in strengths:
+            strengths.append(strength)
+    s = _STRENGTH_RE.sub(" ", s)
+
+    intent = None
+    for m in _INTENT_RE.finditer(s):
+        intent = intent or m.lastgroup
+    s = _INTENT_RE.sub(" ", s)
+    s = _REQUEST_RE.sub(" ", s)
+
+    terms = []
+    for word in _SPACE_RE.split(s.strip()):
+        if not word or word in _FILLER:
+            continue
+        word = _strip_particle(word)
+        if word not in _FILLER and word not in terms:
+            terms.append(word)
+    return VoiceQuery(" ".join(terms + strengths), tuple(terms), tuple(strengths), intent)
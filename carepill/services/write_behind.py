@@ -0,0 +1,68 @@
+"""
+요청 응답 후 저장 (write-behind, 프로세스 내 단일 워커)
+
+업로드 원본 보관처럼 응답에 필요 없는 파일/DB 쓰기를 요청 스레드에서 하지 않고
+큐에 넣은 뒤 바로 응답한다. 쓰기는 워커 1개가 순서대로 처리한다.
+- 대기 중인 작업이 WRITE_BEHIND_MAX_PENDING(기본 32)개를 넘으면 새 작업은 버린다
+  (저장이 밀려도 메모리에 업로드 바이트가 무한정 쌓이지 않도록) → submit()이 False
+- 실패는 로그만 남긴다 (응답은 이미 나갔으므로)
+
+주의: 프로세스가 죽으면 아직 처리 안 된 작업은 사라진다 (보관은 '요청 시에만'인 부가 기능 기준)
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "32"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(WRITE_BEHIND_MAX_PENDING)
+_stats = {"queued": 0, "done": 0, "failed": 0, "dropped": 0}
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write-behind")
+    return _pool
+
+
+def _run(fn, args, kwargs):
+    try:
+        fn(*args, **kwargs)
+        _count("done")
+    except Exception:
+        logger.exception(f"write-behind {getattr(fn, '__name__', fn)} failed")
+        _count("failed")
+    finally:
+        _slots.release()
+        # 워커 스레드가 잡은 DB 커넥션 정리
+        from django.db import connection
+        connection.close()
+
+
+def _count(key):
+    with _pool_lock:
+        _stats[key] += 1
+
+
+def submit(fn, *args, **kwargs):
+    """fn(*args, **kwargs)를 백그라운드에서 실행. 대기열이 가득 차 버렸으면 False"""
+    if not _slots.acquire(blocking=False):
+        logger.warning(f"write-behind queue full, dropped {getattr(fn, '__name__', fn)}")
+        _count("dropped")
+        return False
+    _count("queued")
+    _get_pool().submit(_run, fn, args, kwargs)
+    return True
+
+
+def stats():
+    with _pool_lock:
+        return dict(_stats)
@@ -0,0 +1,40 @@
+/**
+ * 약봉투 스캔 비동기 작업 헬퍼
+ * 샷을 업로드하면 job id를 바로 받고, SSE로 샷별 진행/중간 병합 결과를 받는다.
+ */
+
+window.CarePillScanJob = {
+  /**
+   * @param {Blob[]} shots - 촬영한 샷 (JPEG Blob)
+   * @param {object} handlers - { onShot(data), onDone(result), onError(err) }
+   *   onShot의 data.partial: 지금까지 도착한 샷으로 병합한 필드 (약 이름 등을 먼저 안내 가능)
+   * @returns {Promise<EventSource>}
+   */
+  async start(shots, handlers = {}) {
+    const form = new FormData();
+    shots.forEach((blob, i) => form.append('images', blob, `shot${i + 1}.jpg`));
+    form.append('async', '1');
+
+    const response = await fetch('/api/scan/envelope/', { method: 'POST', body: form });
+    const job = await response.json().catch(() => ({}));
+    if (response.status !== 202 || !job.events_url) {
+      throw new Error(job.error || `스캔 요청 실패: ${response.status}`);
+    }
+
+    const source = new EventSource(job.events_url);
+    source.addEventListener('shot', (e) => {
+      if (handlers.onShot) handlers.onShot(JSON.parse(e.data));
+    });
+    source.addEventListener('done', (e) => {
+      source.close();
+      if (handlers.onDone) handlers.onDone(JSON.parse(e.data));
+    });
+    source.addEventListener('error', (e) => {
+      // 서버가 보낸 error 이벤트만 data가 있다 (연결 끊김은 EventSource가 재연결)
+      if (!e.data) return;
+      source.close();
+      if (handlers.onError) handlers.onError(JSON.parse(e.data));
+    });
+    return source;
+  }
+};
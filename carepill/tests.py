@@ -1,3 +1,225 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from itertools import islice
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from . import views
+from .services import http_client, scan_jobs
+from .services.json_repair import loads_tolerant
+from .services.shot_executor import run_shots
+from .services.upstream_guard import UpstreamGuard, UpstreamUnavailable
+from .services.vision_cache import VisionCache
+from .services.voice_query import normalize_query
+
+
+class ScanJobEventsTests(TestCase):
+    """GET /api/scan/jobs/<job_id>/events/ (SSE)"""
+
+    def _wait(self, job):
+        for _ in range(100):
+            if job.finished:
+                break
+            job.wait_events(len(job.events), timeout=0.05)
+        self.assertEqual(job.status, "done")
+        return job
+
+    def _finished_job(self):
+        return self._wait(scan_jobs.submit(lambda progress: {"ok": True}))
+
+    def test_reconnect_after_last_event_closes_stream(self):
+        job = self._finished_job()
+        resp = self.client.get(f"/api/scan/jobs/{job.id}/events/", HTTP_LAST_EVENT_ID=str(len(job.events)))
+        # 끝난 작업이면 keep-alive를 무한히 보내지 않고 바로 끝나야 한다
+        chunks = list(islice(resp.streaming_content, 10))
+        self.assertEqual(chunks, [])
+
+    def test_full_queue_returns_503_with_retry_after(self):
+        release = threading.Event()
+        with mock.patch.object(scan_jobs, "_slots", threading.BoundedSemaphore(1)):
+            job = scan_jobs.submit(lambda progress: release.wait(5))
+            self.addCleanup(release.set)
+            self.assertIsNotNone(job)
+            self.assertIsNone(scan_jobs.submit(lambda progress: None))
+            with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}), \
+                    mock.patch.object(views, "get_guard", return_value=None):
+                resp = self.client.post("/api/scan/envelope/?async=1", data=b"\xff\xd8\xff", content_type="image/jpeg")
+            self.assertEqual(resp.status_code, 503)
+            self.assertEqual(resp.json()["error"], "scan_queue_full")
+            self.assertEqual(resp["Retry-After"], str(scan_jobs.SCAN_JOB_RETRY_AFTER_S))
+            release.set()
+            self._wait(job)
+            # 끝난 작업의 자리는 다시 쓸 수 있다
+            self._wait(scan_jobs.submit(lambda progress: None))
+
+    def test_replay_from_start_ends_with_done(self):
+        job = self._finished_job()
+        resp = self.client.get(f"/api/scan/jobs/{job.id}/events/")
+        chunks = [c.decode() for c in islice(resp.streaming_content, 10)]
+        self.assertEqual(len(chunks), len(job.events))
+        self.assertIn("event: done", chunks[-1])
+
+
+class EnvelopeVisionCacheTests(SimpleTestCase):
+    """views._analyze_envelope_shot: Vision 캐시는 전처리 전 원본 바이트로 찾는다"""
+
+    def test_repeat_shot_hits_cache_before_preprocessing(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cache = VisionCache(os.path.join(tmp.name, "cache.sqlite3"))
+        resp = mock.Mock(status_code=200)
+        resp.json.return_value = {"choices": [{"message": {"content": '{"medicine_name": "타이레놀정"}'}}], "usage": {}}
+        prep = {"bytes_in": 3, "bytes_out": 2}
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}), \
+                mock.patch.object(views, "get_cache", return_value=cache), \
+                mock.patch.object(views, "PREPROCESS_ENABLED", True), \
+                mock.patch.object(views, "preprocess_envelope", return_value=(b"pre", prep)) as preprocess, \
+                mock.patch.object(views.http_client, "post", return_value=resp) as post:
+            first = views._analyze_envelope_shot(b"raw", model="gpt-4o-mini")
+            second = views._analyze_envelope_shot(b"raw", model="gpt-4o-mini")
+        self.assertEqual((preprocess.call_count, post.call_count), (1, 1))
+        self.assertEqual(first[1], second[1])
+        self.assertEqual((first[2], second[2]), (prep, None))
+
+
+class UpstreamGuardTests(SimpleTestCase):
+    """services.upstream_guard + http_client: 서킷 브레이커 기록"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.guard = UpstreamGuard(os.path.join(tmp.name, "guard.sqlite3"))
+
+    def _breaker(self):
+        return self.guard._conn().execute("SELECT state, failures FROM upstream_breaker").fetchone()
+
+    def test_retried_call_counts_as_one_failure(self):
+        resp = mock.Mock(status_code=429, headers={})
+        with mock.patch.object(http_client, "get_guard", return_value=self.guard), \
+                mock.patch.object(http_client, "_backoff", return_value=0), \
+                mock.patch.object(http_client._session("api.openai.com"), "request", return_value=resp) as send:
+            self.assertEqual(http_client.post("https://api.openai.com/v1/chat/completions", retries=2).status_code, 429)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(self._breaker(), ("closed", 1))
+
+    def test_rate_limited_probe_does_not_keep_circuit_blocked(self):
+        for _ in range(5):
+            self.guard.record("openai", ok=False)
+        self.guard._conn().execute("UPDATE upstream_breaker SET open_until = 0")
+        with mock.patch.object(self.guard, "_take_token", return_value=60):
+            with self.assertRaises(UpstreamUnavailable) as cm:
+                self.guard.acquire("openai")
+        self.assertEqual(cm.exception.reason, "rate_limited")
+        # 시험 호출을 못 한 채 끝났으므로 다음 요청이 바로 시험 호출을 맡는다
+        self.guard.acquire("openai")
+        self.assertEqual(self._breaker()[0], "half_open")
+
+
+class RunShotsTests(SimpleTestCase):
+    """services.shot_executor.run_shots"""
+
+    def test_first_wave_reaching_consensus_never_sends_the_rest(self):
+        called, arrived = [], []
+        outcomes = run_shots(lambda item: called.append(item) or item, [1, 2, 3, 4],
+                             on_result=lambda idx, oc: arrived.append(idx) or len(arrived) == 2, first_wave=2)
+        self.assertEqual(sorted(called), [1, 2])
+        self.assertEqual([oc["status"] for oc in outcomes], ["ok", "ok", "skipped", "skipped"])
+
+    def test_rest_is_sent_when_first_wave_does_not_stop(self):
+        called = []
+        outcomes = run_shots(lambda item: called.append(item) or item, [1, 2, 3], first_wave=2)
+        self.assertEqual(sorted(called), [1, 2, 3])
+        self.assertEqual([oc["value"] for oc in outcomes], [1, 2, 3])
+
+
+class CascadeEscalateTests(SimpleTestCase):
+    """views._cascade_escalate: 저비용 모델 결과 중 신뢰도 낮은 필드만 상위 모델로"""
+
+    def _escalate(self, *shots):
+        reps = list(range(len(shots)))
+        outcome_of = {i: {"status": "ok", "value": ("", shot, None, "ok")} for i, shot in enumerate(shots)}
+        strong = {"patient_name": "홍길동", "medicine_name": "타이레놀정", "age": "70"}
+        with mock.patch.object(views, "_analyze_envelope_shot", return_value=("", strong, None, "ok")) as analyze:
+            result = views._cascade_escalate([b"x"] * len(shots), reps, outcome_of, {i: 1.0 for i in reps}, [])
+        return result, outcome_of, analyze
+
+    def test_field_empty_on_every_shot_is_escalated_on_all_shots(self):
+        result, outcome_of, analyze = self._escalate({"medicine_name": "타이레놀정"}, {"medicine_name": "타이레놀정"})
+        self.assertEqual(analyze.call_count, 2)
+        self.assertEqual(result["fields"]["patient_name"], {"confidence": 0.0, "low": True, "shots": [1, 2]})
+        self.assertFalse(result["fields"]["medicine_name"]["low"])
+        for i in (0, 1):
+            parsed = outcome_of[i]["value"][1]
+            self.assertEqual((parsed["patient_name"], parsed["medicine_name"]), ("홍길동", "타이레놀정"))
+
+    def test_only_disagreeing_shot_is_escalated(self):
+        result, _, analyze = self._escalate(*[{"medicine_name": n, "age": "70"} for n in ("타이레놀정", "타이레놀정", "게보린")])
+        self.assertEqual(result["fields"]["medicine_name"]["shots"], [3])
+        self.assertEqual(result["fields"]["patient_name"]["shots"], [1, 2, 3])
+        self.assertEqual(result["fields"]["age"], {"confidence": 1.0, "low": False, "shots": []})
+        self.assertEqual(sorted(result["escalated_of"]), [0, 1, 2])
+        self.assertEqual(result["escalated_of"][2]["fields"][0], "patient_name")
+
+
+class ScanEnvelopeNoUsableShotsTests(TestCase):
+    """POST /api/scan/envelope/ : 읽을 수 있는 샷이 없을 때"""
+
+    def test_undecodable_shots_return_400_without_saving(self):
+        from .models import EnvelopeScan
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "sk-test"}), \
+                mock.patch.object(views, "get_guard", return_value=None), \
+                mock.patch.object(views, "_analyze_envelope_shot") as analyze:
+            resp = self.client.post("/api/scan/envelope/", data=b"not an image", content_type="image/jpeg")
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["error"], "no_usable_shots")
+        self.assertEqual(resp.json()["quality"]["shots"][0]["reasons"], ["decode_failed"])
+        analyze.assert_not_called()
+        self.assertFalse(EnvelopeScan.objects.exists())
+
+
+class JSONRepairTests(SimpleTestCase):
+    """services.json_repair.loads_tolerant"""
+
+    def test_valid_json_is_not_repaired(self):
+        self.assertEqual(loads_tolerant('{"a": 1}'), ({"a": 1}, False))
+
+    def test_missing_comma_after_string_value(self):
+        self.assertEqual(loads_tolerant('{"a": "x" "b": 2}'), ({"a": "x", "b": 2}, True))
+
+    def test_missing_comma_after_literal_value(self):
+        self.assertEqual(loads_tolerant('{"a": 1 "b": 2}'), ({"a": 1, "b": 2}, True))
+        self.assertEqual(loads_tolerant('{"a": true\n "b": null}'), ({"a": True, "b": None}, True))
+
+    def test_missing_comma_between_array_items(self):
+        self.assertEqual(loads_tolerant('["a" "b", 1 "c"]'), (["a", "b", 1, "c"], True))
+
+    def test_truncated_response_drops_incomplete_pair(self):
+        obj, repaired = loads_tolerant('```json\n{"medicines": [{"name": "타이레놀", "dosage": "1정"}, {"name": "게보')
+        self.assertTrue(repaired)
+        self.assertEqual(obj, {"medicines": [{"name": "타이레놀", "dosage": "1정"}, {}]})
+
+
+class VoiceQueryTests(SimpleTestCase):
+    """services.voice_query.normalize_query"""
+
+    def test_strips_request_words_and_extracts_intent(self):
+        q = normalize_query("타이레놀 효능 알려줘")
+        self.assertEqual((q.search, q.intent), ("타이레놀", "effect"))
+
+    def test_spoken_strength(self):
+        q = normalize_query("음 타이레놀 오백 밀리그램은 어떻게 먹어요?")
+        self.assertEqual(q.terms, ("타이레놀",))
+        self.assertEqual(q.strengths, ("500밀리그램",))
+        self.assertEqual(q.intent, "usage")
+
+    def test_thousands_separator_in_strength(self):
+        for text in ("비타민C 1,000mg", "비타민C 1,000 밀리그램짜리"):
+            q = normalize_query(text)
+            self.assertEqual(q.terms, ("비타민C",))
+            self.assertEqual(q.strengths, ("1000밀리그램",))
+            self.assertEqual(q.search, "비타민C 1000밀리그램")
+
+    def test_decimal_strength(self):
+        self.assertEqual(normalize_query("자낙스 0.5mg").strengths, ("0.5밀리그램",))
@@ -25,6 +25,9 @@ urlpatterns = [
     path("api/conversation/download/", views.api_conversation_download),
 
     path("api/scan/envelope/", views.api_scan_envelope, name="api_scan_envelope"),
+    path("api/scan/jobs/<str:job_id>/", views.api_scan_job_status, name="api_scan_job_status"),
+    path("api/scan/jobs/<str:job_id>/events/", views.api_scan_job_events, name="api_scan_job_events"),
+    path("api/upstream/stats/", views.api_upstream_stats, name="api_upstream_stats"),
 
     # ElevenLabs 음성 관련 API
     path("voice_setup/", views.voice_setup, name="voice_setup"),
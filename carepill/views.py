@@ -1,6 +1,10 @@
 import os, requests
+from functools import wraps
 from django.http import JsonResponse
 from django.shortcuts import render
+from .services import http_client
+from .services.upstream_guard import UpstreamUnavailable, get_guard
+from .services.json_repair import stats as json_repair_stats
 
 def home(request):  return render(request, "carepill/home.html")
 def scan(request):  return render(request, "carepill/scan.html")
@@ -15,8 +19,28 @@ def how2green(request): return render(request, "carepill/how2green.html")
 def how2green_result(request): return render(request, "carepill/how2green_result.html")
 def stt_test(request): return render(request, "carepill/stt_test.html")
 
+def _upstream_unavailable(e):
+    """속도 제한/서킷 차단으로 업스트림을 부르지 않은 경우의 503 응답"""
+    resp = JsonResponse({"error": "upstream_unavailable", "provider": e.provider,
+                         "reason": e.reason, "retry_after": e.retry_after}, status=503)
+    resp["Retry-After"] = str(e.retry_after)
+    return resp
+
+
+def _fail_fast_on_overload(view):
+    """뷰 안에서 UpstreamUnavailable이 나면 503으로 바로 응답"""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except UpstreamUnavailable as e:
+            return _upstream_unavailable(e)
+    return wrapped
+
+
+@_fail_fast_on_overload
 def issue_ephemeral(request):
-    r = requests.post(
+    r = http_client.post(
         "https://api.openai.com/v1/realtime/sessions",
         headers={
             "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
@@ -92,7 +116,7 @@ def realtime_sdp_exchange(request):
         return JsonResponse({"error": "empty_offer_sdp"}, status=400)
 
     try:
-        upstream = requests.post(
+        upstream = http_client.post(
             "https://api.openai.com/v1/realtime?model=gpt-4o-mini-realtime-preview-2024-12-17",
             headers={
                 "Authorization": auth,                   # Bearer ek_... (ephemeral)
@@ -102,6 +126,8 @@ def realtime_sdp_exchange(request):
             data=offer_sdp,
             timeout=20,
         )
+    except UpstreamUnavailable as e:
+        return _upstream_unavailable(e)
     except requests.RequestException as e:
         return JsonResponse({"error": "upstream_network_error", "detail": str(e)}, status=502)
 
@@ -336,7 +362,7 @@ def api_conversation_summarize_and_save(request):
 
     t1 = time.time()
     try:
-        resp = requests.post(
+        resp = http_client.post(
             OPENAI_API_URL,
             headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
             json={
@@ -370,6 +396,10 @@ def api_conversation_summarize_and_save(request):
         summary_text = (data["choices"][0]["message"]["content"] or "").strip()
         if not summary_text:
             summary_text = "대화 요약: (생성 실패)"
+    except UpstreamUnavailable as e:
+        debug["upstream_unavailable"] = str(e)
+        if debug_mode: _save_debug(rid, debug)
+        return _upstream_unavailable(e)
     except Exception as e:
         debug["exception"] = (traceback.format_exc() or str(e))[-1000:]
         debug["server_elapsed_ms"] = int((time.time() - t0) * 1000)
@@ -411,7 +441,7 @@ def api_conversation_summarize_and_save(request):
 
 import os, re, json, time, uuid, traceback, datetime, logging, requests
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 
@@ -455,106 +485,334 @@ from collections import Counter
 from typing import List, Dict, Tuple
 import os
 import requests
+import base64
+import binascii
+import hashlib
+from datetime import date
+from .services.shot_executor import run_shots
+from .services.vision_cache import get_cache, make_key
+from .services.streaming_body import ImageJSONBody, image_placeholder
+from .services import scan_jobs
+from .services import http_client
+from .services.json_repair import VISION_STRUCTURED_OUTPUT, loads_tolerant, parse_model_json
+from .services.medicine_index import CATALOG_TOP_K, CATALOG_MATCH_MIN_SCORE, get_index as get_medicine_index
+
+from .vision.dedup import cluster_shots
+from .vision.preprocess import PREPROCESS_ENABLED, preprocess_envelope, signature as preprocess_signature
+from .vision.fusion import fuse_frames
+from .vision.quality import QUALITY_GATE_ENABLED, assess_frames
+
+# 프롬프트를 바꾸면 버전을 올릴 것 (Vision 캐시 키에 포함됨)
+# 캐시 키는 전처리 전 원본 업로드 바이트 + 전처리 설정(preprocess.signature) + 모델 + 프롬프트 버전
+ENVELOPE_PROMPT_VERSION = "envelope-v2"
+ENVELOPE_BATCH_PROMPT_VERSION = "envelope-batch-v2"
+
+# 스키마 고정 출력 (VISION_STRUCTURED_OUTPUT): 코드펜스/설명/필드 누락 없이 JSON만 받는다
+# 깨진 응답은 json_repair로 살리고, 그래도 안 되면 그 샷만 {}
+
+# 스캔 모드: per_shot (샷마다 요청 1번, 기본) | batch (한 봉투의 샷 전부를 요청 1번에)
+#          | fused (샷 전부를 정렬/합성한 1장만 요청 1번, 합성 방식은 FUSION_METHOD)
+SCAN_MODE = os.getenv("SCAN_MODE", "per_shot")
+SCAN_MODES = ("per_shot", "batch", "fused")
+
+# 모델 캐스케이드: 모든 샷을 저비용 모델로 먼저 분석하고,
+# 병합 신뢰도가 임계값 미만인 필드만 그 필드가 다수와 다른 샷에 한해 상위 모델로 재분석
+SCAN_CASCADE = os.getenv("SCAN_CASCADE", "1") == "1"
+SCAN_FAST_MODEL = os.getenv("SCAN_FAST_MODEL", "gpt-4o-mini")
+SCAN_STRONG_MODEL = os.getenv("SCAN_STRONG_MODEL", "gpt-4o")
+SCAN_CASCADE_THRESHOLD = float(os.getenv("SCAN_CASCADE_THRESHOLD", "0.67"))
+# 분석할 대표 샷이 1장뿐일 때 (샷 간 비교로 신뢰도를 낼 수 없음)
+# strong: 처음부터 상위 모델로 1번 | empty: 저비용 모델로 읽고 빈 필드만 상위 모델로 재분석
+SCAN_CASCADE_SINGLE = os.getenv("SCAN_CASCADE_SINGLE", "strong")
+ENVELOPE_FIELDS = ["patient_name", "age", "dispense_date", "pharmacy_name", "prescription_number",
+                   "medicine_name", "dosage_instructions", "frequency"]
+
+ENVELOPE_SYSTEM_PROMPT = (
+    "당신은 한국 약국 처방전과 약봉투를 정확하게 읽는 OCR 전문가입니다. "
+    "한글 약품명, 한국식 날짜 형식, 한국 약국 시스템을 완벽하게 이해합니다. "
+    "반드시 유효한 JSON만 출력하며, 불명확한 정보는 빈 문자열로 처리합니다. "
+    "이미지 품질이 낮거나 흐릿해도 최선을 다해 정보를 추출합니다."
+)
+
+ENVELOPE_TEXT_PROMPT = (
+    "당신은 한국 약봉투 OCR 전문가입니다. 아래 이미지에서 정확한 정보를 추출하세요.\n\n"
+    "**중요한 한국 약봉투 특징:**\n"
+    "- 환자명, 나이는 상단에 표시됨\n"
+    "- 조제일자는 'YYYY.MM.DD' 또는 'YYYY-MM-DD' 형식\n"
+    "- 약국명은 봉투 상단 또는 하단에 표시\n"
+    "- 처방전번호/조제번호는 숫자로 된 긴 코드\n"
+    "- 약품명은 여러 개일 수 있으며, 가장 주요한 약 하나를 선택\n"
+    "- 복용법: '1일 3회', '아침 저녁 식후 30분', '취침 전' 등\n"
+    "- 복용기간: '총 7일분', '30일분', '1회 복용' 등\n\n"
+    "**출력 형식 (반드시 유효한 JSON만, 코드펜스 없이):**\n"
+    "{\n"
+    '  "patient_name": "환자 이름",\n'
+    '  "age": "숫자만 (예: 45)",\n'
+    '  "dispense_date": "YYYY-MM-DD 형식",\n'
+    '  "pharmacy_name": "○○약국",\n'
+    '  "prescription_number": "처방/조제번호",\n'
+    '  "medicine_name": "주요 약품명 (여러 개면 대표 약 1개)",\n'
+    '  "dosage_instructions": "복용 시간과 방법",\n'
+    '  "frequency": "복용 횟수와 기간",\n'
+    '  "med_features": {\n'
+    '    "description": "약의 용도 한 줄 설명 (예: 해열진통제, 소화제)",\n'
+    '    "indications": "적응증 (두통, 발열, 소화불량 등)",\n'
+    '    "cautions": "주의사항 (공복 섭취 금지, 졸음 유발 등)"\n'
+    "  }\n"
+    "}\n\n"
+    "**규칙:**\n"
+    "1. 이미지에서 명확히 보이는 정보만 입력\n"
+    "2. 불명확하거나 없는 정보는 빈 문자열 \"\" 사용\n"
+    "3. 날짜는 반드시 YYYY-MM-DD 형식으로 변환\n"
+    "4. 나이는 숫자만 추출\n"
+    "5. 설명 문구 없이 JSON만 출력\n"
+    "6. 코드펜스(```)는 사용하지 말 것"
+)
+
+# batch 모드: 같은 봉투의 여러 샷을 한 번에 보내고 이미지별 JSON 배열을 받는다
+# (샷끼리 서로 베끼지 않도록 각 이미지를 독립적으로 읽게 한다 - 병합 투표가 의미 있도록)
+ENVELOPE_BATCH_SUFFIX = (
+    "**여러 장 모드:**\n"
+    "- 아래 이미지 {n}장은 같은 약봉투를 연속 촬영한 것입니다.\n"
+    "- 각 이미지를 다른 이미지를 참고하지 말고 독립적으로 읽으세요.\n"
+    "- 출력은 {{\"shots\": [이미지1 JSON, 이미지2 JSON, ...]}} 형식 (이미지 순서대로 정확히 {n}개)\n"
+    "- 각 원소는 위 출력 형식과 같은 JSON 객체"
+)
+
+
+ENVELOPE_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        **{k: {"type": "string"} for k in ENVELOPE_FIELDS},
+        "med_features": {
+            "type": "object",
+            "properties": {k: {"type": "string"} for k in ("description", "indications", "cautions")},
+            "required": ["description", "indications", "cautions"],
+            "additionalProperties": False,
+        },
+    },
+    "required": ENVELOPE_FIELDS + ["med_features"],
+    "additionalProperties": False,
+}
+ENVELOPE_BATCH_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {"shots": {"type": "array", "items": ENVELOPE_JSON_SCHEMA}},
+    "required": ["shots"],
+    "additionalProperties": False,
+}
+
+
+def _response_format(name: str, schema: Dict) -> Dict:
+    """structured output 켜져 있으면 json_schema(strict), 아니면 json_object"""
+    if not VISION_STRUCTURED_OUTPUT:
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def _add_usage(usage, data):
+    """usage dict에 응답의 토큰 사용량을 누적 (usage가 None이면 무시)"""
+    if usage is None:
+        return
+    for k, v in (data.get("usage") or {}).items():
+        if isinstance(v, int):
+            usage[k] = usage.get(k, 0) + v
+
+
+def _b64_to_bytes(image_b64: str) -> bytes:
+    """base64(data URL 접두사 허용) → 이미지 바이트. 잘못된 base64면 ValueError"""
+    image_b64 = re.sub(r'^data:image\/(png|jpeg);base64,', '', image_b64, flags=re.I)
+    try:
+        return base64.b64decode(image_b64)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"invalid base64 image: {e}")
+
 
-def _call_openai_envelope(image_b64: str, model: str = "gpt-4o") -> str:
+def _envelope_cache_key(raw: bytes, model: str, prompt_version: str) -> str:
+    """원본 업로드 바이트(전처리 전) + 전처리 설정 + 모델 + 프롬프트 버전 → Vision 캐시 키"""
+    return make_key(raw, model, f"{prompt_version}|{preprocess_signature()}")
+
+
+def _call_openai_envelope(image_bytes: bytes, model: str = "gpt-4o", usage: Dict = None, cache_key: str = None) -> str:
     """
     한국 약봉투 이미지를 OCR/분석하여 구조화된 JSON 추출
+    image_bytes: JPEG 바이트 (base64 인코딩은 요청 전송 중에 스트리밍으로 수행)
     model: gpt-4o (고정확도) 또는 gpt-4o-mini (저비용)
+    usage: dict를 넘기면 토큰 사용량(prompt_tokens 등)을 누적
+    cache_key: 넘기면 파싱 가능한 응답을 이 키로 Vision 캐시에 저장 (조회는 호출부가 전처리 전에)
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY가 설정되지 않았습니다.")
 
-    text_prompt = (
-        "당신은 한국 약봉투 OCR 전문가입니다. 아래 이미지에서 정확한 정보를 추출하세요.\n\n"
-        "**중요한 한국 약봉투 특징:**\n"
-        "- 환자명, 나이는 상단에 표시됨\n"
-        "- 조제일자는 'YYYY.MM.DD' 또는 'YYYY-MM-DD' 형식\n"
-        "- 약국명은 봉투 상단 또는 하단에 표시\n"
-        "- 처방전번호/조제번호는 숫자로 된 긴 코드\n"
-        "- 약품명은 여러 개일 수 있으며, 가장 주요한 약 하나를 선택\n"
-        "- 복용법: '1일 3회', '아침 저녁 식후 30분', '취침 전' 등\n"
-        "- 복용기간: '총 7일분', '30일분', '1회 복용' 등\n\n"
-        "**출력 형식 (반드시 유효한 JSON만, 코드펜스 없이):**\n"
-        "{\n"
-        '  "patient_name": "환자 이름",\n'
-        '  "age": "숫자만 (예: 45)",\n'
-        '  "dispense_date": "YYYY-MM-DD 형식",\n'
-        '  "pharmacy_name": "○○약국",\n'
-        '  "prescription_number": "처방/조제번호",\n'
-        '  "medicine_name": "주요 약품명 (여러 개면 대표 약 1개)",\n'
-        '  "dosage_instructions": "복용 시간과 방법",\n'
-        '  "frequency": "복용 횟수와 기간",\n'
-        '  "med_features": {\n'
-        '    "description": "약의 용도 한 줄 설명 (예: 해열진통제, 소화제)",\n'
-        '    "indications": "적응증 (두통, 발열, 소화불량 등)",\n'
-        '    "cautions": "주의사항 (공복 섭취 금지, 졸음 유발 등)"\n'
-        "  }\n"
-        "}\n\n"
-        "**규칙:**\n"
-        "1. 이미지에서 명확히 보이는 정보만 입력\n"
-        "2. 불명확하거나 없는 정보는 빈 문자열 \"\" 사용\n"
-        "3. 날짜는 반드시 YYYY-MM-DD 형식으로 변환\n"
-        "4. 나이는 숫자만 추출\n"
-        "5. 설명 문구 없이 JSON만 출력\n"
-        "6. 코드펜스(```)는 사용하지 말 것"
-    )
-
     payload = {
         "model": model,
         "messages": [
             {
                 "role": "system",
-                "content": (
-                    "당신은 한국 약국 처방전과 약봉투를 정확하게 읽는 OCR 전문가입니다. "
-                    "한글 약품명, 한국식 날짜 형식, 한국 약국 시스템을 완벽하게 이해합니다. "
-                    "반드시 유효한 JSON만 출력하며, 불명확한 정보는 빈 문자열로 처리합니다. "
-                    "이미지 품질이 낮거나 흐릿해도 최선을 다해 정보를 추출합니다."
-                )
+                "content": ENVELOPE_SYSTEM_PROMPT
             },
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": text_prompt},
+                    {"type": "text", "text": ENVELOPE_TEXT_PROMPT},
                     {"type": "image_url",
-                     "image_url": {"url": f"data:image/jpeg;base64,{image_b64}", "detail": "high"}}
+                     "image_url": {"url": f"data:image/jpeg;base64,{image_placeholder(0)}", "detail": "high"}}
                 ]
             }
         ],
         "max_tokens": 1500,
-        "temperature": 0.0
+        "temperature": 0.0,
+        "response_format": _response_format("envelope", ENVELOPE_JSON_SCHEMA),
     }
 
-    r = requests.post(
+    r = http_client.post(
         "https://api.openai.com/v1/chat/completions",
         headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-        json=payload,
+        data=ImageJSONBody(payload, [image_bytes]),
         timeout=60
         )
     if r.status_code != 200:
         raise RuntimeError(f"OpenAI 오류 {r.status_code}: {r.text[:200]}")
     data = r.json()
-    return data["choices"][0]["message"]["content"]
+    _add_usage(usage, data)
+    content = data["choices"][0]["message"]["content"]
 
+    # 파싱 가능한 응답만 캐시 (깨진 응답이 재스캔 때마다 재사용되지 않도록)
+    cache = get_cache() if cache_key else None
+    if cache:
+        try:
+            loads_tolerant(content)
+            cache.put(cache_key, content, kind="envelope", model=model)
+        except (TypeError, ValueError):
+            pass
+    return content
 
 
+def _call_openai_envelope_batch(images: List[bytes], model: str = "gpt-4o", usage: Dict = None,
+                                cache_key: str = None) -> str:
+    """
+    같은 약봉투의 샷 여러 장을 요청 1번으로 분석 ({"shots": [...]} JSON 문자열 반환)
+    시스템 메시지/프롬프트를 샷마다 반복 전송하지 않아 요청당 고정 비용이 한 번만 든다.
+    cache_key: 넘기면 파싱 가능한 응답을 이 키로 Vision 캐시에 저장 (조회는 호출부가 전처리 전에)
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY가 설정되지 않았습니다.")
 
+    content = [{"type": "text", "text": ENVELOPE_TEXT_PROMPT + "\n\n" + ENVELOPE_BATCH_SUFFIX.format(n=len(images))}]
+    for i in range(len(images)):
+        content.append({"type": "text", "text": f"[이미지 {i + 1}]"})
+        content.append({"type": "image_url",
+                        "image_url": {"url": f"data:image/jpeg;base64,{image_placeholder(i)}", "detail": "high"}})
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": ENVELOPE_SYSTEM_PROMPT},
+            {"role": "user", "content": content},
+        ],
+        "max_tokens": 1500 * len(images),
+        "temperature": 0.0,
+        "response_format": _response_format("envelope_batch", ENVELOPE_BATCH_JSON_SCHEMA),
+    }
+
+    r = http_client.post(
+        "https://api.openai.com/v1/chat/completions",
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        data=ImageJSONBody(payload, images),
+        timeout=60 + 15 * len(images)
+        )
+    if r.status_code != 200:
+        raise RuntimeError(f"OpenAI 오류 {r.status_code}: {r.text[:200]}")
+    data = r.json()
+    _add_usage(usage, data)
+    text = data["choices"][0]["message"]["content"]
 
-def _majority_merge(values: List[str]) -> Tuple[str, float]:
-    cleaned = [ (v or "").strip() for v in values if isinstance(v, str) ]
-    non_empty = [v for v in cleaned if v]
-    if not non_empty: return "", 0.0
-    cnt = Counter(non_empty)
+    cache = get_cache() if cache_key else None
+    if cache:
+        try:
+            loads_tolerant(text)
+            cache.put(cache_key, text, kind="envelope_batch", model=model)
+        except (TypeError, ValueError):
+            pass
+    return text
+
+
+
+
+
+def _analyze_envelope_shot(image_bytes: bytes, usage: Dict = None, model: str = SCAN_STRONG_MODEL) -> Tuple[str, Dict, Dict, str]:
+    """샷 1장 분석: Vision 캐시 조회 → (없으면) 전처리 → Vision 호출 → JSON 파싱 (깨진 JSON은 복구 시도, 실패 시 {})
+    캐시는 원본 바이트로 찾으므로 재스캔은 디코딩/검출/보정/재인코딩 없이 적중한다 (전처리 정보는 None)
+    반환: (cleaned, parsed, 전처리 정보 또는 None, 파싱 결과 ok|repaired|failed)"""
+    if not image_bytes:
+        raise ValueError("빈 이미지")
+    cache = get_cache()
+    cache_key = _envelope_cache_key(image_bytes, model, ENVELOPE_PROMPT_VERSION) if cache else None
+    raw = cache.get(cache_key) if cache else None
+    prep = None
+    if raw is None:
+        if PREPROCESS_ENABLED:
+            image_bytes, prep = preprocess_envelope(image_bytes)
+        raw = _call_openai_envelope(image_bytes, model=model, usage=usage, cache_key=cache_key)
+    cleaned = _strip_code_fence(raw)
+    parsed, parse_status = parse_model_json(cleaned, "envelope")
+    if not isinstance(parsed, dict):
+        parsed = {}
+    return cleaned, parsed, prep, parse_status
+
+
+def _analyze_envelope_batch(images: List[bytes], usage: Dict = None, model: str = SCAN_STRONG_MODEL) -> List[Tuple[str, Dict, Dict]]:
+    """batch 모드: 샷 전부를 요청 1번으로 분석.
+    반환: 샷 순서대로 [(cleaned, parsed, 전처리 정보, 파싱 결과), ...] (_analyze_envelope_shot과 같은 형식)
+    응답 배열이 모자라거나 원소가 객체가 아니면 해당 샷은 {} (파싱 결과 failed)"""
+    if not images or not all(images):
+        raise ValueError("빈 이미지")
+    cache = get_cache()
+    cache_key = None
+    if cache:
+        # 샷별 원본 해시를 순서대로 이은 값
+        digest = b"".join(hashlib.sha256(b).digest() for b in images)
+        cache_key = _envelope_cache_key(digest, model, ENVELOPE_BATCH_PROMPT_VERSION)
+    raw = cache.get(cache_key) if cache else None
+    preps = [None] * len(images)
+    if raw is None:
+        if PREPROCESS_ENABLED:
+            pairs = [preprocess_envelope(b) for b in images]
+            images = [b for b, _ in pairs]
+            preps = [p for _, p in pairs]
+        raw = _call_openai_envelope_batch(images, model=model, usage=usage, cache_key=cache_key)
+    obj, parse_status = parse_model_json(raw, "envelope_batch")
+    shots = obj.get("shots") if isinstance(obj, dict) else None
+    if not isinstance(shots, list):
+        shots = []
+    out = []
+    for i in range(len(images)):
+        ok = i < len(shots) and isinstance(shots[i], dict) and shots[i]
+        parsed = shots[i] if ok else {}
+        out.append((json.dumps(parsed, ensure_ascii=False), parsed, preps[i], parse_status if ok else "failed"))
+    return out
+
+
+def _majority_merge(values: List[str], weights: List[float] = None) -> Tuple[str, float]:
+    """가중 다수결. weights가 없으면 샷마다 1표 (동률이면 가장 긴 문자열)"""
+    if weights is None: weights = [1] * len(values)
+    cnt = Counter()
+    for v, w in zip(values, weights):
+        v = (v or "").strip() if isinstance(v, str) else ""
+        if v: cnt[v] += w
+    if not cnt: return "", 0.0
     top = cnt.most_common(); top_freq = top[0][1]
     candidates = [v for v,c in top if c==top_freq]
     winner = max(candidates, key=lambda s: len(s))
-    conf = cnt[winner] / max(1,len(values))
+    conf = cnt[winner] / max(1,sum(weights))
     return winner, round(conf,3)
 
 def _digits_only(s: str) -> str: return "".join(ch for ch in (s or "") if ch.isdigit())
 
-def _merge_envelope_json(json_list: List[Dict]) -> Tuple[Dict, Dict]:
-    fields = ["patient_name","age","dispense_date","pharmacy_name","prescription_number","medicine_name","dosage_instructions","frequency"]
+def _merge_envelope_json(json_list: List[Dict], weights: List[float] = None) -> Tuple[Dict, Dict]:
+    """샷별 JSON을 필드별 (가중) 다수결로 병합. weights: 샷별 투표 가중치 (중복 묶음 크기 등)"""
+    w = weights
+    fields = ENVELOPE_FIELDS
     merged, diag = {}, {}
     results=[]
     for d in json_list:
@@ -567,25 +825,90 @@ def _merge_envelope_json(json_list: List[Dict]) -> Tuple[Dict, Dict]:
     for k in fields:
         vals = [str(r.get(k, "") or "").strip() for r in results]
         if k == "age":
-            norm=[_digits_only(v) for v in vals]; best,conf=_majority_merge(norm)
+            norm=[_digits_only(v) for v in vals]; best,conf=_majority_merge(norm, w)
             merged[k]=best; diag[k]={"per_shot":vals,"normalized":norm,"selected":best,"confidence":conf}
         elif k == "prescription_number":
-            only=[_digits_only(v) for v in vals]; best_d,conf_d=_majority_merge(only)
+            only=[_digits_only(v) for v in vals]; best_d,conf_d=_majority_merge(only, w)
             if best_d: merged[k]=best_d; diag[k]={"per_shot":vals,"digits_only":only,"selected":best_d,"confidence":conf_d}
-            else: best,conf=_majority_merge(vals); merged[k]=best; diag[k]={"per_shot":vals,"selected":best,"confidence":conf}
+            else: best,conf=_majority_merge(vals, w); merged[k]=best; diag[k]={"per_shot":vals,"selected":best,"confidence":conf}
         else:
-            best,conf=_majority_merge(vals); merged[k]=best; diag[k]={"per_shot":vals,"selected":best,"confidence":conf}
+            best,conf=_majority_merge(vals, w); merged[k]=best; diag[k]={"per_shot":vals,"selected":best,"confidence":conf}
     for subk in ["description","indications","cautions"]:
-        key=f"_mf_{subk}"; vals=[r.get(key,"") for r in results]; best,conf=_majority_merge(vals); diag[key] = {"per_shot":vals,"selected":best,"confidence":conf}
+        key=f"_mf_{subk}"; vals=[r.get(key,"") for r in results]; best,conf=_majority_merge(vals, w); diag[key] = {"per_shot":vals,"selected":best,"confidence":conf}
     merged["med_features"] = {"description":diag["_mf_description"]["selected"],"indications":diag["_mf_indications"]["selected"],"cautions":diag["_mf_cautions"]["selected"]}
     del diag["_mf_description"]; del diag["_mf_indications"]; del diag["_mf_cautions"]
     return merged, diag
 
+# ===== 조기 합의 (Early consensus) =====
+SCAN_EARLY_CONSENSUS = os.getenv("SCAN_EARLY_CONSENSUS", "1") == "1"
+SCAN_CONSENSUS_QUORUM = int(os.getenv("SCAN_CONSENSUS_QUORUM", "2"))
+CONSENSUS_FIELDS = ["medicine_name", "dispense_date", "prescription_number", "dosage_instructions"]
+
+
+class IncrementalEnvelopeMerger:
+    """샷 결과가 도착할 때마다 핵심 필드 투표를 갱신하고,
+    모든 핵심 필드에 안정적인 다수가 생기면 조기 종료를 알린다.
+
+    안정적 다수: 필드마다 최다 값이 quorum 이상이고 분석된 샷의 과반
+    (빈 값도 한 표로 센다. 단 medicine_name은 비어 있으면 합의로 보지 않음)
+    """
+
+    def __init__(self, quorum: int = None):
+        self.quorum = max(1, quorum or SCAN_CONSENSUS_QUORUM)
+        self.votes = {k: Counter() for k in CONSENSUS_FIELDS}
+        self.seen = 0
+        self.reached_after = None  # 합의에 도달한 시점까지 분석된 샷 수
+
+    @staticmethod
+    def _norm(field: str, value) -> str:
+        v = re.sub(r"\s+", " ", str(value or "")).strip()
+        return _digits_only(v) if field == "prescription_number" else v
+
+    def add(self, parsed: Dict) -> bool:
+        """분석된 샷 1장 반영. 합의에 도달했으면 True"""
+        self.seen += 1
+        for k in CONSENSUS_FIELDS:
+            self.votes[k][self._norm(k, (parsed or {}).get(k))] += 1
+        if self.reached_after is None and self._stable():
+            self.reached_after = self.seen
+        return self.reached_after is not None
+
+    def _stable(self) -> bool:
+        if self.seen < self.quorum:
+            return False
+        for k, cnt in self.votes.items():
+            value, top = cnt.most_common(1)[0]
+            if top < self.quorum or top * 2 <= self.seen:
+                return False
+            if k == "medicine_name" and not value:
+                return False
+        return True
+
+
 @csrf_exempt
 def api_scan_envelope(request):
     """POST { images: [base64_jpeg_without_prefix, ...], meta?: [{camera_index, shot_index, deviceId}, ...] }
+       또는 multipart/form-data: images=<file> x 최대 9개 (+ meta=<JSON 문자열>), 단일 image=<file> 도 허용
+       또는 image/jpeg(application/octet-stream) 본문 1장
        - 카메라를 1~3대 선택하고 각 3연사(총 3~9장) 이미지를 보냄.
+       - 바이너리 업로드는 base64 팽창(+33%) 없이 그대로 처리 (base64는 업스트림 전송 시 스트리밍)
        - meta 는 선택사항이며, 진단 정보에만 사용.
+       - 샷별 Vision 호출은 병렬 실행 (SCAN_MAX_WORKERS, SCAN_DEADLINE_S)
+       - 핵심 필드가 합의되면 남은 샷은 생략 (SCAN_EARLY_CONSENSUS, SCAN_CONSENSUS_QUORUM):
+         quorum 장만 먼저 보내고 합의가 안 됐을 때만 나머지 샷을 보낸다
+       - 거의 같은 샷(dHash)은 대표 1장만 분석하고 묶음 크기로 가중 투표 (DEDUP_MAX_DISTANCE)
+       - 업로드 전 약봉투 검출 + 원근 보정(배경 제거)/축소/재인코딩 후 절약한 바이트를 preprocess에 보고
+       - 흔들림/반사광/노출 불량 샷은 분석하지 않고, 나머지는 품질 점수를 병합 가중치로 사용 (QUALITY_*)
+       - 병합된 약품명을 의약품 카탈로그(medicines)에 퍼지 매칭해 상위 후보와 TTS 문구를 catalog에 포함
+         (SCAN_CATALOG_RESOLVE, CATALOG_TOP_K, CATALOG_MATCH_MIN_SCORE) - 별도 검색 요청 불필요
+       - 로그인 사용자가 같은 처방(처방번호 + 조제일자)을 다시 스캔하면 첫 샷 이후 분석을 멈추고
+         저장된 결과와 record_id를 반환 (existing_record: true, SCAN_RX_DEDUP)
+       - mode=per_shot|batch|fused (쿼리/JSON/폼 필드, 기본 SCAN_MODE): batch는 샷 전부를 Vision 요청 1번에 보냄,
+         fused는 샷들을 정렬/합성(반사광 제거)한 1장만 분석
+       - ?async=1 (또는 JSON async: true / 폼 필드 async=1): 202로 job id만 바로 반환하고
+         분석은 워커 풀에서 진행. 진행 상황은 GET /api/scan/jobs/<job_id>/events/ (SSE)
+         대기 중인 작업이 SCAN_JOB_MAX_PENDING개면 503 scan_queue_full (+ Retry-After)
+       - 읽을 수 있는 샷이 하나도 없으면 저장 없이 400 no_usable_shots (비동기 작업은 error 이벤트)
     """
     if request.method != "POST":
         return JsonResponse({"error":"method_not_allowed"}, status=405)
@@ -594,87 +917,554 @@ def api_scan_envelope(request):
     if not api_key:
         return JsonResponse({"error":"missing_api_key"}, status=500)
 
-    images_b64 = []
+    images = []   # 샷별 원본 이미지 바이트
     meta_in = []
+    async_mode = request.GET.get('async') == '1'
+    mode = request.GET.get('mode')
     ctype = (request.headers.get('Content-Type') or '').lower()
     try:
         if 'application/json' in ctype:
             payload = json.loads(request.body.decode('utf-8'))
             arr = payload.get('images') or []
             if not isinstance(arr, list): arr=[]
-            images_b64 = [str(x or '').strip() for x in arr][:9]  # 최대 9장
+            images = [_b64_to_bytes(str(x or '').strip()) for x in arr[:9]]  # 최대 9장
             meta_in = payload.get('meta') or []
+            async_mode = async_mode or payload.get('async') is True
+            mode = mode or payload.get('mode')
+            del payload, arr
+        elif 'multipart/form-data' in ctype:
+            files = request.FILES.getlist('images') or request.FILES.getlist('image')
+            if not files: return JsonResponse({"error":"no_image"}, status=400)
+            images = [f.read() for f in files[:9]]  # 최대 9장
+            meta_in = json.loads(request.POST.get('meta') or '[]')
+            async_mode = async_mode or request.POST.get('async') == '1'
+            mode = mode or request.POST.get('mode')
+            if not meta_in and len(images) == 1:
+                meta_in = [{"camera_index":1, "shot_index":1, "deviceId":"upload"}]
         else:
-            f = request.FILES.get('image')
-            if not f: return JsonResponse({"error":"no_image"}, status=400)
-            images_b64 = [ (f.read()).decode('latin1') ]
+            # image/jpeg 등 바이너리 본문 1장
+            if not request.body: return JsonResponse({"error":"no_image"}, status=400)
+            images = [request.body]
             meta_in = [{"camera_index":1, "shot_index":1, "deviceId":"upload"}]
+        if not isinstance(meta_in, list): meta_in = []
     except Exception as e:
         return JsonResponse({"error":"bad_payload","detail":str(e)}, status=400)
 
-    if not images_b64:
+    if not images:
         return JsonResponse({"error":"no_images"}, status=400)
+    # OpenAI 서킷이 열려 있으면 전처리/분석을 시작하지 않고 바로 503
+    guard = get_guard()
+    blocked = guard.retry_after("openai") if guard else None
+    if blocked is not None:
+        return _upstream_unavailable(UpstreamUnavailable("openai", "circuit_open", blocked))
+    mode = mode or SCAN_MODE
+    if mode not in SCAN_MODES:
+        return JsonResponse({"error":"bad_mode","detail":f"mode는 {', '.join(SCAN_MODES)} 중 하나"}, status=400)
+
+    user = request.user if request.user.is_authenticated else None
+    if async_mode:
+        job = scan_jobs.submit(_run_envelope_pipeline, images, meta_in, user, mode=mode)
+        if job is None:
+            # 대기 중인 스캔 작업이 SCAN_JOB_MAX_PENDING개: 업로드를 메모리에 더 쌓지 않고 돌려보낸다
+            resp = JsonResponse({"error": "scan_queue_full", "retry_after": scan_jobs.SCAN_JOB_RETRY_AFTER_S}, status=503)
+            resp["Retry-After"] = str(scan_jobs.SCAN_JOB_RETRY_AFTER_S)
+            return resp
+        return JsonResponse({
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/api/scan/jobs/{job.id}/",
+            "events_url": f"/api/scan/jobs/{job.id}/events/",
+        }, status=202)
+    try:
+        return JsonResponse(_run_envelope_pipeline(images, meta_in, user, mode=mode), status=200)
+    except NoUsableShots as e:
+        return JsonResponse({"error": "no_usable_shots", "detail": "분석할 수 있는 샷이 없습니다 (이미지를 읽을 수 없음)",
+                             "quality": e.quality}, status=400)
 
-    shots_raw=[]; json_list=[]
-    for idx,b64 in enumerate(images_b64,1):
-        b64 = re.sub(r'^data:image\/(png|jpeg);base64,', '', b64, flags=re.I)
-        try:
-            raw = _call_openai_envelope(b64)
-            cleaned = _strip_code_fence(raw)
-            try:
-                parsed = json.loads(cleaned)
-            except Exception:
-                parsed = {}
-            meta_obj = meta_in[idx-1] if idx-1 < len(meta_in) else None
-            shots_raw.append({"index": idx, "raw": cleaned, "json": parsed, "image_path": f"client_shot_{idx}", "meta": meta_obj})
-            json_list.append(parsed)
-        except Exception as e:
-            meta_obj = meta_in[idx-1] if idx-1 < len(meta_in) else None
-            shots_raw.append({"index": idx, "raw": f"ERROR: {e}", "json": {}, "image_path": None, "meta": meta_obj})
-            json_list.append({})
 
-    merged, diag = _merge_envelope_json(json_list)
+# 같은 처방 재스캔: 첫 샷에서 처방번호 + 조제일자가 나오고 그 사용자의 기록이 이미 있으면
+# 남은 샷 분석을 멈추고 저장된 결과를 돌려준다 (로그인 사용자만 - 비로그인 공용 계정끼리는 섞지 않음)
+SCAN_RX_DEDUP = os.getenv("SCAN_RX_DEDUP", "1") == "1"
+_DATE_RE = re.compile(r"(\d{4})\D{0,3}(\d{1,2})\D{0,3}(\d{1,2})")
 
-    # DB에 저장 (PillIdentification 모델 사용)
-    saved_id = None
+
+def _parse_dispense_date(s: str):
+    """'2024-01-05', '2024.1.5', '2024년 1월 5일' 등 → date, 못 읽으면 None"""
+    m = _DATE_RE.search(str(s or ""))
+    if not m:
+        return None
     try:
-        from .models import PillIdentification
-        from django.contrib.auth.models import User
+        return date(*(int(g) for g in m.groups()))
+    except ValueError:
+        return None
 
-        # 기본 사용자 가져오기 (로그인 없는 경우)
-        if request.user.is_authenticated:
-            user = request.user
-        else:
-            user, _ = User.objects.get_or_create(username='default_user')
 
-        # DB 저장
-        pill_record = PillIdentification.objects.create(
-            user=user,
-            patient_name=merged.get('patient_name', ''),
-            age=merged.get('age', ''),
-            dispense_date=merged.get('dispense_date', '') or None,
-            pharmacy_name=merged.get('pharmacy_name', ''),
-            prescription_number=merged.get('prescription_number', ''),
-            medicine_name=merged.get('medicine_name', ''),
-            dosage_instructions=merged.get('dosage_instructions', ''),
-            frequency=merged.get('frequency', ''),
-            confidence_score=diag.get('medicine_name', {}).get('confidence', 0.0),
-            raw_response=json.dumps({"shots": shots_raw, "diagnostics": diag}, ensure_ascii=False)
-        )
-        saved_id = pill_record.id
+def _rx_key(d: Dict):
+    """샷/병합 결과 → (처방번호 숫자, 조제일자) 또는 None (둘 중 하나라도 없으면)"""
+    number = _digits_only(str((d or {}).get("prescription_number") or ""))
+    dispensed = _parse_dispense_date((d or {}).get("dispense_date"))
+    return (number, dispensed) if number and dispensed else None
+
+
+def _sum_usages(usages: List) -> Tuple[Dict, Dict]:
+    """[(모델, usage), ...] → (전체 합, 모델별 합)"""
+    usage, usage_by_model = {}, {}
+    for m, u in usages:
+        _add_usage(usage, {"usage": u})
+        _add_usage(usage_by_model.setdefault(m, {}), {"usage": u})
+    return usage, usage_by_model
+
+
+def _existing_scan_result(record, mode: str, images: List[bytes], outcome_of: Dict, usages: List, rx_dedup: Dict) -> Dict:
+    """같은 처방 기록이 있을 때의 응답: 저장된 병합 결과 + 이번 스캔에서 실제로 분석한 샷"""
+    stored = record.raw_payload()
+    shots = []
+    for i in range(len(images)):
+        oc = outcome_of.get(i)
+        shots.append({"index": i + 1, "status": oc["status"] if oc else "not_analysed",
+                      "json": oc["value"][1] if oc and oc["status"] == "ok" else {}})
+    usage, usage_by_model = _sum_usages(usages)
+    return {
+        "analysis_type": "envelope",
+        "mode": mode,
+        "shots": shots,
+        "merged": record.to_merged(),
+        "diagnostics": stored.get("diagnostics", {}),
+        "catalog": _resolve_catalog(record.medicine_name),
+        "prescription_dedup": rx_dedup,
+        "usage": usage,
+        "usage_by_model": usage_by_model,
+        "saved_to_db": False,
+        "existing_record": True,
+        "record_id": record.id,
+    }
+
+
+# 병합된 약품명 → 카탈로그 약품 (메모리 2-gram 인덱스 퍼지 매칭, services/medicine_index.py)
+SCAN_CATALOG_RESOLVE = os.getenv("SCAN_CATALOG_RESOLVE", "1") == "1"
+# 약봉투에 여러 약이 한 줄로 적힌 경우 ('타이레놀정, 판콜에이내복액')
+_MED_SPLIT_RE = re.compile(r"[,/\n·;]+|\s{2,}")
+
+
+def _resolve_catalog(medicine_name: str) -> Dict:
+    """
+    약품명(여러 개면 구분자로 나눠 각각)을 카탈로그에서 찾아 후보별 TTS 문구까지 붙인다.
+    - TTS는 접근성 정보(effect_tts 등)가 없으면 원문(effect/usage/warning)으로 대체 (medicines.search_medicine과 동일)
+    - medicines 테이블이 없거나 조회에 실패해도 스캔 응답은 그대로 나가도록 error만 표시
+    """
+    if not SCAN_CATALOG_RESOLVE:
+        return {"enabled": False}
+    t0 = time.monotonic()
+    names = [n.strip() for n in _MED_SPLIT_RE.split(str(medicine_name or "")) if len(n.strip()) >= 2]
+    try:
+        hits = list(get_medicine_index().match_many(names, CATALOG_TOP_K, CATALOG_MATCH_MIN_SCORE).items())
+        ids = {item_seq for _, found in hits for item_seq, _ in found}
+        if ids:
+            from .models import Medicine, AccessibilityInfo
+            meds = Medicine.objects.in_bulk(ids)
+            access = {a.medicine_id: a for a in AccessibilityInfo.objects.filter(medicine_id__in=ids)}
+        else:
+            meds, access = {}, {}
     except Exception as e:
-        logger.error(f"Failed to save pill identification to DB: {e}")
-        # DB 저장 실패해도 JSON은 반환
+        logger.warning(f"catalog resolve failed: {e}")
+        return {"enabled": True, "error": "catalog_unavailable", "matches": [],
+                "elapsed_ms": int((time.monotonic() - t0) * 1000)}
+
+    matches = []
+    for name, found in hits:
+        results = []
+        for item_seq, score in found:
+            med = meds.get(item_seq)
+            if med is None:
+                continue
+            a = access.get(item_seq)
+            results.append({
+                "item_seq": med.item_seq,
+                "item_name": med.item_name,
+                "entp_name": med.entp_name,
+                "score": score,
+                "tts": {
+                    "effect": (a and a.effect_tts) or med.effect,
+                    "usage": (a and a.usage_tts) or med.usage,
+                    "warning": (a and a.warning_tts) or med.warning_critical or med.warning_general,
+                },
+            })
+        matches.append({"query": name, "results": results})
+    return {"enabled": True, "matches": matches, "elapsed_ms": int((time.monotonic() - t0) * 1000)}
+
+
+def _selected_basis(d: Dict) -> List[str]:
+    """병합 진단에서 다수결에 실제로 쓰인 샷별 값 (나이/처방번호는 숫자만 비교)"""
+    return d.get("digits_only") or d.get("normalized") or d["per_shot"]
+
+
+def _cascade_escalate(images: List[bytes], reps: List[int], outcome_of: Dict, weight_of: Dict, usages: List) -> Dict:
+    """1차(저비용 모델) 결과 중 신뢰도 낮은 필드를 상위 모델로 재분석해 outcome_of를 갱신한다.
+    - 필드마다 가중 다수결 신뢰도 < SCAN_CASCADE_THRESHOLD 이면 대상 (모든 샷이 비운 필드는 신뢰도 0이라 항상 대상)
+    - 그 필드 값이 다수와 다른 샷만 재분석하고 (모든 샷이 비웠으면 샷 전부), 결과는 대상 필드에만 덮어쓴다
+    usages에는 재분석 토큰 사용량을 (모델, usage)로 추가
+    반환: {'fields': {필드: {confidence, low, shots}}, 'fast_selected': {필드: 값}, 'escalated_of': {샷: 정보}}"""
+    ok = [i for i in reps if outcome_of[i]["status"] == "ok"]
+    fields, fast_selected, targets = {}, {}, {}
+    if ok:
+        _, diag = _merge_envelope_json([outcome_of[i]["value"][1] for i in ok], [weight_of[i] for i in ok])
+        for k in ENVELOPE_FIELDS:
+            d = diag[k]
+            basis = _selected_basis(d)
+            low = d["confidence"] < SCAN_CASCADE_THRESHOLD
+            disagree = []
+            if low:
+                disagree = [ok[n] for n, v in enumerate(basis) if v != d["selected"] or not d["selected"]]
+            fields[k] = {"confidence": d["confidence"], "low": low, "shots": [i + 1 for i in disagree]}
+            fast_selected[k] = d["selected"]
+            for i in disagree:
+                targets.setdefault(i, []).append(k)
+
+    escalated_of = {}
+    if targets:
+        order = sorted(targets)
+        strong_usages = [(SCAN_STRONG_MODEL, {}) for _ in order]
+        usages.extend(strong_usages)
+        results = run_shots(lambda item: _analyze_envelope_shot(item[0], usage=item[1], model=SCAN_STRONG_MODEL),
+                            [(images[i], strong_usages[n][1]) for n, i in enumerate(order)])
+        for i, oc in zip(order, results):
+            escalated_of[i] = {"model": SCAN_STRONG_MODEL, "fields": targets[i], "status": oc["status"]}
+            if oc["status"] != "ok":
+                continue  # 재분석 실패 시 1차 결과 유지
+            cleaned, parsed, prep, parse_status = outcome_of[i]["value"]
+            strong = oc["value"][1]
+            parsed = dict(parsed)
+            for k in targets[i]:
+                parsed[k] = strong.get(k, "")
+            outcome_of[i] = dict(outcome_of[i], value=(cleaned, parsed, prep, parse_status))
+    return {"fields": fields, "fast_selected": fast_selected, "escalated_of": escalated_of}
+
+
+def _run_batch_shots(images: List[bytes], usage: Dict, model: str, on_result=None) -> List[Dict]:
+    """batch 모드 실행: 요청 1번의 결과를 run_shots와 같은 outcome 목록으로 펼친다"""
+    t0 = time.monotonic()
+    try:
+        values = _analyze_envelope_batch(images, usage=usage, model=model)
+        elapsed_ms = int((time.monotonic() - t0) * 1000)
+        outcomes = [{"status": "ok", "value": v, "error": None, "elapsed_ms": elapsed_ms} for v in values]
+    except Exception as e:
+        outcomes = [{"status": "error", "value": None, "error": str(e), "elapsed_ms": None} for _ in images]
+    if on_result:
+        for idx, oc in enumerate(outcomes):
+            on_result(idx, oc)
+    return outcomes
+
+
+class NoUsableShots(ValueError):
+    """품질 검사(디코딩 실패 포함)를 통과한 샷이 하나도 없음 → 분석/저장 없이 400 no_usable_shots"""
+
+    def __init__(self, quality: Dict):
+        self.quality = quality
+        super().__init__("no_usable_shots")
+
+
+def _run_envelope_pipeline(images: List[bytes], meta_in: List, user=None, progress=None, mode: str = None,
+                           save: bool = True) -> Dict:
+    """약봉투 스캔 본체: 중복 묶기 → 샷별 분석(병렬/조기 합의) → 병합 → DB 저장
+    user: 로그인 사용자 (None이면 default_user)
+    progress: progress(event, data) 콜백 (비동기 작업의 SSE 이벤트)
+    mode: per_shot (샷마다 요청) | batch (요청 1번, 조기 합의 없음)
+          | fused (합성본 1장을 상위 모델로 1번, 캐스케이드 없음). None이면 SCAN_MODE
+    save: False면 DB 저장 생략 (벤치마크용)
+    분석할 샷이 하나도 없으면 (전부 디코딩 실패) NoUsableShots"""
+    mode = mode or SCAN_MODE
+    # 흔들림/반사광/노출 불량 샷은 Vision에 보내지 않고, 통과한 샷은 품질 점수를 투표 가중치로
+    quality = {"enabled": QUALITY_GATE_ENABLED}
+    qweight = [1.0] * len(images)
+    rejected = {}  # 샷 → 제외 사유
+    if QUALITY_GATE_ENABLED:
+        scores, elapsed_ms = assess_frames(images)
+        qweight = [q["weight"] for q in scores]
+        rejected = {i: q["reasons"] for i, q in enumerate(scores) if not q["keep"]}
+        quality.update(shots=scores, rejected_shots=[i + 1 for i in sorted(rejected)], elapsed_ms=elapsed_ms)
+
+    fusion = {"enabled": False}
+    if mode == "fused":
+        # 통과한 샷을 기준 샷에 정렬해 1장으로 합성하고 이후 단계는 그 1장으로 진행
+        if progress:
+            progress("stage", {"stage": "fusing", "total_shots": len(images)})
+        kept = [i for i in range(len(images)) if i not in rejected]
+        fused, info = fuse_frames([images[i] for i in kept])
+        for f in info["frames"]:
+            f["index"] = kept[f["index"] - 1] + 1
+        if info["reference"]:
+            info["reference"] = kept[info["reference"] - 1] + 1
+        fusion = {"enabled": True, **info}
+        if fused is not None:
+            used = [f["index"] for f in info["frames"] if f["align"] in ("reference", "ecc", "orb")]
+            images, meta_in = [fused], [{"fused_from": used}]
+            qweight, rejected = [1.0], {}
+    # 거의 같은 샷끼리 묶어 묶음마다 대표 1장만 분석 (투표는 묶음 샷들의 품질 가중치 합만큼)
+    kept = [i for i in range(len(images)) if i not in rejected]
+    clusters = [{"rep": kept[c["rep"]], "members": [kept[m] for m in c["members"]], "hash": c["hash"]}
+                for c in cluster_shots([images[i] for i in kept])]
+    for c in clusters:
+        # 묶음 대표는 품질 점수가 가장 높은 샷 (같으면 먼저 찍은 샷)
+        c["rep"] = max(c["members"], key=lambda m: qweight[m])
+    reps = [c["rep"] for c in clusters]
+    if not reps:
+        raise NoUsableShots(quality)
+    weight_of = {c["rep"]: round(sum(qweight[m] for m in c["members"]), 3) for c in clusters}
+    duplicate_of = {m: c["rep"] for c in clusters for m in c["members"] if m != c["rep"]}
+    # 합성본 1장은 샷 간 불일치로 재분석 대상을 고를 수 없으므로 처음부터 상위 모델
+    # (대표 샷 1장도 SCAN_CASCADE_SINGLE=strong이면 마찬가지)
+    cascade_off_reason = None
+    if not SCAN_CASCADE:
+        cascade_off_reason = "disabled"
+    elif mode == "fused":
+        cascade_off_reason = "fused"
+    elif len(reps) == 1 and SCAN_CASCADE_SINGLE == "strong":
+        cascade_off_reason = "single_shot"
+    cascade_on = cascade_off_reason is None
+
+    # 샷별 Vision 호출을 병렬 실행 (결과는 샷 순서대로)
+    # 핵심 필드가 안정적 다수에 도달하면 남은 샷은 건너뛴다
+    # (합의는 서로 다른 묶음의 독립 판독만으로 판단 - 중복 샷 가중치는 쓰지 않음)
+    merger = None
+    if mode == "per_shot" and SCAN_EARLY_CONSENSUS and len(reps) > SCAN_CONSENSUS_QUORUM:
+        merger = IncrementalEnvelopeMerger()
+    partial = []  # 지금까지 도착한 (json, weight) - 진행 이벤트의 중간 병합용
+    rx_dedup = {"enabled": bool(SCAN_RX_DEDUP and save and user is not None), "hit": False}
+    existing = []  # 같은 처방 기록 (찾으면 1개)
+
+    def on_result(pos, oc):
+        rep = reps[pos]
+        if oc["status"] == "ok":
+            partial.append((oc["value"][1], weight_of[rep]))
+        if progress:
+            pm, _ = _merge_envelope_json([j for j, _ in partial], [w for _, w in partial])
+            progress("shot", {"index": rep + 1, "status": oc["status"], "error": oc["error"],
+                              "done": len(partial), "total": len(reps), "partial": pm})
+        if rx_dedup["enabled"] and "checked_shot" not in rx_dedup and oc["status"] == "ok":
+            # 처방번호 + 조제일자를 처음 읽은 샷에서 한 번만 조회
+            key = _rx_key(oc["value"][1])
+            if key:
+                rx_dedup["checked_shot"] = rep + 1
+                try:
+                    from .models import EnvelopeScan
+                    record = EnvelopeScan.find_existing(user, *key)
+                except Exception as e:
+                    logger.warning(f"Failed to check existing envelope scan: {e}")
+                    record = None
+                if record is not None:
+                    existing.append(record)
+                    return True
+        return merger is not None and oc["status"] == "ok" and merger.add(oc["value"][1])
+
+    if progress:
+        progress("stage", {"stage": "analyzing", "total_shots": len(images), "groups": len(reps)})
+    first_model = SCAN_FAST_MODEL if cascade_on else SCAN_STRONG_MODEL
+    if mode == "batch":
+        usages = [(first_model, {})]
+        outcomes = _run_batch_shots([images[i] for i in reps], usages[0][1], first_model, on_result=on_result)
+    else:
+        # 샷별 토큰 사용량은 스레드마다 따로 모은 뒤 합산
+        usages = [(first_model, {}) for _ in reps]
+        # 조기 합의가 켜져 있으면 quorum 장만 먼저 보내고, 합의가 안 됐을 때만 나머지를 보낸다
+        outcomes = run_shots(lambda item: _analyze_envelope_shot(item[0], usage=item[1], model=first_model),
+                             [(images[i], usages[n][1]) for n, i in enumerate(reps)], on_result=on_result,
+                             first_wave=merger.quorum if merger else None)
+    outcome_of = dict(zip(reps, outcomes))
+
+    if existing:
+        # 이미 저장된 같은 처방: 캐스케이드/병합/저장 없이 저장된 결과 반환
+        rx_dedup.update(hit=True, record_id=existing[0].id, scanned_at=existing[0].created_at.isoformat())
+        if progress:
+            progress("stage", {"stage": "existing_record", "record_id": existing[0].id})
+        return _existing_scan_result(existing[0], mode, images, outcome_of, usages, rx_dedup)
+
+    cascade = None
+    if cascade_on:
+        if progress:
+            progress("stage", {"stage": "cascade"})
+        cascade = _cascade_escalate(images, reps, outcome_of, weight_of, usages)
+
+    usage, usage_by_model = _sum_usages(usages)
+
+    shots_raw=[]; json_list=[]; weights=[]
+    for i in range(len(images)):
+        idx = i + 1
+        meta_obj = meta_in[i] if i < len(meta_in) else None
+        if i in rejected:
+            # 품질 불량 샷: 분석/병합 제외
+            shots_raw.append({"index": idx, "raw": "", "json": {}, "image_path": None, "meta": meta_obj, "status": "rejected", "reasons": rejected[i]})
+            continue
+        if i in duplicate_of:
+            # 대표 샷과 거의 같은 프레임: 분석 생략 (대표 샷 투표에 가중치로 반영)
+            shots_raw.append({"index": idx, "raw": "", "json": {}, "image_path": None, "meta": meta_obj, "status": "duplicate", "duplicate_of": duplicate_of[i] + 1})
+            continue
+        oc = outcome_of[i]
+        if oc["status"] in ("skipped", "abandoned"):
+            # 조기 합의로 분석하지 않은 샷은 병합에서 제외
+            shots_raw.append({"index": idx, "raw": "", "json": {}, "image_path": None, "meta": meta_obj, "status": oc["status"]})
+            continue
+        if oc["status"] == "ok":
+            cleaned, parsed, prep, parse_status = oc["value"]
+            shots_raw.append({"index": idx, "raw": cleaned, "json": parsed, "image_path": f"client_shot_{idx}", "meta": meta_obj, "elapsed_ms": oc["elapsed_ms"], "weight": weight_of[i], "preprocess": prep, "model": first_model, "parse": parse_status})
+            if cascade and i in cascade["escalated_of"]:
+                shots_raw[-1]["escalated"] = cascade["escalated_of"][i]
+            json_list.append(parsed)
+        else:
+            shots_raw.append({"index": idx, "raw": f"ERROR: {oc['error']}", "json": {}, "image_path": None, "meta": meta_obj, "status": oc["status"], "weight": weight_of[i]})
+            json_list.append({})
+        weights.append(weight_of[i])
+
+    merged, diag = _merge_envelope_json(json_list, weights)
+    if cascade:
+        for k, f in cascade["fields"].items():
+            f["changed"] = f["low"] and merged.get(k, "") != cascade["fast_selected"][k]
+        cascade = {
+            "enabled": True,
+            "fast_model": SCAN_FAST_MODEL,
+            "strong_model": SCAN_STRONG_MODEL,
+            "threshold": SCAN_CASCADE_THRESHOLD,
+            "escalated_shots": sorted(i + 1 for i in cascade["escalated_of"]),
+            "fields": cascade["fields"],
+        }
+    else:
+        cascade = {"enabled": False, "reason": cascade_off_reason}
+    preps = [s["preprocess"] for s in shots_raw if s.get("preprocess")]
+    preprocess = {
+        "enabled": PREPROCESS_ENABLED,
+        "bytes_in": sum(p["bytes_in"] for p in preps),
+        "bytes_out": sum(p["bytes_out"] for p in preps),
+        "rectified_shots": [s["index"] for s in shots_raw if (s.get("preprocess") or {}).get("detect") == "quad"],
+    }
+    preprocess["bytes_saved"] = preprocess["bytes_in"] - preprocess["bytes_out"]
+    dedup = {
+        "total_shots": len(images),
+        "analysed_groups": len(reps),
+        "clusters": [{"rep": c["rep"] + 1, "members": [m + 1 for m in c["members"]], "hash": c["hash"]} for c in clusters],
+    }
+    parse = {
+        "structured_output": VISION_STRUCTURED_OUTPUT,
+        "repaired_shots": [s["index"] for s in shots_raw if s.get("parse") == "repaired"],
+        "failed_shots": [s["index"] for s in shots_raw if s.get("parse") == "failed"],
+    }
+    consensus = {
+        "enabled": merger is not None,
+        "reached_after": merger.reached_after if merger else None,
+        "skipped_shots": [s["index"] for s in shots_raw if s.get("status") == "skipped"],
+        "abandoned_shots": [s["index"] for s in shots_raw if s.get("status") == "abandoned"],
+    }
+
+    if save and cascade["enabled"]:
+        try:
+            from .models import EnvelopeCascadeStat
+            EnvelopeCascadeStat.record(cascade["fields"])
+        except Exception as e:
+            logger.warning(f"Failed to record cascade stats: {e}")
+
+    # DB에 저장 (EnvelopeScan). 병합 결과의 처방번호 + 조제일자 기록이 이미 있으면 새로 만들지 않는다
+    saved_id = None
+    existing_id = None
+    if save:
+        try:
+            from .models import EnvelopeScan
+            from django.contrib.auth.models import User
+
+            # 기본 사용자 가져오기 (로그인 없는 경우)
+            if user is None:
+                user, _ = User.objects.get_or_create(username='default_user')
+
+            key = _rx_key(merged)
+            record = EnvelopeScan.find_existing(user, *key) if key and rx_dedup["enabled"] else None
+            if record is not None:
+                existing_id = record.id
+                rx_dedup.update(hit=True, record_id=record.id, scanned_at=record.created_at.isoformat())
+            else:
+                record = EnvelopeScan.create_from_merged(
+                    user, merged,
+                    dispense_date=_parse_dispense_date(merged.get('dispense_date')),
+                    confidence=diag.get('medicine_name', {}).get('confidence', 0.0),
+                    raw={"merged": merged, "shots": shots_raw, "diagnostics": diag, "consensus": consensus, "dedup": dedup, "preprocess": preprocess, "cascade": cascade, "fusion": fusion, "quality": quality}
+                )
+                saved_id = record.id
+        except Exception as e:
+            logger.error(f"Failed to save envelope scan to DB: {e}")
+            # DB 저장 실패해도 JSON은 반환
 
     out = {
         "analysis_type": "envelope",
+        "mode": mode,
         "shots": shots_raw,
         "merged": merged,
         "diagnostics": diag,
+        "catalog": _resolve_catalog(merged.get("medicine_name")),
+        "consensus": consensus,
+        "dedup": dedup,
+        "preprocess": preprocess,
+        "cascade": cascade,
+        "fusion": fusion,
+        "quality": quality,
+        "parse": parse,
+        "usage": usage,
+        "usage_by_model": usage_by_model,
+        "prescription_dedup": rx_dedup,
         "saved_to_db": saved_id is not None,
-        "record_id": saved_id
+        "existing_record": existing_id is not None,
+        "record_id": saved_id or existing_id
     }
-    return JsonResponse(out, status=200)
+    return out
+
+
+def api_scan_job_status(request, job_id):
+    """GET /api/scan/jobs/<job_id>/ : 비동기 스캔 작업 상태 (끝났으면 result 포함)"""
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return JsonResponse({"error": "job_not_found"}, status=404)
+    return JsonResponse(job.snapshot(), status=200)
+
+
+def api_upstream_stats(request):
+    """GET /api/upstream/stats/ : 업스트림(OpenAI/ElevenLabs) 호출별 지연시간/재시도 집계
+    + 제공자별 서킷/토큰 버킷 상태 + 모델 응답 JSON 파싱 결과(복구로 살린 샷 수)
+    + Vision 결과 캐시 hit/miss/evict 누적과 현재 크기 (DEBUG 전용)"""
+    if not settings.DEBUG:
+        raise Http404
+    cache = get_cache()
+    return JsonResponse({"calls": http_client.stats(), "guard": http_client.guard_status(),
+                         "json_parse": json_repair_stats(),
+                         "vision_cache": cache.stats() if cache else {"enabled": False}}, status=200)
+
+
+def api_scan_job_events(request, job_id):
+    """GET /api/scan/jobs/<job_id>/events/ : 진행 상황 Server-Sent Events
+       - event: status | stage | shot(샷별 결과 + 중간 병합 partial) | done(최종 결과) | error
+       - Last-Event-ID 헤더로 이어받기 가능, 15초마다 keep-alive 주석 전송
+       - 끝난 작업에 마지막 이벤트 이후로 다시 붙으면 보낼 것 없이 스트림을 닫는다
+    """
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return JsonResponse({"error": "job_not_found"}, status=404)
+    try:
+        after = int(request.headers.get("Last-Event-ID") or 0)
+    except ValueError:
+        after = 0
+
+    def stream(after=after):
+        while True:
+            events = job.wait_events(after, timeout=15)
+            if not events:
+                if job.finished:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for ev in events:
+                after = ev["id"]
+                yield f"id: {ev['id']}\nevent: {ev['event']}\ndata: {json.dumps(ev['data'], ensure_ascii=False)}\n\n"
+                if ev["event"] in ("done", "error"):
+                    return
+
+    resp = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp
 
 
 # ==================== ElevenLabs Voice 관련 API ====================
@@ -0,0 +1 @@
+# 약봉투 이미지 처리 (OpenCV/NumPy, Django 의존 없음 - scan.py에서도 사용)
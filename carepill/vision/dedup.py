@@ -0,0 +1,57 @@
+"""
+연사 샷 중복 제거 (dHash)
+
+3연사 샷은 거의 같은 프레임인 경우가 많다.
+샷마다 64비트 dHash를 구하고 해밍 거리가 가까운 샷끼리 묶어
+묶음(cluster)마다 대표 샷 1장만 Vision 분석에 보낸다.
+- 거리 기준: DEDUP_MAX_DISTANCE (기본 6 / 64비트)
+"""
+import os
+import cv2
+import numpy as np
+
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "6"))
+
+
+def dhash(image_bytes: bytes, hash_size: int = 8):
+    """JPEG/PNG 바이트 → 64비트 dHash (디코딩 실패 시 None)"""
+    buf = np.frombuffer(image_bytes, dtype=np.uint8)
+    # 1/4 축소 디코딩으로 속도 확보 (해시는 9x8만 필요)
+    gray = cv2.imdecode(buf, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def cluster_shots(images_bytes, max_distance=None):
+    """
+    거의 같은 샷끼리 묶는다 (입력 순서대로 greedy, 첫 샷이 대표).
+
+    Returns:
+        list: [{'rep': 대표 샷 index(0부터), 'members': [index, ...], 'hash': '16진수' 또는 None}, ...]
+    """
+    limit = DEDUP_MAX_DISTANCE if max_distance is None else max_distance
+    clusters = []
+    for idx, data in enumerate(images_bytes):
+        h = dhash(data) if data else None
+        if h is not None:
+            for c in clusters:
+                if c["_hash"] is not None and hamming(c["_hash"], h) <= limit:
+                    c["members"].append(idx)
+                    break
+            else:
+                clusters.append({"rep": idx, "members": [idx], "_hash": h})
+        else:
+            # 디코딩 실패한 샷은 따로 분석
+            clusters.append({"rep": idx, "members": [idx], "_hash": None})
+
+    return [
+        {"rep": c["rep"], "members": c["members"], "hash": f"{c['_hash']:016x}" if c["_hash"] is not None else None}
+        for c in clusters
+    ]
@@ -0,0 +1,185 @@
+"""
+다중 프레임 합성 (정렬 + 스태킹)
+
+같은 약봉투를 찍은 3~9장을 샷마다 Vision에 보내는 대신
+기준 프레임(가장 선명한 샷)에 나머지를 정렬해 한 장으로 합성하고
+합성본 1장만 분석한다 (Vision 호출 N번 → 1번).
+1) 정렬: 축소 흑백 이미지에서 ECC(호모그래피), 실패하면 ORB 특징점 + RANSAC 호모그래피
+   - 정렬에 실패하거나 상관계수가 FUSION_MIN_CC(기본 0.8) 미만인 프레임은 제외
+2) 스태킹 (FUSION_METHOD)
+   - median (기본): 픽셀별 중앙값. 프레임마다 위치가 바뀌는 반사광/노이즈가 빠진다
+     (2장뿐이면 중앙값이 평균이 되므로 픽셀별 최솟값으로 반사광만 제거)
+   - sharpness: 프레임 선명도(라플라시안 분산) 가중 평균, 포화된 반사광 픽셀은 가중치 0
+- 작업 해상도: 긴 변 FUSION_MAX_SIDE (기본 1600px). 이후 크롭/축소는 preprocess가 담당
+"""
+import os
+import time
+import cv2
+import numpy as np
+
+FUSION_METHOD = os.getenv("FUSION_METHOD", "median")
+FUSION_METHODS = ("median", "sharpness")
+FUSION_MAX_SIDE = int(os.getenv("FUSION_MAX_SIDE", "1600"))
+FUSION_MIN_CC = float(os.getenv("FUSION_MIN_CC", "0.8"))
+
+# 정렬은 이 크기(긴 변)의 흑백 이미지에서
+_ALIGN_SIDE = 512
+# ECC는 1/4 크기에서 먼저 수렴시킨 뒤 정렬 크기에서 몇 번만 다듬는다 (coarse-to-fine)
+_ECC_COARSE = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 50, 1e-4)
+_ECC_FINE = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 1e-4)
+_ORB_MIN_MATCHES = 12
+# 반사광 판정: 밝기 이 값 이상 (0~255)
+_GLARE_LEVEL = 245
+
+
+def _resize_long(img, side):
+    h, w = img.shape[:2]
+    if max(h, w) <= side:
+        return img
+    s = side / float(max(h, w))
+    return cv2.resize(img, (int(round(w * s)), int(round(h * s))), interpolation=cv2.INTER_AREA)
+
+
+def _sharpness(gray):
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def _scale_matrix(sx, sy):
+    return np.array([[sx, 0, 0], [0, sy, 0], [0, 0, 1]], dtype=np.float64)
+
+
+def _sane(h):
+    """뒤집힘/과도한 확대·축소가 없는 호모그래피인지"""
+    if h is None or not np.all(np.isfinite(h)):
+        return False
+    det = np.linalg.det(h[:2, :2])
+    return 0.5 <= det <= 2.0
+
+
+def _align_ecc(ref_small, small):
+    """기준→입력 좌표 호모그래피 (축소 좌표계)와 상관계수, 실패 시 (None, None)"""
+    h, w = ref_small.shape[:2]
+    quarter = (max(16, w // 4), max(16, h // 4))
+    up = _scale_matrix(4.0, 4.0)
+    try:
+        _, warp = cv2.findTransformECC(cv2.resize(ref_small, quarter, interpolation=cv2.INTER_AREA),
+                                       cv2.resize(small, quarter, interpolation=cv2.INTER_AREA),
+                                       np.eye(3, dtype=np.float32), cv2.MOTION_HOMOGRAPHY, _ECC_COARSE, None, 3)
+        warp = (up @ warp.astype(np.float64) @ np.linalg.inv(up)).astype(np.float32)
+        cc, warp = cv2.findTransformECC(ref_small, small, warp, cv2.MOTION_HOMOGRAPHY, _ECC_FINE, None, 5)
+    except cv2.error:
+        return None, None
+    return warp.astype(np.float64), float(cc)
+
+
+def _align_orb(ref_small, small):
+    """ECC 실패 시 (시점 차이가 큰 다른 카메라 샷 등): 특징점 매칭 호모그래피"""
+    orb = cv2.ORB_create(1000)
+    k1, d1 = orb.detectAndCompute(ref_small, None)
+    k2, d2 = orb.detectAndCompute(small, None)
+    if d1 is None or d2 is None:
+        return None
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(d1, d2)
+    if len(matches) < _ORB_MIN_MATCHES:
+        return None
+    src = np.float32([k1[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
+    dst = np.float32([k2[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
+    h, inliers = cv2.findHomography(src, dst, cv2.RANSAC, 3.0)
+    if h is None or int(inliers.sum()) < _ORB_MIN_MATCHES:
+        return None
+    return h
+
+
+def _stack(frames, sharpness, method):
+    """정렬된 프레임 목록 → 합성 이미지 (uint8)"""
+    if len(frames) == 1:
+        return frames[0]
+    if method == "sharpness":
+        # 프레임 단위로 누적 (float 스택 전체를 메모리에 올리지 않음)
+        top = max(max(sharpness), 1e-6)
+        acc = np.zeros(frames[0].shape, dtype=np.float32)
+        wsum = np.zeros(frames[0].shape[:2], dtype=np.float32)
+        for f, s in zip(frames, sharpness):
+            w = (s / top) * (f.max(axis=2) < _GLARE_LEVEL).astype(np.float32) + 1e-3
+            acc += f * w[..., None]
+            wsum += w
+        return np.clip(acc / wsum[..., None], 0, 255).astype(np.uint8)
+    if len(frames) == 2:
+        return np.minimum(frames[0], frames[1])
+    return np.median(np.stack(frames), axis=0).astype(np.uint8)
+
+
+def fuse_frames(images_bytes, method=None, max_side=None, jpeg_quality=92):
+    """
+    여러 샷을 기준 샷에 정렬해 한 장으로 합성한다.
+
+    Returns:
+        (bytes 또는 None, dict): 합성 JPEG 바이트와 정보
+            {'method', 'frames_in', 'frames_used', 'reference': 기준 샷 번호(1부터),
+             'frames': [{'index', 'sharpness', 'align': reference|ecc|orb|failed|decode_failed, 'cc'}],
+             'size': [w, h], 'elapsed_ms'}
+        디코딩되는 샷이 하나도 없으면 None
+    """
+    t0 = time.monotonic()
+    method = method or FUSION_METHOD
+    if method not in FUSION_METHODS:
+        raise ValueError(f"알 수 없는 합성 방식: {method}")
+    info = {"method": method, "frames_in": len(images_bytes), "frames_used": 0,
+            "reference": None, "frames": [], "size": None, "elapsed_ms": 0}
+
+    decoded = []  # (index, 작업 해상도 BGR, 정렬용 흑백, 선명도)
+    for i, data in enumerate(images_bytes):
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+        if img is None:
+            info["frames"].append({"index": i + 1, "sharpness": None, "align": "decode_failed", "cc": None})
+            continue
+        img = _resize_long(img, max_side or FUSION_MAX_SIDE)
+        small = cv2.cvtColor(_resize_long(img, _ALIGN_SIDE), cv2.COLOR_BGR2GRAY)
+        decoded.append((i, img, small, _sharpness(small)))
+    if not decoded:
+        return None, info
+
+    ref_i, ref, ref_small, _ = max(decoded, key=lambda d: d[3])
+    rh, rw = ref.shape[:2]
+    sh, sw = ref_small.shape[:2]
+    ref_small_blur = cv2.GaussianBlur(ref_small, (5, 5), 0)
+    to_small = _scale_matrix(sw / float(rw), sh / float(rh))
+
+    aligned, weights = [], []
+    for i, img, small, sharp in decoded:
+        entry = {"index": i + 1, "sharpness": round(sharp, 1), "align": "reference", "cc": None}
+        if i == ref_i:
+            aligned.append(ref)
+            weights.append(sharp)
+            info["frames"].append(entry)
+            continue
+        # 입력을 기준과 같은 축소 크기로 맞춘 뒤 기준→입력 호모그래피를 구한다
+        ih, iw = img.shape[:2]
+        small = cv2.resize(small, (sw, sh), interpolation=cv2.INTER_AREA)
+        from_small = np.linalg.inv(_scale_matrix(sw / float(iw), sh / float(ih)))
+        h, cc = _align_ecc(ref_small_blur, cv2.GaussianBlur(small, (5, 5), 0))
+        entry["cc"] = round(cc, 3) if cc is not None else None
+        if h is not None and cc >= FUSION_MIN_CC and _sane(h):
+            entry["align"] = "ecc"
+        else:
+            h = _align_orb(ref_small, small)
+            entry["align"] = "orb" if _sane(h) else "failed"
+        info["frames"].append(entry)
+        if entry["align"] == "failed":
+            continue
+        # 축소 좌표 호모그래피를 작업 해상도로: 기준(원) → 기준(축소) → 입력(축소) → 입력(원)
+        full = from_small @ h @ to_small
+        aligned.append(cv2.warpPerspective(img, full, (rw, rh), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                                           borderMode=cv2.BORDER_REPLICATE))
+        weights.append(sharp)
+
+    info["frames"].sort(key=lambda f: f["index"])
+    info["reference"] = ref_i + 1
+    info["frames_used"] = len(aligned)
+    info["size"] = [rw, rh]
+    out = _stack(aligned, weights, method)
+    ok, buf = cv2.imencode(".jpg", out, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality])
+    info["elapsed_ms"] = int((time.monotonic() - t0) * 1000)
+    if not ok:
+        return None, info
+    return buf.tobytes(), info
@@ -0,0 +1,208 @@
+"""
+Vision 업로드 전 이미지 전처리
+
+브라우저가 보낸 JPEG를 그대로 올리면 배경까지 고해상도로 올라가
+업로드 크기와 이미지 토큰(detail=high: 512px 타일 수에 비례)이 낭비된다.
+1) 디코딩
+2) 약봉투(밝은 종이) 검출: 가장 큰 밝은 윤곽을 꼭짓점 4개로 근사 (rectify_envelope)
+3) 원근 보정: 네 꼭짓점을 평평한 직사각형으로 펴고 배경은 버린다
+   - 4각형 근사가 안 되면 최소 외접 사각형으로 크롭 + 기울기 보정 (deskew)
+4) 글자가 읽히는 최소 해상도로 축소 (짧은 변 PREPROCESS_SHORT_SIDE, 기본 768px)
+   - OpenAI도 high detail 이미지를 짧은 변 768px로 줄여서 보므로 그 이상은 낭비
+5) JPEG 재인코딩 (PREPROCESS_JPEG_QUALITY, 기본 85)
+"""
+import os
+import cv2
+import numpy as np
+
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "1") == "1"
+PREPROCESS_SHORT_SIDE = int(os.getenv("PREPROCESS_SHORT_SIDE", "768"))
+PREPROCESS_JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", "85"))
+# 전처리 결과가 달라지게 고치면 버전을 올릴 것 (Vision 캐시 키에 포함됨)
+PREPROCESS_VERSION = "prep-v2"
+
+# 크롭 후보 영역이 전체 이미지 대비 이 범위일 때만 크롭 (너무 작거나 전체면 무시)
+_MIN_AREA_RATIO = 0.2
+_MAX_AREA_RATIO = 0.97
+# 이보다 작은 기울기는 보정하지 않음 (보간 손실이 더 큼)
+_MIN_DESKEW_DEG = 1.0
+# 4각형 근사 허용 오차 (윤곽 둘레 대비) - 작은 값부터 시도
+_APPROX_EPS = (0.02, 0.03, 0.05)
+# 4각형과 윤곽의 면적 비가 이 비율~그 역수 사이일 때만 채택 (모서리 일부만 잡거나 부풀린 4각형 방지)
+_MIN_QUAD_FILL = 0.85
+
+
+def _order_quad(pts):
+    """꼭짓점 4개를 좌상, 우상, 우하, 좌하 순으로 (무게중심 기준 각도 정렬)"""
+    c = pts.mean(axis=0)
+    pts = pts[np.argsort(np.arctan2(pts[:, 1] - c[1], pts[:, 0] - c[0]))]
+    start = int(np.argmin(pts.sum(axis=1)))
+    return np.roll(pts, -start, axis=0).astype(np.float32)
+
+
+def _approx_quad(contour):
+    """윤곽 → 볼록 4각형 꼭짓점 (4x2) 또는 None"""
+    hull = cv2.convexHull(contour)
+    peri = cv2.arcLength(hull, True)
+    area = cv2.contourArea(contour)
+    for eps in _APPROX_EPS:
+        approx = cv2.approxPolyDP(hull, eps * peri, True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            fill = area / max(cv2.contourArea(approx), 1.0)
+            if _MIN_QUAD_FILL <= fill <= 1.0 / _MIN_QUAD_FILL:
+                return approx.reshape(4, 2).astype(np.float32)
+    return None
+
+
+def find_envelope(img):
+    """
+    밝은 종이(약봉투) 영역 검출.
+
+    Returns:
+        ('quad', 좌상/우상/우하/좌하 꼭짓점 4x2 float32) 또는
+        ('rect', cv2.minAreaRect 형식) 또는 None
+    """
+    h, w = img.shape[:2]
+    # 검출은 축소 이미지에서 (속도)
+    scale = 512.0 / max(h, w) if max(h, w) > 512 else 1.0
+    # 검출용 마스크는 바로 블러를 거치므로 INTER_AREA 대신 빠른 INTER_LINEAR
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR) if scale < 1.0 else img
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    c = max(contours, key=cv2.contourArea)
+    ratio = cv2.contourArea(c) / float(small.shape[0] * small.shape[1])
+    if not (_MIN_AREA_RATIO <= ratio <= _MAX_AREA_RATIO):
+        return None
+
+    quad = _approx_quad(c)
+    if quad is not None:
+        return "quad", _order_quad(quad / scale)
+    (cx, cy), (rw, rh), angle = cv2.minAreaRect(c)
+    return "rect", ((cx / scale, cy / scale), (rw / scale, rh / scale), angle)
+
+
+def _warp_quad(img, quad):
+    """4각형을 평평한 직사각형으로 편다 (변 길이는 마주보는 두 변 중 긴 쪽). (이미지, 윗변 기울기)"""
+    tl, tr, br, bl = quad
+    w = int(round(max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))))
+    h = int(round(max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))))
+    if w < 16 or h < 16:
+        return img, 0.0
+    dst = np.float32([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]])
+    m = cv2.getPerspectiveTransform(quad, dst)
+    out = cv2.warpPerspective(img, m, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    angle = float(np.degrees(np.arctan2(tr[1] - tl[1], tr[0] - tl[0])))
+    return out, angle
+
+
+def _crop_and_deskew(img, rect):
+    """사각형 영역을 수평으로 돌려 잘라낸다. (이미지, 보정 각도)"""
+    (cx, cy), (rw, rh), angle = rect
+    # minAreaRect 각도를 [-45, 45] 범위의 기울기로 정규화
+    if angle > 45:
+        angle -= 90
+        rw, rh = rh, rw
+    elif angle < -45:
+        angle += 90
+        rw, rh = rh, rw
+
+    if abs(angle) >= _MIN_DESKEW_DEG:
+        m = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+        img = cv2.warpAffine(img, m, (img.shape[1], img.shape[0]),
+                             flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    else:
+        angle = 0.0
+
+    x0 = max(0, int(cx - rw / 2)); y0 = max(0, int(cy - rh / 2))
+    x1 = min(img.shape[1], int(cx + rw / 2)); y1 = min(img.shape[0], int(cy + rh / 2))
+    if x1 - x0 < 16 or y1 - y0 < 16:
+        return img, angle
+    return img[y0:y1, x0:x1], angle
+
+
+def _downscale(img, short_side):
+    h, w = img.shape[:2]
+    if min(h, w) <= short_side:
+        return img
+    scale = short_side / float(min(h, w))
+    return cv2.resize(img, (int(round(w * scale)), int(round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def rectify_envelope(img):
+    """
+    BGR 이미지에서 약봉투만 잘라 평평하게 편다 (scan.py / 웹 스캔 공용).
+
+    Returns:
+        (numpy, dict): 보정된 이미지(검출 실패 시 원본)와
+            {'detect': 'quad' | 'rect' | None, 'quad': [[x, y] x 4] 또는 None, 'deskew_deg': float}
+    """
+    info = {"detect": None, "quad": None, "deskew_deg": 0.0}
+    found = find_envelope(img)
+    if found is None:
+        return img, info
+    kind, shape = found
+    if kind == "quad":
+        out, angle = _warp_quad(img, shape)
+        info["quad"] = [[round(float(x), 1), round(float(y), 1)] for x, y in shape]
+    else:
+        out, angle = _crop_and_deskew(img, shape)
+    info["detect"] = kind
+    info["deskew_deg"] = round(float(angle), 2)
+    return out, info
+
+
+def signature():
+    """
+    Vision 캐시 키에 넣을 전처리 설정 ('off' 또는 버전:짧은 변:JPEG 품질).
+    캐시는 원본 업로드 바이트 + 이 값으로 찾으므로, 재스캔은 전처리 없이 적중한다
+    """
+    if not PREPROCESS_ENABLED:
+        return "off"
+    return f"{PREPROCESS_VERSION}:{PREPROCESS_SHORT_SIDE}:{PREPROCESS_JPEG_QUALITY}"
+
+
+def preprocess_envelope(image_bytes: bytes, short_side=None, jpeg_quality=None):
+    """
+    약봉투 이미지 전처리.
+
+    Returns:
+        (bytes, dict): 전처리된 JPEG 바이트와 정보
+            {'bytes_in', 'bytes_out', 'size_in': [w, h], 'size_out': [w, h],
+             'cropped': bool, 'detect': quad|rect|None, 'deskew_deg': float, 'skipped': 사유 또는 None}
+        디코딩에 실패하거나 결과가 더 크면 원본 바이트를 그대로 돌려준다.
+    """
+    info = {"bytes_in": len(image_bytes), "bytes_out": len(image_bytes),
+            "size_in": None, "size_out": None, "cropped": False, "detect": None, "deskew_deg": 0.0, "skipped": None}
+
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        info["skipped"] = "decode_failed"
+        return image_bytes, info
+    info["size_in"] = [img.shape[1], img.shape[0]]
+
+    img, rect = rectify_envelope(img)
+    info["cropped"] = rect["detect"] is not None
+    info["detect"] = rect["detect"]
+    info["deskew_deg"] = rect["deskew_deg"]
+
+    img = _downscale(img, short_side or PREPROCESS_SHORT_SIDE)
+    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality or PREPROCESS_JPEG_QUALITY])
+    if not ok:
+        info["skipped"] = "encode_failed"
+        return image_bytes, info
+
+    out = buf.tobytes()
+    if len(out) >= len(image_bytes) and not info["cropped"]:
+        info["skipped"] = "no_gain"
+        info["size_out"] = info["size_in"]
+        return image_bytes, info
+
+    info["bytes_out"] = len(out)
+    info["size_out"] = [img.shape[1], img.shape[0]]
+    return out, info
@@ -0,0 +1,113 @@
+"""
+샷 품질 검사 (흔들림/반사광/노출) - Vision 호출 전에 로컬에서
+
+흔들린 샷이나 반사광으로 하얗게 날아간 샷도 Vision에 보내면
+비용만 들고 빈 값이 돌아온다. 축소 이미지(긴 변 400px)에서 샷마다
+1) 선명도: 라플라시안 분산
+2) 반사광 비율: 밝고(V >= 250) 채도가 거의 없는(S < 30) 픽셀 비율
+3) 히스토그램 클리핑: 완전히 검거나(<= 5) 하얀(>= 250) 픽셀 비율 (노출 과다/부족)
+을 구해 기준을 벗어나면 제외(reject)하고, 통과한 샷은 0.1~1 가중치로 병합 투표에 반영한다.
+- 기준: QUALITY_MIN_SHARPNESS (기본 40), QUALITY_MAX_GLARE (기본 0.15), QUALITY_MAX_CLIP (기본 0.4)
+- 전부 기준 미달이면 점수가 가장 높은 샷 1장은 남긴다 (분석할 샷이 없어지지 않도록)
+- 샷당 수 ms (JPEG 축소 디코딩 + OpenCV/NumPy 벡터 연산)
+"""
+import os
+import time
+import cv2
+import numpy as np
+
+QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "1") == "1"
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "40"))
+QUALITY_MAX_GLARE = float(os.getenv("QUALITY_MAX_GLARE", "0.15"))
+QUALITY_MAX_CLIP = float(os.getenv("QUALITY_MAX_CLIP", "0.4"))
+
+# 선명도 기준이 해상도에 따라 달라지지 않도록 모든 샷을 같은 크기(긴 변)로 맞춰 잰다
+_SIDE = 400
+# 선명도가 기준의 이 배수 이상이면 선명도 점수 만점
+_SHARP_FULL = 4.0
+_MIN_WEIGHT = 0.1
+
+
+def _small(img):
+    h, w = img.shape[:2]
+    if max(h, w) <= _SIDE:
+        return img
+    s = _SIDE / float(max(h, w))
+    return cv2.resize(img, (int(round(w * s)), int(round(h * s))), interpolation=cv2.INTER_AREA)
+
+
+def _decode(data):
+    """JPEG 바이트 → BGR. 긴 변이 _SIDE 이상으로 남는 가장 작은 축소 디코딩(1/4, 1/2, 원본)을 쓴다"""
+    if not data:
+        return None
+    buf = np.frombuffer(data, dtype=np.uint8)
+    img = None
+    for flag in (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_COLOR):
+        img = cv2.imdecode(buf, flag)
+        if img is None or max(img.shape[:2]) >= _SIDE:
+            break
+    return img
+
+
+def score_frame(img):
+    """
+    BGR 이미지(numpy) 1장의 품질.
+
+    Returns:
+        dict: {'sharpness', 'glare_ratio', 'clip_ratio', 'score': 0~1,
+               'keep': bool, 'reasons': [blur|glare|exposure]}
+    """
+    small = _small(img)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    sharp = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    n = float(gray.size)
+    glare = np.count_nonzero((hsv[..., 2] >= 250) & (hsv[..., 1] < 30)) / n
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    clip = float(hist[:6].sum() + hist[250:].sum()) / n
+
+    reasons = []
+    if sharp < QUALITY_MIN_SHARPNESS:
+        reasons.append("blur")
+    if glare > QUALITY_MAX_GLARE:
+        reasons.append("glare")
+    if clip > QUALITY_MAX_CLIP:
+        reasons.append("exposure")
+
+    score = (min(1.0, sharp / (QUALITY_MIN_SHARPNESS * _SHARP_FULL))
+             * max(0.0, 1.0 - glare / QUALITY_MAX_GLARE)
+             * max(0.0, 1.0 - clip / QUALITY_MAX_CLIP))
+    return {"sharpness": round(sharp, 1), "glare_ratio": round(float(glare), 4), "clip_ratio": round(clip, 4),
+            "score": round(float(score), 3), "keep": not reasons, "reasons": reasons}
+
+
+def assess_frames(frames):
+    """
+    샷 목록(JPEG 바이트 또는 BGR numpy) 품질 검사.
+
+    Returns:
+        (list, int): 샷별 score_frame 결과 + 'index'(1부터), 'weight'(병합 가중치, 제외된 샷은 0),
+                     그리고 걸린 시간(ms)
+        디코딩 실패 샷은 {'keep': False, 'reasons': ['decode_failed']}
+    """
+    t0 = time.monotonic()
+    out = []
+    for i, f in enumerate(frames):
+        img = _decode(f) if isinstance(f, (bytes, bytearray)) else f
+        if img is None:
+            q = {"sharpness": None, "glare_ratio": None, "clip_ratio": None, "score": 0.0,
+                 "keep": False, "reasons": ["decode_failed"]}
+        else:
+            q = score_frame(img)
+        q["index"] = i + 1
+        out.append(q)
+
+    if out and not any(q["keep"] for q in out):
+        # 전부 기준 미달: 가장 나은 샷 1장은 낮은 가중치로 분석
+        best = max((q for q in out if q["sharpness"] is not None), key=lambda q: q["score"], default=None)
+        if best is not None:
+            best["keep"] = True
+    for q in out:
+        q["weight"] = max(_MIN_WEIGHT, q["score"]) if q["keep"] else 0.0
+    return out, int((time.monotonic() - t0) * 1000)
@@ -0,0 +1,12 @@
+"""
+테스트용 설정: config.settings + medicines / ocr 앱 (URL은 medicine_project.urls)
+
+ocr 테스트는 medicines 모델(Medicine, UserMedication)을 쓰므로 두 앱을 함께 설치해야 돈다.
+    python manage.py test --settings=config.test_settings
+기본 설정(config.settings)으로 돌리면 ocr 테스트는 건너뛴다.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS
+
+INSTALLED_APPS = [*INSTALLED_APPS, "medicines", "ocr"]
+ROOT_URLCONF = "medicine_project.urls"
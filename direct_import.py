@@ -7,6 +7,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medicine_project.settings')
 django.setup()
 
 from medicines.models import Medicine, PillIdentification, AccessibilityInfo
+from medicines import fts
 
 def extract_column(df, pattern):
     """공백 무시하고 컬럼 찾기"""
@@ -221,6 +222,10 @@ for idx, row in df_access.iterrows():
 
 print(f"    ✓ {access_count}개 접근성 정보 임포트 완료\n")
 
+# 검색 색인 재생성 (트리거로 동기화되지만 대량 적재 후 한 번 정리)
+if fts.rebuild():
+    print("🔎 전문 검색 색인 재생성 완료\n")
+
 # ============================================
 # 최종 통계
 # ============================================
@@ -0,0 +1,76 @@
+# medicines/fts.py
+"""
+의약품 전문 검색 인덱스 (SQLite FTS5, trigram 토크나이저)
+
+search_medicine의 item_name/entp_name/main_ingredient icontains OR 검색은
+매 요청마다 medicines 테이블 전체(약 4.4만 행)를 훑는다.
+medicines_fts (external content: 본문은 medicines 테이블을 그대로 참조)에
+3글자 단위 trigram 색인을 두고 MATCH + bm25 필드 가중치로 순위를 매긴다.
+- trigram은 띄어쓰기 없는 한글 약품명에도 부분 문자열 검색이 된다 ('레놀정' → 타이레놀정)
+- 동기화: medicines INSERT/UPDATE/DELETE 트리거 (medicines/migrations/0003_medicines_fts.py)
+- 트리거를 거치지 않는 대량 적재 후에는 rebuild() (import_medicines, direct_import.py에서 호출)
+- SQLite가 아니거나 색인 테이블이 없으면 search()가 None → 호출 쪽에서 기존 icontains 검색
+"""
+import logging
+
+from django.db import connection, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'medicines_fts'
+# bm25 필드 가중치 (컬럼 순서: item_name, entp_name, main_ingredient) - 제품명 > 주성분 > 제조사
+FTS_WEIGHTS = (10.0, 1.0, 4.0)
+# trigram 색인은 3글자 미만 검색어를 찾지 못한다
+MIN_TERM_LEN = 3
+
+
+def available():
+    """FTS 색인 테이블이 있는 SQLite DB인지"""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def rebuild():
+    """medicines 테이블 기준으로 색인 전체 재생성. 색인이 없으면 False"""
+    if not available():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return True
+
+
+def _phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search(query, limit=20):
+    """
+    검색어(공백으로 나눈 단어 모두 포함)로 찾은 item_seq 목록 (bm25 순).
+    3글자 이상 단어는 MATCH, 짧은 단어는 MATCH 결과 안에서 LIKE로 거른다.
+
+    Returns:
+        list 또는 None: 색인을 쓸 수 없거나 3글자 이상 단어가 없으면 None
+    """
+    terms = query.split()
+    long_terms = [t for t in terms if len(t) >= MIN_TERM_LEN]
+    if not long_terms or not available():
+        return None
+    sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    params = [' '.join(_phrase(t) for t in long_terms)]
+    for t in terms:
+        if len(t) < MIN_TERM_LEN:
+            sql += " AND (item_name LIKE %s OR entp_name LIKE %s OR main_ingredient LIKE %s)"
+            params += [f'%{t}%'] * 3
+    sql += f" ORDER BY bm25({FTS_TABLE}, {', '.join(str(w) for w in FTS_WEIGHTS)}) LIMIT %s"
+    params.append(limit)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError as e:
+        logger.warning(f"FTS search failed, falling back to icontains: {e}")
+        return None
@@ -4,6 +4,7 @@ from django.core.management.base import BaseCommand
 import pandas as pd
 import re
 from medicines.models import Medicine, PillIdentification, AccessibilityInfo
+from medicines import fts
 
 class Command(BaseCommand):
     help = 'CSV 파일에서 의약품 데이터 임포트'
@@ -21,6 +22,12 @@ class Command(BaseCommand):
             # 3. 접근성 정보
             self.import_accessibility()
             
+            # 4. 검색 색인: 전문 검색(FTS) 재생성
+            #    (메모리 인덱스는 서버 프로세스가 알아서 반영: 약품명 인덱스는 CATALOG_INDEX_CHECK_S마다
+            #     카탈로그 버전 확인 후 재생성, 자동완성 인덱스는 AUTOCOMPLETE_SYNC_S마다 updated_at 변경분만)
+            if fts.rebuild():
+                self.stdout.write(self.style.SUCCESS('  ✓ 전문 검색 색인 재생성'))
+            
             self.stdout.write(self.style.SUCCESS('\n✅ 모든 임포트 완료!'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'\n❌ 에러 발생: {str(e)}'))
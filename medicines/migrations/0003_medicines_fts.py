@@ -0,0 +1,52 @@
+# medicines 전문 검색 색인 (SQLite FTS5 trigram + 동기화 트리거). SQLite가 아니면 아무것도 하지 않는다.
+
+from django.db import migrations
+
+FTS_COLUMNS = 'item_name, entp_name, main_ingredient'
+
+CREATE_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS medicines_fts USING fts5(
+        {FTS_COLUMNS}, content='medicines', content_rowid='item_seq', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS medicines_fts_ai AFTER INSERT ON medicines BEGIN
+        INSERT INTO medicines_fts(rowid, {FTS_COLUMNS})
+        VALUES (new.item_seq, new.item_name, new.entp_name, new.main_ingredient);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS medicines_fts_ad AFTER DELETE ON medicines BEGIN
+        INSERT INTO medicines_fts(medicines_fts, rowid, {FTS_COLUMNS})
+        VALUES ('delete', old.item_seq, old.item_name, old.entp_name, old.main_ingredient);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS medicines_fts_au AFTER UPDATE OF {FTS_COLUMNS} ON medicines BEGIN
+        INSERT INTO medicines_fts(medicines_fts, rowid, {FTS_COLUMNS})
+        VALUES ('delete', old.item_seq, old.item_name, old.entp_name, old.main_ingredient);
+        INSERT INTO medicines_fts(rowid, {FTS_COLUMNS})
+        VALUES (new.item_seq, new.item_name, new.entp_name, new.main_ingredient);
+    END""",
+    "INSERT INTO medicines_fts(medicines_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS medicines_fts_au",
+    "DROP TRIGGER IF EXISTS medicines_fts_ad",
+    "DROP TRIGGER IF EXISTS medicines_fts_ai",
+    "DROP TABLE IF EXISTS medicines_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicines', '0002_usermedication'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(CREATE_SQL), _run(DROP_SQL)),
+    ]
@@ -21,6 +21,7 @@ urlpatterns = [
     path('detail/<int:item_seq>/', views.medicine_detail_page, name='detail'),  # 상세 페이지 (HTML)
     path('stats/', views.get_stats, name='stats'),
     path('search/', views.search_medicine, name='search'),
+    path('autocomplete/', views.autocomplete_medicine, name='autocomplete'),  # 입력 중 제안 (메모리 인덱스)
     path('api-detail/<int:item_seq>/', views.medicine_detail, name='api_detail'),
     path('search/barcode/', views.search_by_barcode, name='search_barcode'),
     path('search/image/', views.search_by_image, name='search_image'),
@@ -7,6 +7,13 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.models import User
 from .models import Medicine, PillIdentification, AccessibilityInfo, UserMedication
+from . import fts
+from carepill.services.medicine_index import CATALOG_MATCH_MIN_SCORE, get_index as get_medicine_index
+from carepill.services.hangul import is_choseong
+from carepill.services.voice_query import normalize_query
+from carepill.services.autocomplete import AUTOCOMPLETE_MAX_LIMIT, get_index as get_autocomplete_index
+
+SEARCH_MODES = ('text', 'prefix', 'fuzzy')
 
 
 # ============================================
@@ -65,14 +72,51 @@ def delete_medication(request, medication_id):
 # 🔌 API 엔드포인트 (기존 코드 유지)
 # ============================================
 
+def _fetch_ranked(item_seqs):
+    """item_seq 순서 그대로 Medicine 목록 (쿼리 1번)"""
+    by_seq = Medicine.objects.select_related('pill_info', 'accessibility').in_bulk(item_seqs)
+    return [by_seq[item_seq] for item_seq in item_seqs if item_seq in by_seq]
+
+
+def _fuzzy_ranked(query, limit=20):
+    return [item_seq for item_seq, _ in get_medicine_index().match(query, limit, CATALOG_MATCH_MIN_SCORE)]
+
+
 @require_http_methods(["GET"])
 def search_medicine(request):
-    """의약품 검색 API (음성 검색 지원)"""
+    """의약품 검색 API (음성 검색 지원)
+    - mode=text (기본): 전문 검색 색인(medicines_fts)이 있으면 bm25 순위 검색, 없거나 3글자 미만 검색어면 icontains
+    - mode=prefix: 제품명 자모 앞부분 일치 ('타이렌' → 타이레놀), 초성만 넣으면 초성 일치 ('ㅌㅇㄹㄴ')
+      메모리 인덱스에서 찾으므로 DB는 결과 행 조회에만 사용. 초성만으로 된 검색어는 mode 없이도 prefix
+    - mode=fuzzy: 오탈자 허용 매칭 ('타이레눌' → 타이레놀, 자모 편집 거리 + 2-gram 유사도)
+      text 검색 결과가 없을 때도 fuzzy로 한 번 더 찾는다 (응답 mode가 fuzzy로 바뀜)
+    - text/fuzzy 검색어는 음성 질의 정규화를 거친다 ("타이레놀 효능 알려줘" → '타이레놀', intent=effect).
+      용량까지 넣어 못 찾으면 용량을 빼고 한 번 더. 응답의 normalized/intent로 확인
+    """
     query = request.GET.get('q', '').strip()
+    mode = request.GET.get('mode') or ('prefix' if is_choseong(query.replace(' ', '')) else 'text')
+    if mode not in SEARCH_MODES:
+        return JsonResponse({'error': f"mode는 {', '.join(SEARCH_MODES)} 중 하나"}, status=400)
+    voice = normalize_query(query) if query and mode != 'prefix' else None
+    if voice and voice.search:
+        query = voice.search
+    if not query:
+        ranked = None
+    elif mode == 'prefix':
+        ranked = get_medicine_index().prefix(query, 20)
+    elif mode == 'fuzzy':
+        ranked = _fuzzy_ranked(query)
+    else:
+        ranked = fts.search(query, 20)
+        if ranked == [] and voice and voice.strengths and voice.terms:
+            # 카탈로그에 없는 용량이면 이름만으로
+            ranked = fts.search(' '.join(voice.terms), 20)
     
     # 빈 검색어면 전체 목록 반환 (50개 제한)
     if not query:
         medicines = Medicine.objects.select_related('pill_info', 'accessibility')[:50]
+    elif ranked is not None:
+        medicines = _fetch_ranked(ranked)
     else:
         # 제품명, 제조사, 주성분으로 검색
         medicines = Medicine.objects.filter(
@@ -81,6 +125,11 @@ def search_medicine(request):
             Q(main_ingredient__icontains=query)
         ).select_related('pill_info', 'accessibility')[:20]
     
+    if query and mode == 'text' and not medicines:
+        # 못 찾았으면 음성 인식/오탈자로 보고 퍼지 매칭
+        mode = 'fuzzy'
+        medicines = _fetch_ranked(_fuzzy_ranked(query))
+    
     results = []
     for med in medicines:
         # TTS 우선, 없으면 일반 텍스트
@@ -102,6 +151,31 @@ def search_medicine(request):
         })
     
     return JsonResponse({
+        'count': len(results),
+        'mode': mode,
+        'normalized': query,
+        'intent': voice.intent if voice else None,
+        'results': results
+    })
+
+
+@require_http_methods(["GET"])
+def autocomplete_medicine(request):
+    """약품명 자동완성 API (입력이 바뀔 때마다 호출, DB 조회 없음)
+    - q: 입력 중인 검색어. 제품명/영문명 자모 앞부분 일치 ('타이렌' → 타이레놀), 초성만이면 초성 일치 ('ㅌㅇㄹ')
+    - limit: 제안 수 (기본 10, 최대 AUTOCOMPLETE_MAX_LIMIT)
+    복용약 등록이 많은 약부터, 같으면 짧은 이름부터
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return JsonResponse({'error': 'limit은 숫자여야 합니다'}, status=400)
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+    
+    results = get_autocomplete_index().complete(query, limit) if query else []
+    return JsonResponse({
+        'query': query,
         'count': len(results),
         'results': results
     })
@@ -1,3 +1,57 @@
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 
-# Create your tests here.
+from carepill.services import medicine_index
+
+# medicines / ocr 앱은 config.test_settings에서만 설치된다 (python manage.py test --settings=config.test_settings)
+APPS_INSTALLED = apps.is_installed('medicines') and apps.is_installed('ocr')
+if APPS_INSTALLED:
+    from medicines.models import Medicine, UserMedication
+
+
+def _vision_result(*names):
+    return {
+        'success': True,
+        'data': {'medicines': [{'name': n, 'dosage': '1정', 'frequency': '1일 3회', 'days': '3일'} for n in names]},
+        'raw_text': '',
+    }
+
+
+@skipUnless(APPS_INSTALLED, 'medicines / ocr 앱 필요: --settings=config.test_settings')
+class ProcessOcrSaveTests(TestCase):
+    """POST /ocr/process/ : 읽은 약 이름 → 사용자 복용약 저장"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Medicine.objects.create(item_seq=1, item_name='타이레놀정500밀리그램', entp_name='한국얀센(주)')
+        Medicine.objects.create(item_seq=2, item_name='게보린정', entp_name='삼진제약(주)')
+
+    def setUp(self):
+        # 테스트 데이터로 만든 인덱스는 이 테스트 안에서만 쓴다
+        patcher = mock.patch.object(medicine_index, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        medicine_index.rebuild()
+
+    def _post(self, *names):
+        image = SimpleUploadedFile('rx.jpg', b'\xff\xd8\xff', content_type='image/jpeg')
+        with mock.patch('ocr.views.call_openai_vision', return_value=_vision_result(*names)):
+            return self.client.post('/ocr/process/', {'image': image}).json()
+
+    def test_exact_name_is_saved(self):
+        data = self._post('타이레놀정')
+        self.assertEqual(data['saved_count'], 1)
+        self.assertEqual(UserMedication.objects.get().medicine_id, 1)
+        self.assertEqual(data['suggestions'], [])
+
+    def test_near_miss_name_is_only_suggested(self):
+        data = self._post('타이레눌정', '게보린정')
+        # 오탈자 이름은 퍼지 매칭 후보로만 돌려주고 저장하지 않는다
+        self.assertEqual(data['saved_count'], 1)
+        self.assertEqual(list(UserMedication.objects.values_list('medicine_id', flat=True)), [2])
+        self.assertEqual([s['name'] for s in data['suggestions']], ['타이레눌정'])
+        self.assertEqual(data['suggestions'][0]['candidates'][0]['item_seq'], 1)
+        self.assertNotIn('db_info', data['prescription']['medicines'][0])
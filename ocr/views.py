@@ -1,25 +1,56 @@
 # ocr/views.py
 
+import os
 import base64
 import json
-from openai import OpenAI
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-from django.core.files.storage import default_storage
+from django.core.files.base import ContentFile
 from medicines.models import Medicine
-from django.db.models import Q
+from django.db import transaction
 from django.contrib.auth.models import User
 from medicines.models import Medicine, UserMedication
 from datetime import datetime
+from carepill.services.vision_cache import get_cache, make_key
+from carepill.services import http_client
+from carepill.services.upstream_guard import UpstreamUnavailable
+from carepill.services.json_repair import VISION_STRUCTURED_OUTPUT, parse_model_json
+from carepill.services.medicine_index import get_index as get_medicine_index, normalize as normalize_name
+from carepill.services import write_behind
+from .models import OCRImage
+
+OCR_MODEL = "gpt-4o"
+# 프롬프트를 바꾸면 버전을 올릴 것 (Vision 캐시 키에 포함됨)
+OCR_PROMPT_VERSION = "ocr-v2"
+
+# 스키마 고정 출력 (strict 모드는 모든 필드 required, 없는 값은 null)
+_NULLABLE_STR = {"type": ["string", "null"]}
+OCR_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "medicines": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {k: _NULLABLE_STR for k in ("name", "dosage", "frequency", "days")},
+                "required": ["name", "dosage", "frequency", "days"],
+                "additionalProperties": False,
+            },
+        },
+        **{k: _NULLABLE_STR for k in ("dispensing_date", "patient_name", "pharmacy_name", "hospital_name")},
+    },
+    "required": ["medicines", "dispensing_date", "patient_name", "pharmacy_name", "hospital_name"],
+    "additionalProperties": False,
+}
 
 def ocr_page(request):
     """OCR 메인 페이지"""
     return render(request, 'ocr/index.html')
 
 def call_openai_vision(image_file):
-    """OpenAI Vision API로 처방전 정보 추출"""
+    """OpenAI Vision API로 처방전 정보 추출 (image_file: 파일 객체 또는 이미지 바이트)"""
     try:
         # API 키 확인
         api_key = settings.OPENAI_API_KEY
@@ -29,15 +60,32 @@ def call_openai_vision(image_file):
                 'error': 'OpenAI API 키가 설정되지 않았습니다. settings.py에서 OPENAI_API_KEY를 설정하세요.'
             }
         
-        client = OpenAI(api_key=api_key)
-        
+        if isinstance(image_file, (bytes, bytearray)):
+            image_bytes = bytes(image_file)
+        else:
+            image_file.seek(0)
+            image_bytes = image_file.read()
+
+        # 같은 이미지를 다시 올리면 캐시에서 바로 반환
+        cache = get_cache()
+        cache_key = make_key(image_bytes, OCR_MODEL, OCR_PROMPT_VERSION) if cache else None
+        cached_text = cache.get(cache_key) if cache else None
+        if cached_text is not None:
+            result_text = cached_text
+            result_json, _ = parse_model_json(result_text, "ocr")
+            return {
+                'success': True,
+                'data': result_json,
+                'raw_text': result_text,
+                'cached': True
+            }
+
         # 이미지를 base64로 인코딩
-        image_file.seek(0)
-        image_data = base64.b64encode(image_file.read()).decode('utf-8')
+        image_data = base64.b64encode(image_bytes).decode('utf-8')
         
-        # OpenAI API 호출
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        # OpenAI API 호출 (공용 커넥션 풀 클라이언트)
+        payload = dict(
+            model=OCR_MODEL,
             messages=[
                 {
                     "role": "user",
@@ -82,27 +130,47 @@ JSON만 출력하고 다른 설명은 붙이지 마세요."""
                 }
             ],
             max_tokens=1000,
-            timeout=30  # 30초 타임아웃 추가
         )
+        if VISION_STRUCTURED_OUTPUT:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "prescription", "strict": True, "schema": OCR_JSON_SCHEMA},
+            }
+        response = http_client.post(
+            "https://api.openai.com/v1/chat/completions",
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            json=payload,
+            timeout=30  # 30초 타임아웃
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.status_code} {response.text[:200]}")
         
         # 결과 추출
-        result_text = response.choices[0].message.content.strip()
+        result_text = response.json()["choices"][0]["message"]["content"].strip()
         
-        # JSON 파싱
-        # ```json 같은 마크다운 제거
-        if result_text.startswith('```'):
-            result_text = result_text.split('```')[1]
-            if result_text.startswith('json'):
-                result_text = result_text[4:]
-        
-        result_json = json.loads(result_text.strip())
+        # JSON 파싱 (코드펜스/깨진 JSON은 복구 시도)
+        result_json, parse_status = parse_model_json(result_text, "ocr")
+        if not isinstance(result_json, dict):
+            raise json.JSONDecodeError('JSON 파싱 실패', result_text, 0)
+
+        # 파싱에 성공한 결과만 캐시
+        if cache_key:
+            cache.put(cache_key, result_text, kind="ocr", model=OCR_MODEL)
         
         return {
             'success': True,
             'data': result_json,
-            'raw_text': result_text
+            'raw_text': result_text,
+            'parse': parse_status
         }
     
+    except UpstreamUnavailable as e:
+        # OpenAI 과부하(속도 제한/서킷 차단): 기다리지 않고 바로 실패
+        return {
+            'success': False,
+            'error': f'OpenAI 요청이 많아 잠시 후 다시 시도해주세요. ({e.retry_after}초 후)',
+            'retry_after': e.retry_after
+        }
     except json.JSONDecodeError as e:
         # JSON 파싱 실패 시 텍스트 그대로 반환
         return {
@@ -122,36 +190,74 @@ JSON만 출력하고 다른 설명은 붙이지 마세요."""
             'detail': traceback.format_exc()
         }
 
-def search_medicines_by_names(medicine_names):
-    """추출된 약 이름으로 DB 검색"""
+def resolve_medicine_names(medicine_names):
+    """
+    추출된 약 이름 전부를 약품명 인덱스에서 한 번에 찾고, 찾은 약은 쿼리 1번으로 가져온다.
+
+    Returns:
+        (dict, dict): {이름: [Medicine, ...] (유사도 순, 최대 3개)}, {item_seq: Medicine}
+    """
+    hits = get_medicine_index().match_many(medicine_names)
+    ids = {item_seq for found in hits.values() for item_seq, _ in found}
+    by_seq = Medicine.objects.select_related('pill_info', 'accessibility').in_bulk(ids) if ids else {}
+    by_name = {name: [by_seq[item_seq] for item_seq, _ in found if item_seq in by_seq]
+               for name, found in hits.items()}
+    return by_name, by_seq
+
+
+def auto_save_match(name, candidates):
+    """
+    사용자 복용약에 바로 저장해도 되는 약: 읽은 이름이 제품명에 그대로 들어 있는 후보 (정규화 후 비교).
+    퍼지 매칭으로만 비슷한 후보(오탈자/함량 차이)는 다른 약일 수 있으므로 None → suggestions로만 돌려준다.
+    """
+    key = normalize_name(name)
+    if not key:
+        return None
+    for med in candidates:
+        if key in normalize_name(med.item_name):
+            return med
+    return None
+
+
+def _medicine_summary(med):
+    return {
+        'item_seq': med.item_seq,
+        'item_name': med.item_name,
+        'entp_name': med.entp_name,
+        'effect': med.effect[:100] + '...' if med.effect and len(med.effect) > 100 else med.effect,
+        'image_url': med.pill_info.image_url if hasattr(med, 'pill_info') else None,
+        'has_video': hasattr(med, 'accessibility') and med.accessibility.video_url,
+    }
+
+
+def search_medicines_by_names(medicine_names, resolved=None):
+    """추출된 약 이름으로 DB 검색 (resolved: 이미 resolve_medicine_names로 찾은 {이름: [Medicine]})"""
+    if resolved is None:
+        resolved, _ = resolve_medicine_names(medicine_names)
     found_medicines = []
-    
+    seen = set()
     for name in medicine_names:
-        if not name:
-            continue
-            
-        # 정확히 일치하는 약 찾기
-        medicines = Medicine.objects.filter(
-            Q(item_name__icontains=name) |
-            Q(item_name__contains=name)
-        ).select_related('pill_info', 'accessibility')[:3]
-        
-        for med in medicines:
-            if med.item_seq not in [m['item_seq'] for m in found_medicines]:
-                found_medicines.append({
-                    'item_seq': med.item_seq,
-                    'item_name': med.item_name,
-                    'entp_name': med.entp_name,
-                    'effect': med.effect[:100] + '...' if med.effect and len(med.effect) > 100 else med.effect,
-                    'image_url': med.pill_info.image_url if hasattr(med, 'pill_info') else None,
-                    'has_video': hasattr(med, 'accessibility') and med.accessibility.video_url,
-                })
-    
+        for med in resolved.get(name, []):
+            if med.item_seq not in seen:
+                seen.add(med.item_seq)
+                found_medicines.append(_medicine_summary(med))
     return found_medicines
 
+def _persist_ocr_image(name, image_bytes, raw_text, medicine_names):
+    """업로드 원본 + OCR 결과 보관 (write-behind 워커에서 실행)"""
+    OCRImage.objects.create(
+        image=ContentFile(image_bytes, name=os.path.basename(name or 'upload.jpg')),
+        ocr_result=raw_text,
+        extracted_medicine_names=json.dumps(medicine_names, ensure_ascii=False),
+    )
+
+
 @csrf_exempt
 def process_ocr(request):
-    """이미지 업로드 및 OpenAI Vision 처리"""
+    """이미지 업로드 및 OpenAI Vision 처리
+    - 업로드는 임시 파일로 저장하지 않고 메모리에서 바로 분석
+    - save_image=1 (폼 필드 또는 쿼리)일 때만 원본과 결과를 OCRImage로 보관 (응답 후 백그라운드 저장)
+    """
     if request.method != 'POST':
         return JsonResponse({'error': 'POST 요청만 가능합니다'}, status=400)
     
@@ -159,6 +265,8 @@ def process_ocr(request):
         return JsonResponse({'error': '이미지 파일을 업로드하세요'}, status=400)
     
     image_file = request.FILES['image']
+    image_bytes = image_file.read()
+    save_image = (request.POST.get('save_image') or request.GET.get('save_image')) == '1'
     
     # 사용자 정보 (일단 임시로 첫 번째 사용자 사용)
     # TODO: 실제로는 로그인된 사용자를 사용해야 함
@@ -170,14 +278,15 @@ def process_ocr(request):
     except:
         user = None
     
-    file_path = default_storage.save(f'ocr_temp/{image_file.name}', image_file)
-    
     try:
         # OpenAI Vision으로 처방전 정보 추출
-        with default_storage.open(file_path, 'rb') as f:
-            result = call_openai_vision(f)
+        result = call_openai_vision(image_bytes)
         
         if not result['success']:
+            if result.get('retry_after'):
+                resp = JsonResponse({'success': False, 'error': result['error']}, status=503)
+                resp['Retry-After'] = str(result['retry_after'])
+                return resp
             return JsonResponse({
                 'success': False,
                 'error': result['error']
@@ -188,8 +297,16 @@ def process_ocr(request):
         # 약품명 리스트 추출
         medicine_names = [med.get('name') for med in prescription_data.get('medicines', []) if med.get('name')]
         
-        # DB에서 의약품 검색
-        medicines = search_medicines_by_names(medicine_names)
+        # 요청한 경우에만 원본 보관 (응답을 기다리게 하지 않음)
+        image_persist = None
+        if save_image:
+            queued = write_behind.submit(_persist_ocr_image, image_file.name, image_bytes,
+                                         result.get('raw_text', ''), medicine_names)
+            image_persist = 'queued' if queued else 'dropped'
+        
+        # DB에서 의약품 검색 (이름 전부 한 번에)
+        resolved, _ = resolve_medicine_names(medicine_names)
+        medicines = search_medicines_by_names(medicine_names, resolved)
         
         # 🎯 여기서 사용자 DB에 저장!
         saved_count = 0
@@ -206,44 +323,39 @@ def process_ocr(request):
             pharmacy_name = prescription_data.get('pharmacy_name')
             hospital_name = prescription_data.get('hospital_name')
             
-            # 각 약품 저장
+            # 각 약품: 이름이 그대로 맞는 약만 사용자 복용약 행으로 만들어 한 번에 저장
+            rows = []
             for med_info in prescription_data.get('medicines', []):
-                med_name = med_info.get('name')
-                if not med_name:
-                    continue
-                
-                # DB에서 약품 찾기
+                medicine = auto_save_match(med_info.get('name'), resolved.get(med_info.get('name'), []))
+                if medicine:
+                    rows.append(UserMedication(
+                        user=user,
+                        medicine=medicine,
+                        dosage=med_info.get('dosage'),
+                        frequency=med_info.get('frequency'),
+                        days=med_info.get('days'),
+                        prescription_date=prescription_date,
+                        pharmacy_name=pharmacy_name,
+                        hospital_name=hospital_name,
+                    ))
+            if rows:
                 try:
-                    medicine = Medicine.objects.filter(
-                        Q(item_name__icontains=med_name) |
-                        Q(item_name__contains=med_name)
-                    ).first()
-                    
-                    if medicine:
-                        # 사용자 복용약에 저장
-                        UserMedication.objects.create(
-                            user=user,
-                            medicine=medicine,
-                            dosage=med_info.get('dosage'),
-                            frequency=med_info.get('frequency'),
-                            days=med_info.get('days'),
-                            prescription_date=prescription_date,
-                            pharmacy_name=pharmacy_name,
-                            hospital_name=hospital_name,
-                        )
-                        saved_count += 1
+                    with transaction.atomic():
+                        UserMedication.objects.bulk_create(rows)
+                    saved_count = len(rows)
                 except Exception as e:
-                    print(f"약품 저장 실패: {med_name} - {str(e)}")
-                    continue
+                    print(f"약품 저장 실패: {len(rows)}개 - {str(e)}")
         
-        # 처방전 정보와 DB 정보 매칭
+        # 처방전 정보와 DB 정보 매칭 (확정 못 한 약은 비슷한 후보만 제안, 저장 안 함)
+        suggestions = []
         for med_info in prescription_data.get('medicines', []):
-            med_name = med_info.get('name')
-            if med_name:
-                for db_med in medicines:
-                    if med_name in db_med['item_name'] or db_med['item_name'] in med_name:
-                        med_info['db_info'] = db_med
-                        break
+            found = resolved.get(med_info.get('name'), [])
+            medicine = auto_save_match(med_info.get('name'), found)
+            if medicine:
+                med_info['db_info'] = _medicine_summary(medicine)
+            elif found:
+                med_info['suggestions'] = [_medicine_summary(med) for med in found]
+                suggestions.append({'name': med_info.get('name'), 'candidates': med_info['suggestions']})
         
         return JsonResponse({
             'success': True,
@@ -251,6 +363,8 @@ def process_ocr(request):
             'medicines': medicines,
             'count': len(medicines),
             'saved_count': saved_count,  # 저장된 약품 수
+            'suggestions': suggestions,  # 이름이 정확히 맞지 않아 저장하지 않은 약의 후보 (사용자 확인용)
+            'image_persist': image_persist,  # 원본 보관: queued | dropped | None(요청 안 함)
             'message': f'✅ {saved_count}개 약품이 내 복용약에 저장되었습니다!'
         })
     
@@ -262,8 +376,4 @@ def process_ocr(request):
         return JsonResponse({
             'success': False,
             'error': f'처리 중 오류: {str(e)}'
-        }, status=500)
-    
-    finally:
-        if default_storage.exists(file_path):
-            default_storage.delete(file_path)
\ No newline at end of file
+        }, status=500)
\ No newline at end of file
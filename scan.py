@@ -1,5 +1,6 @@
 import os
 import cv2
+import numpy as np
 import time
 import base64
 import json
@@ -9,6 +10,8 @@ import openai
 from collections import Counter
 from typing import List, Dict, Tuple
 import local_settings
+from carepill.vision.quality import assess_frames
+from carepill.vision.preprocess import find_envelope, rectify_envelope
 
 # =========================
 # 1) OpenAI 클라이언트
@@ -101,6 +104,8 @@ def call_openai_envelope(image_b64: str, model: str = "gpt-4o-mini") -> str:
 def draw_overlay(frame, roi_rect: Tuple[int, int, int, int]):
     """ROI 박스와 안내 텍스트 오버레이."""
     x, y, w, h = roi_rect
+    # 약봉투 검출은 오버레이를 그리기 전 원본 프레임에서
+    found = find_envelope(frame)
     # 반투명 마스크
     overlay = frame.copy()
     cv2.rectangle(overlay, (0, 0), (frame.shape[1], frame.shape[0]), (0, 0, 0), -1)
@@ -111,6 +116,12 @@ def draw_overlay(frame, roi_rect: Tuple[int, int, int, int]):
     # ROI 테두리
     cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
 
+    # 검출된 약봉투 윤곽 (촬영 시 이 영역을 펴서 사용)
+    if found is not None:
+        kind, shape = found
+        pts = shape if kind == "quad" else cv2.boxPoints(shape)
+        cv2.polylines(frame, [pts.astype(np.int32)], True, (255, 200, 0), 2)
+
     # 안내 문구
     cv2.putText(frame, "ROI inside the green box.", (20, 40),
                 cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 255, 255), 2, cv2.LINE_AA)
@@ -119,12 +130,14 @@ def draw_overlay(frame, roi_rect: Tuple[int, int, int, int]):
 
 def capture_burst_with_roi(camera_index=2, width=1920, height=1080,
                            warmup_frames=6, burst_count=3, interval_s=0.5,
-                           roi_rel=(0.15, 0.2, 0.70, 0.55),
+                           roi_rel=(0.15, 0.2, 0.70, 0.55), rectify=True,
                            window_name="Medicine Envelope Scanner") -> List:
     """
     실행 즉시 미리보기 + ROI 안내 표시.
     SPACE/C/Q -> 3연사 촬영 시작, ESC/Q -> 취소.
-    ROI는 화면 중앙 상대비율(roi_rel)로 그려지고, 촬영 이미지는 ROI로 크롭해서 반환.
+    ROI는 화면 중앙 상대비율(roi_rel)로 그려진다.
+    rectify=True면 촬영 프레임 전체에서 약봉투를 찾아 원근 보정한 이미지를 쓰고
+    (웹 스캔과 같은 carepill.vision.preprocess.rectify_envelope), 못 찾으면 ROI로 크롭.
     반환: [cropped_frame1, cropped_frame2, cropped_frame3]
     """
     cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
@@ -174,7 +187,7 @@ def capture_burst_with_roi(camera_index=2, width=1920, height=1080,
         cv2.destroyAllWindows()
         raise
 
-    # 3연사 촬영 (ROI 크롭)
+    # 3연사 촬영 (약봉투 원근 보정, 실패 시 ROI 크롭)
     cropped_frames = []
     x, y, w, h = roi_rect
     for i in range(burst_count):
@@ -183,6 +196,11 @@ def capture_burst_with_roi(camera_index=2, width=1920, height=1080,
         ok, fr = cap.read()
         if not ok or fr is None:
             continue
+        if rectify:
+            flat, info = rectify_envelope(fr)
+            if info["detect"] is not None:
+                cropped_frames.append(flat)
+                continue
         crop = fr[y:y+h, x:x+w].copy()
         cropped_frames.append(crop)
 
@@ -204,26 +222,30 @@ def encode_frame_to_b64_jpeg(frame, jpeg_quality=95) -> str:
 # =========================
 # 5) 병합 로직(필드별 휴리스틱)
 # =========================
-def _majority_merge(values: List[str]) -> Tuple[str, float]:
-    """가장 많이 나온 값을 선택, 동률이면 가장 긴 문자열."""
-    cleaned = [v.strip() for v in values if isinstance(v, str)]
-    non_empty = [v for v in cleaned if v]
-    if not non_empty:
+def _majority_merge(values: List[str], weights: List[float] = None) -> Tuple[str, float]:
+    """가장 많이 나온 값을 선택(weights가 있으면 샷별 가중치 합), 동률이면 가장 긴 문자열."""
+    if weights is None:
+        weights = [1] * len(values)
+    cnt = Counter()
+    for v, w in zip(values, weights):
+        v = v.strip() if isinstance(v, str) else ""
+        if v:
+            cnt[v] += w
+    if not cnt:
         return "", 0.0
-    cnt = Counter(non_empty)
     top = cnt.most_common()
     top_freq = top[0][1]
     candidates = [v for v, c in top if c == top_freq]
     winner = max(candidates, key=lambda s: len(s))
-    conf = cnt[winner] / max(1, len(values))
+    conf = cnt[winner] / max(1, sum(weights))
     return winner, round(conf, 3)
 
 def _digits_only(s: str) -> str:
     return "".join(ch for ch in s if ch.isdigit())
 
-def merge_envelope_json(json_list: List[Dict]) -> Tuple[Dict, Dict]:
+def merge_envelope_json(json_list: List[Dict], weights: List[float] = None) -> Tuple[Dict, Dict]:
     """
-    약봉투 결과 병합:
+    약봉투 결과 병합 (weights: 샷별 투표 가중치, 품질 점수):
       - patient_name, pharmacy_name, medicine_name, dosage_instructions, frequency: 다수결
       - prescription_number: 숫자만 비교 우선(다수결), 그 다음 일반 다수결
       - age: 숫자만 추출해 다수결
@@ -257,21 +279,21 @@ def merge_envelope_json(json_list: List[Dict]) -> Tuple[Dict, Dict]:
         vals = [str(r.get(k, "") or "").strip() for r in results]
         if k == "age":
             norm = [_digits_only(v) for v in vals]
-            best, conf = _majority_merge(norm)
+            best, conf = _majority_merge(norm, weights)
             merged[k] = best
             diag[k] = {"per_shot": vals, "normalized": norm, "selected": best, "confidence": conf}
         elif k == "prescription_number":
             only_digits = [_digits_only(v) for v in vals]
-            best_d, conf_d = _majority_merge(only_digits)
+            best_d, conf_d = _majority_merge(only_digits, weights)
             if best_d:
                 merged[k] = best_d
                 diag[k] = {"per_shot": vals, "digits_only": only_digits, "selected": best_d, "confidence": conf_d}
             else:
-                best, conf = _majority_merge(vals)
+                best, conf = _majority_merge(vals, weights)
                 merged[k] = best
                 diag[k] = {"per_shot": vals, "selected": best, "confidence": conf}
         else:
-            best, conf = _majority_merge(vals)
+            best, conf = _majority_merge(vals, weights)
             merged[k] = best
             diag[k] = {"per_shot": vals, "selected": best, "confidence": conf}
 
@@ -279,7 +301,7 @@ def merge_envelope_json(json_list: List[Dict]) -> Tuple[Dict, Dict]:
     for subk in ["description", "indications", "cautions"]:
         key = f"_mf_{subk}"
         vals = [r.get(key, "") for r in results]
-        best, conf = _majority_merge(vals)
+        best, conf = _majority_merge(vals, weights)
         diag[key] = {"per_shot": vals, "selected": best, "confidence": conf}
 
     merged["med_features"] = {
@@ -316,6 +338,18 @@ def main():
         print(f"오류: {e}")
         return
 
+    # 품질 검사: 흔들림/반사광/노출 불량 샷은 분석하지 않고, 나머지는 점수를 병합 가중치로
+    scores, q_ms = assess_frames(frames)
+    for q in scores:
+        state = "통과" if q["keep"] else f"제외({', '.join(q['reasons'])})"
+        print(f"[샷 {q['index']}] 선명도 {q['sharpness']}, 반사광 {q['glare_ratio']}, 클리핑 {q['clip_ratio']} → {state}")
+    print(f"품질 검사 {q_ms}ms")
+    frames = [fr for fr, q in zip(frames, scores) if q["keep"]]
+    weights = [q["weight"] for q in scores if q["keep"]]
+    if not frames:
+        print("분석할 수 있는 샷이 없습니다. 다시 촬영해 주세요.")
+        return
+
     # 저장·인코딩
     ts = time.strftime("%Y%m%d_%H%M%S")
     cap_dir = Path("captures")
@@ -330,7 +364,7 @@ def main():
         shot_paths.append(str(p))
         b64_list.append(encode_frame_to_b64_jpeg(fr))
 
-    print("\n이미지 3장을 촬영했습니다. 분석을 시작합니다...")
+    print(f"\n이미지 {len(frames)}장을 분석합니다...")
 
     # 각 샷 분석
     raw_list, json_list = [], []
@@ -352,7 +386,7 @@ def main():
             print(f"\n[샷 {idx}] 분석 실패: {e}")
 
     # 병합
-    merged, diag = merge_envelope_json(json_list)
+    merged, diag = merge_envelope_json(json_list, weights)
 
     # 최종 결과 출력
     print("\n=== 최종 병합 결과(JSON) ===")
@@ -380,9 +414,10 @@ def main():
             {
                 "analysis_type": "envelope",
                 "shots": [
-                    {"image_path": p, "raw": r, "json": j}
-                    for p, r, j in zip(shot_paths, raw_list, json_list)
+                    {"image_path": p, "raw": r, "json": j, "weight": w}
+                    for p, r, j, w in zip(shot_paths, raw_list, json_list, weights)
                 ],
+                "quality": scores,
                 "merged": merged,
                 "diagnostics": diag,
             },